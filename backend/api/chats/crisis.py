@@ -0,0 +1,128 @@
+"""
+Local crisis-language prefilter.
+
+Every patient message is scanned against a curated lexicon before it is sent
+upstream, so an alert can be raised immediately instead of waiting for the
+model to call guardian_check. The lexicon is compiled once into an
+Aho-Corasick automaton: a scan is a single pass over the message, whatever
+the number of phrases.
+"""
+
+import re
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+LEXICON_FILE = Path("prompts/crisis_lexicon.txt")
+
+RISK_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+_APOSTROPHES = re.compile(r"['’]")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase, drop apostrophes and collapse everything else that is not a
+    letter or digit into single spaces. The result is padded with spaces so
+    that matching " phrase " only hits whole words.
+    """
+    text = _APOSTROPHES.sub("", text.lower())
+    return f" {_NON_WORD.sub(' ', text).strip()} "
+
+
+@dataclass(frozen=True)
+class CrisisMatch:
+    risk_level: str
+    phrases: tuple[str, ...]
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over normalized phrases
+    """
+
+    def __init__(self, phrases: dict[str, str]):
+        """
+        phrases maps a phrase to its risk level
+        """
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[str]] = [[]]
+        self._levels: dict[str, str] = {}
+
+        for phrase, risk_level in phrases.items():
+            key = normalize(phrase)
+            if key.strip():
+                self._levels[key] = risk_level
+                self._add(key)
+
+        self._build_failure_links()
+
+    def _add(self, key: str) -> None:
+        state = 0
+        for char in key:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(key)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def scan(self, text: str) -> CrisisMatch | None:
+        """
+        Return the highest risk level found in the text with the matched
+        phrases, None if nothing matched
+        """
+        found: set[str] = set()
+        state = 0
+        for char in normalize(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found.update(self._output[state])
+
+        if not found:
+            return None
+
+        risk_level = max((self._levels[k] for k in found), key=RISK_ORDER.__getitem__)
+        return CrisisMatch(
+            risk_level=risk_level,
+            phrases=tuple(sorted(k.strip() for k in found)),
+        )
+
+
+def load_lexicon(path: Path = LEXICON_FILE) -> dict[str, str]:
+    """
+    Read "<risk_level> | <phrase>" lines, ignoring blanks and # comments
+    """
+    phrases: dict[str, str] = {}
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        risk_level, phrase = (part.strip() for part in line.split("|", 1))
+        if risk_level not in RISK_ORDER:
+            raise ValueError(f"Unknown risk level in crisis lexicon: {risk_level}")
+        phrases[phrase] = risk_level
+    return phrases
+
+
+crisis_matcher = PhraseMatcher(load_lexicon())
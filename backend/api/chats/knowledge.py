@@ -0,0 +1,95 @@
+"""
+Knowledge base documents of the patients' assistants.
+
+Every assistant gets the files of knowledge_docs/. Uploading them kept the
+signup request waiting: create_patient now queues a chats.sync_knowledge job
+(api.core.jobs) instead. The job uploads the files the assistant doesn't
+have yet (by file name, failed documents are replaced), so it is also how
+existing assistants catch up after knowledge_docs/ changed:
+
+    python -m api.chats.knowledge resync
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+
+from backboard import BackboardClient
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.config import BACKBOARD_API_KEY
+from api.core.jobs import PRIORITY_NORMAL, JobContext, jobs
+from api.core.metrics import metrics
+from api.users.models import Patient
+
+KB_FILES_DIR = Path("knowledge_docs")
+KNOWLEDGE_JOB = "chats.sync_knowledge"
+
+
+async def enqueue_knowledge_sync(
+    session: AsyncSession, assistant_id: str, priority: int = PRIORITY_NORMAL
+) -> None:
+    """
+    Queue a sync of the assistant's knowledge base. Does not commit
+    """
+    await jobs.enqueue(
+        session,
+        KNOWLEDGE_JOB,
+        {"assistant_id": assistant_id},
+        priority=priority,
+        key=f"{KNOWLEDGE_JOB}:{assistant_id}",
+    )
+
+
+@jobs.task(KNOWLEDGE_JOB, max_attempts=5, retry_seconds=30)
+async def sync_knowledge(job: JobContext) -> None:
+    """
+    Upload the knowledge base files the assistant doesn't have
+    """
+    assistant_id = job.payload["assistant_id"]
+    paths = sorted(path for path in KB_FILES_DIR.iterdir() if path.is_file())
+
+    async with BackboardClient(api_key=BACKBOARD_API_KEY) as client:  # type: ignore
+        present = set()
+        for document in await client.list_assistant_documents(assistant_id):
+            if document.status in ("error", "failed"):
+                await client.delete_document(document.document_id)
+            else:
+                present.add(document.filename)
+
+        for path in paths:
+            if path.name in present:
+                continue
+            with metrics.timer("chats.knowledge.upload").time():
+                await client.upload_document_to_assistant(
+                    assistant_id=assistant_id,
+                    file_path=path,
+                )
+            metrics.counter("chats.knowledge.uploaded").inc()
+
+
+async def _main() -> None:
+    from api.core.db import sessionmanager
+
+    try:
+        async with sessionmanager.session() as session:
+            result = await session.execute(select(Patient.assistant_id))
+            assistant_ids = result.scalars().all()
+            for assistant_id in assistant_ids:
+                await enqueue_knowledge_sync(session, assistant_id)
+            await session.commit()
+        print(f"queued {len(assistant_ids)} knowledge base syncs")
+    finally:
+        await sessionmanager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["resync"])
+    parser.parse_args()
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 import json
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Request, Response, status
 from fastapi.responses import StreamingResponse
 
 from api.chats.models import SendMessageRequest, ThreadMessage
-from api.chats.service import get_thread_messages, stream_message
+from api.chats.service import (
+    export_thread_messages,
+    get_thread_messages,
+    stream_message,
+)
 from api.core.db import SESSION_DEP
+from api.core.versions import get_etag, messages_key, not_modified
 from api.security.service import USER_INFO_DEP
 from api.users.models import Role
 from api.users.service import InvalidRequest, PermissionDenied
@@ -64,6 +69,9 @@ async def stream_message_route(
     description="Return the authenticated patient's chat messages",
 )
 async def get_messages_route(
+    request: Request,
+    response: Response,
+    session: SESSION_DEP,
     user_info: USER_INFO_DEP,
 ):
     try:
@@ -73,6 +81,13 @@ async def get_messages_route(
         if not user_info.thread_id:
             raise InvalidRequest("User does not have an assigned thread")
 
+        # The history only changes through POST /chats/messages/stream,
+        # which bumps its version
+        etag = await get_etag(session, messages_key(user_info.user_id))
+        if cached := not_modified(request, etag, "chats.messages"):
+            return cached
+        response.headers["ETag"] = etag
+
         return await get_thread_messages(thread_id=user_info.thread_id)
 
     except PermissionDenied as e:
@@ -86,3 +101,44 @@ async def get_messages_route(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e),
         )
+
+
+@router.get(
+    "/messages/export",
+    summary="Export chat history",
+    description="Streams the authenticated patient's complete chat history as NDJSON, oldest first",
+    responses={
+        200: {"content": {"application/x-ndjson": {}}, "description": "One message per line"}
+    },
+)
+async def export_messages_route(
+    user_info: USER_INFO_DEP,
+):
+    try:
+        if user_info.role != Role.PATIENT:
+            raise PermissionDenied("Only patients can access chat history")
+
+        if not user_info.thread_id:
+            raise InvalidRequest("User does not have an assigned thread")
+
+        lines = await export_thread_messages(thread_id=user_info.thread_id)
+
+    except PermissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e),
+        )
+
+    except InvalidRequest as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": 'attachment; filename="chat-history.ndjson"'
+        },
+    )
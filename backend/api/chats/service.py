@@ -1,4 +1,4 @@
-import json
+import asyncio
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any, AsyncIterator, Dict
@@ -8,16 +8,23 @@ from backboard.exceptions import BackboardAPIError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.chats.crisis import crisis_matcher
+from api.chats.knowledge import enqueue_knowledge_sync
 from api.chats.models import ThreadMessage
-from api.chats.tools import TOOLS, guardian_check
+from api.chats.tools import TOOLS, ToolContext, tool_registry
 from api.config import BACKBOARD_API_KEY
+from api.core.db import sessionmanager
+from api.core.jobs import PRIORITY_HIGH
+from api.core.metrics import metrics
+from api.core.versions import bump_version, messages_key
 from api.security.models import TokenData
 from api.therapists.models import ReportMessage
+from api.therapists.outbox import alert_outbox
+from api.therapists.stats import record_message_stats
 from api.users.models import LinkStatus, Patient, PatientLink, Role
 from api.users.service import InvalidRequest, PermissionDenied
 
 SYSTEM_PROMPT = Path("prompts/system_prompt_v1.txt").read_text()
-KB_FILES_DIR = Path("knowledge_docs")
 
 
 async def create_user_assistant(user_id: int) -> str:
@@ -31,13 +38,6 @@ async def create_user_assistant(user_id: int) -> str:
             description=SYSTEM_PROMPT,
             tools=TOOLS,
         )
-
-        for path in KB_FILES_DIR.iterdir():
-            await client.upload_document_to_assistant(
-                assistant_id=assistant.assistant_id,
-                file_path=path,
-            )
-
         return str(assistant.assistant_id)
 
 
@@ -52,7 +52,8 @@ async def create_user_thread(assistant_id: str) -> str:
 
 async def create_patient(session: AsyncSession, user_id: int) -> str:
     """
-    Create a patient with its own assistant and thread
+    Create a patient with its own assistant and thread. The knowledge base
+    is uploaded to the assistant by a job
     Return the patient's thread ID
     """
     assistant_id = await create_user_assistant(user_id)
@@ -68,6 +69,7 @@ async def create_patient(session: AsyncSession, user_id: int) -> str:
 
     try:
         session.add(patient)
+        await enqueue_knowledge_sync(session, assistant_id, priority=PRIORITY_HIGH)
         await session.commit()
     except:
         await session.rollback()
@@ -97,6 +99,24 @@ async def stream_message(
     )
     therapist_id = link_result.scalar_one_or_none()
 
+    # Crisis language raises a provisional alert before the model even sees
+    # the message; a later guardian_check call confirms it
+    with metrics.timer("chats.prefilter.scan").time():
+        crisis = crisis_matcher.scan(content)
+    if crisis and therapist_id:
+        metrics.counter("chats.prefilter.match").inc()
+        await alert_outbox.append(
+            therapist_id=therapist_id,
+            patient_id=user_info.user_id,
+            risk_level=crisis.risk_level,
+            cause="Crisis language detected (pending model review): "
+            + ", ".join(f'"{p}"' for p in crisis.phrases),
+            provisional=True,
+        )
+
+    sent_at = datetime.now(timezone.utc)
+    stored = False
+
     try:
         async with BackboardClient(api_key=BACKBOARD_API_KEY) as client:  # type: ignore
             stream = await client.add_message(
@@ -106,6 +126,12 @@ async def stream_message(
                 stream=True,
             )
 
+            # The user message is in the thread from now on: it is counted
+            # even if the response fails, and polls of the history made
+            # during the response must not get a 304
+            stored = True
+            schedule_history_update(user_info.user_id, therapist_id, sent_at)
+
             async for chunk in stream:
                 chunk_type = chunk.get("type")
 
@@ -117,27 +143,13 @@ async def stream_message(
                     run_id = chunk["run_id"]
                     tool_calls = chunk["tool_calls"]
 
-                    tool_outputs = []
-                    for tc in tool_calls:
-                        function_name = tc["function"]["name"]
-                        function_args = json.loads(tc["function"]["arguments"])
-
-                        if function_name == "guardian_check":
-                            risk_level = function_args.get("risk_level", "low")
-                            cause = function_args.get("cause") or f"Safety concern detected - {risk_level} risk level"
-                            
-                            result = await guardian_check(
-                                session=session,
-                                therapist_id=therapist_id or 0,
-                                patient_id=user_info.user_id,
-                                risk_level=risk_level,
-                                cause=cause,
-                            )
-
-                            tool_outputs.append({
-                                "tool_call_id": tc["id"],
-                                "output": json.dumps(result),
-                            })
+                    tool_outputs = await tool_registry.dispatch(
+                        tool_calls,
+                        ToolContext(
+                            therapist_id=therapist_id or 0,
+                            patient_id=user_info.user_id,
+                        ),
+                    )
 
                     # Submit tool outputs and stream the final response
                     async for tool_chunk in await client.submit_tool_outputs(
@@ -154,6 +166,43 @@ async def stream_message(
     except BackboardAPIError as e:
         raise InvalidRequest(f"Chat service error: {str(e)}")
 
+    finally:
+        # The thread may have changed even if the client went away midway:
+        # the history version is bumped again in any case
+        if stored:
+            schedule_history_update(user_info.user_id)
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def schedule_history_update(
+    patient_id: int, therapist_id: int | None = None, sent_at: datetime | None = None
+) -> None:
+    """
+    Bump the patient's history version (and count the message sent at
+    `sent_at` in patient_stats, if given a therapist) in the background:
+    the response never waits on a database write
+    """
+    task = asyncio.create_task(_update_history(patient_id, therapist_id, sent_at))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _update_history(
+    patient_id: int, therapist_id: int | None, sent_at: datetime | None
+) -> None:
+    # Best effort: the version is bumped again when the response ends, and
+    # message counters can be rebuilt from the threads
+    try:
+        async with sessionmanager.session() as session:
+            await bump_version(session, messages_key(patient_id))
+            if therapist_id and sent_at is not None:
+                await record_message_stats(session, therapist_id, patient_id, sent_at)
+            await session.commit()
+    except Exception:
+        metrics.counter("chats.messages.update_failed").inc()
+
 
 async def get_thread_messages(thread_id: str) -> list[ThreadMessage]:
     """
@@ -177,6 +226,45 @@ async def get_thread_messages(thread_id: str) -> list[ThreadMessage]:
         raise InvalidRequest(f"Chat service error: {str(e)}")
 
 
+EXPORT_BATCH_SIZE = 100
+
+
+async def export_thread_messages(thread_id: str) -> AsyncIterator[bytes]:
+    """
+    Return the thread's messages as NDJSON chunks (one ThreadMessage per
+    line, oldest first), to be streamed in the response.
+
+    Backboard has no message pagination, so the thread is fetched in one
+    call (errors are raised here, before anything is sent). No list of
+    ThreadMessage or JSON array is built from it: messages are serialized
+    EXPORT_BATCH_SIZE lines at a time and released once sent.
+    """
+    try:
+        async with BackboardClient(api_key=BACKBOARD_API_KEY) as client:  # type: ignore
+            thread = await client.get_thread(thread_id)
+    except BackboardAPIError as e:
+        raise InvalidRequest(f"Chat service error: {str(e)}")
+
+    messages = thread.messages or []
+    del thread
+    # Newest first, so popping from the end yields them in chronological order
+    messages.sort(key=lambda m: m.created_at, reverse=True)
+
+    async def lines() -> AsyncIterator[bytes]:
+        while messages:
+            batch = []
+            for _ in range(min(EXPORT_BATCH_SIZE, len(messages))):
+                m = messages.pop()
+                batch.append(
+                    ThreadMessage(
+                        timestamp=m.created_at, content=m.content, role=m.role  # type: ignore
+                    ).model_dump_json()
+                )
+            yield ("\n".join(batch) + "\n").encode()
+
+    return lines()
+
+
 def filter_last_week(messages: list[ThreadMessage]):
     cutoff = datetime.now(timezone.utc) - timedelta(days=7)
 
@@ -1,50 +1,127 @@
+import asyncio
 import json
-from datetime import datetime, timezone
-from typing import Any, Dict, List
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List
 
-from sqlalchemy.ext.asyncio import AsyncSession
-
-from api.therapists.models import Alert, AlertMessage
+from api.chats.crisis import RISK_ORDER
+from api.core.metrics import metrics
+from api.therapists.outbox import alert_outbox
 
 ToolDict = Dict[str, Any]
 
 
+@dataclass(frozen=True)
+class ToolContext:
+    """
+    What a tool handler knows about the conversation that called it
+    """
+
+    therapist_id: int
+    patient_id: int
+
+
+ToolHandler = Callable[[ToolContext, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+@dataclass(frozen=True)
+class Tool:
+    definition: ToolDict
+    handler: ToolHandler
+    timeout: float
+
+    @property
+    def name(self) -> str:
+        return self.definition["function"]["name"]
+
+
+class ToolRegistry:
+    """
+    Maps tool names to async handlers.
+
+    All tool calls of a tool_submit_required chunk run concurrently, so adding
+    tools doesn't add their latencies up. A failing, slow or unknown tool
+    returns a structured error output instead of being dropped.
+    """
+
+    def __init__(self) -> None:
+        self._tools: dict[str, Tool] = {}
+
+    def register(
+        self, definition: ToolDict, handler: ToolHandler, timeout: float = 10.0
+    ) -> None:
+        tool = Tool(definition=definition, handler=handler, timeout=timeout)
+        self._tools[tool.name] = tool
+
+    @property
+    def definitions(self) -> List[ToolDict]:
+        return [tool.definition for tool in self._tools.values()]
+
+    async def dispatch(
+        self, tool_calls: List[Dict[str, Any]], context: ToolContext
+    ) -> List[Dict[str, str]]:
+        """
+        Run every tool call concurrently
+        Return the tool outputs, in the order of the calls
+        """
+        outputs = await asyncio.gather(*(self._call(tc, context) for tc in tool_calls))
+        return [
+            {"tool_call_id": tc["id"], "output": json.dumps(output)}
+            for tc, output in zip(tool_calls, outputs)
+        ]
+
+    async def _call(self, tool_call: Dict[str, Any], context: ToolContext) -> Dict[str, Any]:
+        function_name = tool_call["function"]["name"]
+        tool = self._tools.get(function_name)
+        if tool is None:
+            metrics.counter("chats.tools.unknown").inc()
+            return _tool_error("unknown_tool", f"Unknown tool: {function_name}")
+
+        try:
+            function_args = json.loads(tool_call["function"].get("arguments") or "{}")
+        except json.JSONDecodeError:
+            return _tool_error("invalid_arguments", "Arguments are not valid JSON")
+
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                tool.handler(context, function_args), timeout=tool.timeout
+            )
+        except TimeoutError:
+            metrics.counter(f"chats.tools.{function_name}.timeout").inc()
+            return _tool_error("timeout", f"{function_name} did not answer in time")
+        except Exception:
+            metrics.counter(f"chats.tools.{function_name}.error").inc()
+            return _tool_error("tool_failed", f"{function_name} failed")
+        finally:
+            metrics.timer(f"chats.tools.{function_name}").observe(
+                time.perf_counter() - start
+            )
+
+
+def _tool_error(error_type: str, message: str) -> Dict[str, Any]:
+    return {"error": {"type": error_type, "message": message}}
+
+
 async def guardian_check(
-    session: AsyncSession,
     therapist_id: int,
     patient_id: int,
     risk_level: str,
     cause: str,
 ) -> Dict[str, Any]:
     """
-    Creates an alert row in the database when safety concerns are detected.
+    Raises an alert when safety concerns are detected (it confirms the
+    provisional alert raised by the crisis prefilter, if any). The alert goes
+    through the outbox so the response stream never waits on the database.
     Returns a response directing the patient to their therapist or resources.
     """
-    alert = Alert(
-        therapist_id=therapist_id,
-        patient_id=patient_id,
-        risk_level=risk_level,
-        cause=cause,
-    )
-
-    try:
-        session.add(alert)
-        await session.commit()
-        await session.refresh(alert)
-    except Exception:
-        await session.rollback()
-        raise
-
-    alert_message = AlertMessage(
-        id=alert.id,
+    alert_message = await alert_outbox.append(
         therapist_id=therapist_id,
         patient_id=patient_id,
         risk_level=risk_level,
         cause=cause,
-        created_at=alert.created_at,
     )
 
-
     if risk_level == "high":
         response_message = (
             "I'm concerned about what you've shared. Your safety matters. "
@@ -96,4 +173,26 @@ GUARDIAN_TOOL: ToolDict = {
 }
 
 
-TOOLS: List[ToolDict] = [GUARDIAN_TOOL]
+async def _guardian_check_handler(
+    context: ToolContext, args: Dict[str, Any]
+) -> Dict[str, Any]:
+    risk_level = args.get("risk_level")
+    if risk_level not in RISK_ORDER:
+        # The model went off the enum: don't guess low, the alert must reach
+        # the therapist
+        metrics.counter("chats.tools.guardian_check.invalid_level").inc()
+        risk_level = "high"
+    cause = args.get("cause") or f"Safety concern detected - {risk_level} risk level"
+
+    return await guardian_check(
+        therapist_id=context.therapist_id,
+        patient_id=context.patient_id,
+        risk_level=risk_level,
+        cause=cause,
+    )
+
+
+tool_registry = ToolRegistry()
+tool_registry.register(GUARDIAN_TOOL, _guardian_check_handler, timeout=10.0)
+
+TOOLS: List[ToolDict] = tool_registry.definitions
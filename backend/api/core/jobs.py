@@ -0,0 +1,485 @@
+"""
+Durable job queue.
+
+Slow operations (note uploads, scheduled reports, knowledge base syncs)
+don't run in request handlers: they are queued as rows of the jobs table
+and run by a pool of async workers. A job is queued in the caller's
+transaction (enqueue does not commit), so it exists if and only if the
+change that needs it was committed.
+
+A worker leases the next runnable job, highest priority then oldest, with
+a single UPDATE ... RETURNING: worker processes sharing the database never
+run the same job at once. The lease is renewed while the job runs; a job
+whose worker died is run again once its lease has expired (visibility
+timeout). A failed job is retried with exponential backoff until its
+max_attempts, then it is kept as dead (dead-letter) with its last error.
+A job that succeeds is deleted.
+
+Handlers are registered per kind with @jobs.task(...) and receive a
+JobContext. They must be idempotent: a job can run again after a crash.
+
+Workers run in the API process (see api.main.lifespan) or on their own:
+
+    python -m api.core.worker run
+"""
+
+import asyncio
+import os
+import random
+import socket
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import (
+    JSON,
+    DateTime,
+    Index,
+    and_,
+    delete,
+    event,
+    func,
+    or_,
+    select,
+    text,
+    update,
+)
+from sqlalchemy import Enum as SAEnum
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from api import Base
+from api.core.db import sessionmanager
+from api.core.metrics import metrics
+from api.core.settings import settings
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+# Keys are unique among the jobs that are not dead
+_LIVE_KEY = text("status != 'DEAD'")
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DEAD = "dead"
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_key", "key", unique=True, sqlite_where=_LIVE_KEY),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    kind: Mapped[str] = mapped_column(nullable=False)
+
+    # Deduplicates jobs: enqueueing a key that is already queued or running
+    # does nothing
+    key: Mapped[str | None] = mapped_column()
+
+    payload: Mapped[dict[str, Any]] = mapped_column(JSON, nullable=False)
+
+    # Higher runs first
+    priority: Mapped[int] = mapped_column(nullable=False, default=PRIORITY_NORMAL)
+
+    status: Mapped[JobStatus] = mapped_column(
+        SAEnum(JobStatus, name="job_status_enum"),
+        nullable=False,
+        default=JobStatus.QUEUED,
+    )
+
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0)
+
+    max_attempts: Mapped[int] = mapped_column(nullable=False)
+
+    run_after: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    leased_by: Mapped[str | None] = mapped_column()
+
+    last_error: Mapped[str | None] = mapped_column()
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+    )
+
+
+@dataclass(frozen=True)
+class JobContext:
+    """
+    What a handler gets of the job it runs
+    """
+
+    id: int
+    kind: str
+    payload: dict[str, Any]
+    attempt: int
+    max_attempts: int
+
+    @property
+    def last_attempt(self) -> bool:
+        """
+        True if the job is dead should this attempt fail
+        """
+        return self.attempt >= self.max_attempts
+
+
+Handler = Callable[[JobContext], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class JobTask:
+    kind: str
+    handler: Handler
+    max_attempts: int
+    retry_seconds: float
+    # Jobs of this kind run at once per worker process, None for no limit
+    concurrency: int | None
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    """
+    DateTime columns are read back naive (UTC) from SQLite
+    """
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+class JobQueue:
+    def __init__(
+        self, poll_seconds: float, visibility_timeout: float, max_retry_seconds: float
+    ):
+        self.poll_seconds = poll_seconds
+        self.visibility_timeout = visibility_timeout
+        self.max_retry_seconds = max_retry_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: dict[str, JobTask] = {}
+        self._running: defaultdict[str, int] = defaultdict(int)
+        self._lease_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    def task(
+        self,
+        kind: str,
+        max_attempts: int = 5,
+        retry_seconds: float = 5.0,
+        concurrency: int | None = None,
+    ) -> Callable[[Handler], Handler]:
+        """
+        Register the handler of a kind of job. A failed attempt is retried
+        after retry_seconds, doubled at every attempt
+        """
+
+        def register(handler: Handler) -> Handler:
+            self._tasks[kind] = JobTask(
+                kind=kind,
+                handler=handler,
+                max_attempts=max_attempts,
+                retry_seconds=retry_seconds,
+                concurrency=concurrency,
+            )
+            return handler
+
+        return register
+
+    @property
+    def kinds(self) -> list[str]:
+        return sorted(self._tasks)
+
+    async def enqueue(
+        self,
+        session: AsyncSession,
+        kind: str,
+        payload: dict[str, Any],
+        priority: int = PRIORITY_NORMAL,
+        delay: float = 0,
+        key: str | None = None,
+    ) -> None:
+        """
+        Queue a job, to run once the session commits. Does not commit
+        """
+        task = self._tasks.get(kind)
+        if task is None:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        stmt = insert(Job).values(
+            kind=kind,
+            key=key,
+            payload=payload,
+            priority=priority,
+            status=JobStatus.QUEUED,
+            max_attempts=task.max_attempts,
+            run_after=_utcnow() + timedelta(seconds=delay),
+        )
+        if key is not None:
+            stmt = stmt.on_conflict_do_nothing(
+                index_elements=[Job.key], index_where=_LIVE_KEY
+            )
+        await session.execute(stmt)
+
+        # Workers of this process don't wait for the next poll
+        if not event.contains(session.sync_session, "after_commit", self._wake):
+            event.listen(session.sync_session, "after_commit", self._wake)
+
+    def _wake(self, *_: Any) -> None:
+        self._wakeup.set()
+
+    # -- database --
+
+    async def _lease(self) -> Job | None:
+        """
+        Lease the next runnable job of a kind this process runs and has room
+        for. Return it, None if there is none
+        """
+        kinds = [
+            kind
+            for kind, task in self._tasks.items()
+            if task.concurrency is None or self._running[kind] < task.concurrency
+        ]
+        if not kinds:
+            return None
+
+        now = _utcnow()
+        runnable = and_(
+            Job.kind.in_(kinds),
+            or_(
+                and_(Job.status == JobStatus.QUEUED, Job.run_after <= now),
+                and_(Job.status == JobStatus.RUNNING, Job.lease_expires_at <= now),
+            ),
+        )
+        next_id = (
+            select(Job.id)
+            .where(runnable)
+            .order_by(Job.priority.desc(), Job.run_after, Job.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+
+        async with sessionmanager.session() as session:
+            result = await session.execute(
+                update(Job)
+                .where(Job.id == next_id, runnable)
+                .values(
+                    status=JobStatus.RUNNING,
+                    attempts=Job.attempts + 1,
+                    lease_expires_at=now + timedelta(seconds=self.visibility_timeout),
+                    leased_by=self.worker_id,
+                )
+                .returning(Job)
+            )
+            job = result.scalar_one_or_none()
+            await session.commit()
+
+        if job is not None:
+            # Queue age: how long the job waited for a worker
+            waited = (now - _aware(job.run_after)).total_seconds()
+            metrics.timer(f"jobs.{job.kind}.wait").observe(max(waited, 0))
+        return job
+
+    async def _set(self, job_id: int, **values: Any) -> bool:
+        """
+        Update a job this worker still holds the lease of
+        """
+        async with sessionmanager.session() as session:
+            result = await session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.leased_by == self.worker_id)
+                .values(**values)
+            )
+            await session.commit()
+            return result.rowcount == 1  # type: ignore[attr-defined]
+
+    async def _complete(self, job_id: int) -> None:
+        async with sessionmanager.session() as session:
+            await session.execute(
+                delete(Job).where(Job.id == job_id, Job.leased_by == self.worker_id)
+            )
+            await session.commit()
+
+    async def _fail(self, job: JobContext, exc: Exception) -> None:
+        task = self._tasks[job.kind]
+        error = f"{type(exc).__name__}: {exc}"
+        if job.last_attempt:
+            await self._set(
+                job.id,
+                status=JobStatus.DEAD,
+                lease_expires_at=None,
+                leased_by=None,
+                last_error=error,
+            )
+            metrics.counter(f"jobs.{job.kind}.dead").inc()
+            return
+
+        delay = min(task.retry_seconds * 2 ** (job.attempt - 1), self.max_retry_seconds)
+        # Jitter, so jobs failing together don't all come back at once
+        delay *= random.uniform(1, 1.25)
+        await self._set(
+            job.id,
+            status=JobStatus.QUEUED,
+            run_after=_utcnow() + timedelta(seconds=delay),
+            lease_expires_at=None,
+            leased_by=None,
+            last_error=error,
+        )
+        metrics.counter(f"jobs.{job.kind}.retried").inc()
+
+    async def _heartbeat(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self._set(
+                    job_id,
+                    lease_expires_at=_utcnow()
+                    + timedelta(seconds=self.visibility_timeout),
+                )
+            except Exception:
+                metrics.counter("jobs.heartbeat_failed").inc()
+
+    # -- workers --
+
+    async def _execute(self, job: Job) -> None:
+        task = self._tasks[job.kind]
+        context = JobContext(
+            id=job.id,
+            kind=job.kind,
+            payload=job.payload,
+            attempt=job.attempts,
+            max_attempts=job.max_attempts,
+        )
+
+        self._running[job.kind] += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            with metrics.timer(f"jobs.{job.kind}.run").time():
+                await task.handler(context)
+        except asyncio.CancelledError:
+            # Shutting down: the job runs again at once elsewhere, and the
+            # interrupted attempt does not count
+            await self._set(
+                job.id,
+                status=JobStatus.QUEUED,
+                attempts=Job.attempts - 1,
+                run_after=_utcnow(),
+                lease_expires_at=None,
+                leased_by=None,
+            )
+            raise
+        except Exception as exc:
+            await self._fail(context, exc)
+        else:
+            await self._complete(job.id)
+            metrics.counter(f"jobs.{job.kind}.done").inc()
+        finally:
+            heartbeat.cancel()
+            self._running[job.kind] -= 1
+            # A kind that was at its concurrency limit has room again
+            self._wakeup.set()
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                async with self._lease_lock:
+                    job = await self._lease()
+            except Exception:
+                metrics.counter("jobs.lease_failed").inc()
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._execute(job)
+            except Exception:
+                # The job's lease expires and it runs again
+                metrics.counter("jobs.error").inc()
+
+    def start(self, concurrency: int) -> None:
+        """
+        Start `concurrency` workers, each running one job at a time
+        """
+        if not self._workers:
+            # Bound to the running loop
+            self._lease_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._workers = [
+                asyncio.create_task(self._work(), name=f"job-worker-{i}")
+                for i in range(concurrency)
+            ]
+
+    async def stop(self) -> None:
+        """
+        Stop the workers. Jobs in flight are put back in the queue
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+async def queue_stats(session: AsyncSession) -> dict[str, dict[str, Any]]:
+    """
+    Per kind: jobs queued, running and dead, and the age of the oldest
+    runnable queued job (seconds)
+    """
+    now = _utcnow()
+    rows = await session.execute(
+        select(Job.kind, Job.status, func.count(), func.min(Job.run_after)).group_by(
+            Job.kind, Job.status
+        )
+    )
+
+    stats: dict[str, dict[str, Any]] = {}
+    for kind, status, count, oldest in rows:
+        entry = stats.setdefault(
+            kind, {"queued": 0, "running": 0, "dead": 0, "oldest_queued_seconds": 0.0}
+        )
+        entry[status.value] = count
+        if status == JobStatus.QUEUED and oldest is not None:
+            age = (now - _aware(oldest)).total_seconds()
+            entry["oldest_queued_seconds"] = round(max(age, 0), 3)
+    return dict(sorted(stats.items()))
+
+
+async def requeue_dead(session: AsyncSession, kind: str | None = None) -> int:
+    """
+    Queue dead jobs again with their attempts reset. Does not commit
+    Return the number of jobs queued
+    """
+    stmt = (
+        # A dead job whose key was queued again since is left dead
+        update(Job)
+        .prefix_with("OR IGNORE")
+        .where(Job.status == JobStatus.DEAD)
+        .values(status=JobStatus.QUEUED, attempts=0, run_after=_utcnow())
+    )
+    if kind is not None:
+        stmt = stmt.where(Job.kind == kind)
+    result = await session.execute(stmt)
+    return result.rowcount  # type: ignore[attr-defined]
+
+
+jobs = JobQueue(
+    poll_seconds=settings.JOBS_POLL_SECONDS,
+    visibility_timeout=settings.JOBS_VISIBILITY_TIMEOUT_SECONDS,
+    max_retry_seconds=settings.JOBS_MAX_RETRY_SECONDS,
+)
@@ -0,0 +1,78 @@
+"""
+Lightweight in-process metrics.
+
+Counters and timers are created on first use and reported by GET /metrics.
+Values are per worker process and reset on restart.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class Counter:
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def snapshot(self) -> int:
+        return self.value
+
+
+class Timer:
+    """
+    Keeps count, total and max of observed durations (in seconds)
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": (self.total / self.count * 1000) if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._counters: dict[str, Counter] = {}
+        self._timers: dict[str, Timer] = {}
+
+    def counter(self, name: str) -> Counter:
+        if name not in self._counters:
+            self._counters[name] = Counter()
+        return self._counters[name]
+
+    def timer(self, name: str) -> Timer:
+        if name not in self._timers:
+            self._timers[name] = Timer()
+        return self._timers[name]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "counters": {k: c.snapshot() for k, c in sorted(self._counters.items())},
+            "timers": {k: t.snapshot() for k, t in sorted(self._timers.items())},
+        }
+
+
+metrics = MetricsRegistry()
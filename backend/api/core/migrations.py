@@ -0,0 +1,370 @@
+"""
+Versioned schema migrations.
+
+Migrations are applied in order, once, and recorded in the schema_migrations
+table. They run at startup (see api.main.lifespan) or from the command line:
+
+    python -m api.core.migrations upgrade
+    python -m api.core.migrations status
+
+Every helper below is idempotent, so a migration converges both a fresh
+database (where the baseline already created the latest model tables) and an
+old database.db created before the migration existed.
+"""
+
+import asyncio
+import json
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from api import Base
+from api.core import jobs as _jobs  # noqa: F401 (registers tables)
+from api.core import versions as _versions  # noqa: F401 (registers tables)
+from api.security import models as _security_models  # noqa: F401 (registers tables)
+from api.therapists.models import report_excerpt
+from api.therapists.search import create_search_index, rebuild_index
+from api.therapists.settings import settings as therapists_settings
+from api.therapists.stats import rebuild_stats
+from api.users import models as _users_models  # noqa: F401 (registers tables)
+
+VERSION_TABLE = "schema_migrations"
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    A single schema change.
+
+    online migrations build indexes on possibly large tables: they are applied
+    with the database in WAL mode and every statement commits on its own, so
+    readers keep being served while an index is built.
+    """
+
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+    online: bool = False
+
+
+def create_tables(conn: Connection, *table_names: str) -> None:
+    """
+    Create the given model tables (and their indexes) if they do not exist
+    """
+    tables = [Base.metadata.tables[name] for name in table_names]
+    Base.metadata.create_all(conn, tables=tables, checkfirst=True)
+
+
+def create_index(
+    conn: Connection,
+    name: str,
+    table: str,
+    columns: list[str],
+    unique: bool = False,
+) -> None:
+    """
+    Create an index if it does not exist
+    """
+    unique_sql = "UNIQUE " if unique else ""
+    conn.exec_driver_sql(
+        f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} "
+        f"ON {table} ({', '.join(columns)})"
+    )
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    """
+    Add a column to an existing table if it is not there yet.
+    ddl is the column definition, e.g. "INTEGER NOT NULL DEFAULT 0"
+    """
+    existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+    if column not in existing:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _baseline(conn: Connection) -> None:
+    create_tables(
+        conn,
+        "users",
+        "patients",
+        "patient_links",
+        "reports",
+        "patient_notes",
+        "documents",
+        "alerts",
+    )
+
+
+def _index_hot_lookups(conn: Connection) -> None:
+    create_index(conn, "ix_patients_user_id", "patients", ["user_id"])
+    create_index(
+        conn,
+        "ix_patient_links_therapist_status",
+        "patient_links",
+        ["therapist_id", "link_status"],
+    )
+    create_index(
+        conn, "ix_alerts_therapist_created", "alerts", ["therapist_id", "created_at"]
+    )
+    create_index(
+        conn,
+        "ix_alerts_therapist_patient_created",
+        "alerts",
+        ["therapist_id", "patient_id", "created_at"],
+    )
+    create_index(
+        conn,
+        "ix_reports_therapist_patient_created",
+        "reports",
+        ["therapist_id", "patient_id", "created_at"],
+    )
+    create_index(
+        conn,
+        "ix_patient_notes_therapist_patient_created",
+        "patient_notes",
+        ["therapist_id", "patient_id", "created_at"],
+    )
+
+
+def _refresh_tokens(conn: Connection) -> None:
+    create_tables(conn, "refresh_tokens")
+
+
+def _provisional_alerts(conn: Connection) -> None:
+    add_column(conn, "alerts", "is_provisional", "BOOLEAN NOT NULL DEFAULT 0")
+
+
+def _alert_coalescing(conn: Connection) -> None:
+    add_column(conn, "alerts", "occurrences", "INTEGER NOT NULL DEFAULT 1")
+    add_column(conn, "alerts", "last_seen_at", "DATETIME")
+    conn.exec_driver_sql(
+        "UPDATE alerts SET last_seen_at = created_at WHERE last_seen_at IS NULL"
+    )
+    create_index(
+        conn,
+        "ix_alerts_open",
+        "alerts",
+        ["therapist_id", "patient_id", "risk_level", "last_seen_at"],
+    )
+
+
+def _alert_outbox(conn: Connection) -> None:
+    create_tables(conn, "alert_outbox_state")
+
+
+def _patient_stats(conn: Connection) -> None:
+    create_tables(conn, "patient_stats")
+    rebuild_stats(conn)
+
+
+def _resource_versions(conn: Connection) -> None:
+    create_tables(conn, "resource_versions")
+
+
+def _report_excerpts(conn: Connection) -> None:
+    add_column(conn, "reports", "excerpt", "VARCHAR")
+    rows = conn.exec_driver_sql(
+        "SELECT id, content FROM reports WHERE excerpt IS NULL"
+    ).fetchall()
+    if rows:
+        conn.exec_driver_sql(
+            "UPDATE reports SET excerpt = ? WHERE id = ?",
+            [(report_excerpt(content), report_id) for report_id, content in rows],
+        )
+
+
+def _note_ingestion(conn: Connection) -> None:
+    # Notes stored before the ingestion queue were uploaded inline
+    add_column(
+        conn, "patient_notes", "status", "VARCHAR(10) NOT NULL DEFAULT 'INDEXED'"
+    )
+    add_column(conn, "patient_notes", "error", "VARCHAR")
+    add_column(conn, "patient_notes", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "patient_notes", "stored_path", "VARCHAR")
+    add_column(conn, "patient_notes", "document_id", "VARCHAR")
+    add_column(conn, "patient_notes", "updated_at", "DATETIME")
+
+
+def _note_hashes(conn: Connection) -> None:
+    add_column(conn, "patient_notes", "content_hash", "VARCHAR")
+    create_index(
+        conn,
+        "ix_patient_notes_patient_hash",
+        "patient_notes",
+        ["patient_id", "content_hash"],
+    )
+
+
+def _search_index(conn: Connection) -> None:
+    create_search_index(conn)
+    rebuild_index(conn)
+
+
+def _scheduled_runs(conn: Connection) -> None:
+    create_tables(conn, "scheduled_runs")
+
+
+def _job_queue(conn: Connection) -> None:
+    create_tables(conn, "jobs")
+    # Notes waiting for the in-memory ingestion queue get their job
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+    rows = conn.exec_driver_sql(
+        "SELECT id FROM patient_notes WHERE status IN ('PENDING', 'UPLOADING') "
+        "AND id NOT IN (SELECT json_extract(payload, '$.note_id') FROM jobs "
+        "WHERE kind = 'notes.ingest')"
+    ).fetchall()
+    conn.exec_driver_sql(
+        "UPDATE patient_notes SET status = 'PENDING' WHERE status = 'UPLOADING'"
+    )
+    if rows:
+        conn.exec_driver_sql(
+            "INSERT INTO jobs (kind, key, payload, priority, status, attempts, "
+            "max_attempts, run_after, created_at) "
+            "VALUES ('notes.ingest', ?, ?, 0, 'QUEUED', 0, ?, ?, ?)",
+            [
+                (
+                    f"notes.ingest:{note_id}",
+                    json.dumps({"note_id": note_id}),
+                    therapists_settings.NOTE_INGEST_MAX_ATTEMPTS,
+                    now,
+                    now,
+                )
+                for (note_id,) in rows
+            ],
+        )
+
+
+def _unconfirmed_alerts(conn: Connection) -> None:
+    add_column(conn, "alerts", "unconfirmed_at", "DATETIME")
+
+
+def _token_revocation(conn: Connection) -> None:
+    add_column(conn, "users", "tokens_valid_after", "DATETIME")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "index hot lookups", _index_hot_lookups, online=True),
+    Migration(3, "refresh tokens", _refresh_tokens),
+    Migration(4, "provisional alerts", _provisional_alerts),
+    Migration(5, "alert coalescing", _alert_coalescing),
+    Migration(6, "alert outbox", _alert_outbox),
+    Migration(7, "patient stats", _patient_stats),
+    Migration(8, "resource versions", _resource_versions),
+    Migration(9, "report excerpts", _report_excerpts),
+    Migration(10, "note ingestion", _note_ingestion),
+    Migration(11, "note content hashes", _note_hashes),
+    Migration(12, "search index", _search_index),
+    Migration(13, "scheduled runs", _scheduled_runs),
+    Migration(14, "job queue", _job_queue),
+    Migration(15, "unconfirmed alerts", _unconfirmed_alerts),
+    Migration(16, "token revocation", _token_revocation),
+]
+
+LATEST_VERSION = max(m.version for m in MIGRATIONS)
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    )
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text(
+            f"INSERT OR IGNORE INTO {VERSION_TABLE} (version, name, applied_at) "
+            "VALUES (:version, :name, :applied_at)"
+        ),
+        {
+            "version": migration.version,
+            "name": migration.name,
+            "applied_at": datetime.now(timezone.utc),
+        },
+    )
+
+
+async def current_version(engine: AsyncEngine) -> int:
+    """
+    Return the highest applied migration version, 0 for an unmanaged database
+    """
+    async with engine.connect() as conn:
+        try:
+            result = await conn.execute(text(f"SELECT MAX(version) FROM {VERSION_TABLE}"))
+        except OperationalError:
+            return 0
+        return result.scalar() or 0
+
+
+async def run_migrations(engine: AsyncEngine) -> list[Migration]:
+    """
+    Apply every pending migration in order.
+
+    A database that is already current costs a single query: no table
+    reflection happens at all.
+
+    Return the migrations that were applied
+    """
+    version = await current_version(engine)
+    pending = [m for m in MIGRATIONS if m.version > version]
+    if not pending:
+        return []
+
+    async with engine.begin() as conn:
+        await conn.run_sync(_ensure_version_table)
+
+    if any(m.online for m in pending):
+        # journal_mode can't change inside a transaction
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    for migration in sorted(pending, key=lambda m: m.version):
+        if migration.online:
+            # every statement commits on its own instead of holding the write
+            # lock for the whole migration
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.run_sync(migration.upgrade)
+            async with engine.begin() as conn:
+                await _record(conn, migration)
+        else:
+            async with engine.begin() as conn:
+                await conn.run_sync(migration.upgrade)
+                await _record(conn, migration)
+
+    return pending
+
+
+async def _main(command: str) -> None:
+    from api.core.db import sessionmanager
+
+    engine = sessionmanager._engine
+    assert engine is not None
+
+    try:
+        if command == "upgrade":
+            applied = await run_migrations(engine)
+            for m in applied:
+                print(f"applied {m.version:04d} {m.name}")
+            print(f"schema at version {LATEST_VERSION}")
+        elif command == "status":
+            version = await current_version(engine)
+            for m in MIGRATIONS:
+                state = "applied" if m.version <= version else "pending"
+                print(f"{m.version:04d} {m.name}: {state}")
+        else:
+            raise SystemExit(f"unknown command: {command}")
+    finally:
+        await sessionmanager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "upgrade"))
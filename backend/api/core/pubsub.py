@@ -0,0 +1,79 @@
+"""
+In-process publish/subscribe.
+
+Messages are published to a topic and delivered to every subscription of
+that topic. Each subscription has a bounded buffer: when a slow subscriber
+falls behind, its oldest messages are dropped so publishers never block.
+Delivery is per worker process.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Hashable
+
+from api.core.metrics import metrics
+
+
+class Subscription:
+    def __init__(self, hub: "Hub", topic: Hashable, buffer_size: int):
+        self.hub = hub
+        self.topic = topic
+        self.dropped = 0
+        self._buffer: deque[Any] = deque(maxlen=buffer_size)
+        self._ready = asyncio.Event()
+
+    def push(self, message: Any) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+            metrics.counter(f"{self.hub.name}.dropped").inc()
+        self._buffer.append(message)
+        self._ready.set()
+
+    async def get(self) -> Any:
+        """
+        Wait for the next message
+        """
+        while not self._buffer:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._buffer.popleft()
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class Hub:
+    def __init__(self, name: str, buffer_size: int):
+        self.name = name
+        self.buffer_size = buffer_size
+        self._subscriptions: dict[Hashable, set[Subscription]] = {}
+
+    def subscribe(self, topic: Hashable) -> Subscription:
+        subscription = Subscription(self, topic, self.buffer_size)
+        self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.topic)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._subscriptions[subscription.topic]
+
+    def publish(self, topic: Hashable, message: Any) -> int:
+        """
+        Deliver a message to every subscription of the topic
+        Return the number of subscriptions it was delivered to
+        """
+        subscriptions = self._subscriptions.get(topic, ())
+        for subscription in subscriptions:
+            subscription.push(message)
+        metrics.counter(f"{self.name}.published").inc()
+        return len(subscriptions)
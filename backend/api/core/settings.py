@@ -0,0 +1,24 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    # GET /metrics is served to callers sending this as a bearer token, and
+    # to no one while it is unset (behind a proxy every client is local)
+    METRICS_TOKEN: str | None = None
+
+    # Job queue (api.core.jobs). Workers run in the API process unless
+    # JOBS_RUN_IN_PROCESS is off, then in `python -m api.core.worker`
+    JOBS_RUN_IN_PROCESS: bool = True
+    JOBS_CONCURRENCY: int = 4
+    # Wait between polls when the queue is empty (jobs queued by this
+    # process wake the workers at once)
+    JOBS_POLL_SECONDS: float = 1.0
+    # A running job whose lease is not renewed for this long (its worker
+    # died) is run again by another worker
+    JOBS_VISIBILITY_TIMEOUT_SECONDS: float = 300
+    JOBS_MAX_RETRY_SECONDS: float = 3600
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+
+settings = Settings()
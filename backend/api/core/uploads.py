@@ -0,0 +1,132 @@
+"""
+Size-limited multipart uploads streamed to disk.
+
+Starlette's form parser spools each file in memory (up to 1MB) and only
+lets the endpoint look at its size once the whole body has been read.
+receive_form writes file parts straight to named temporary files, through
+the thread pool, chunk by chunk as they arrive, and aborts the upload as
+soon as a file goes over the limit. Memory per upload is bounded by the
+size of the request body chunks.
+"""
+
+import re
+import tempfile
+from typing import AsyncGenerator, Callable
+
+from starlette.datastructures import FormData, Headers, UploadFile
+from starlette.formparsers import MultiPartParser
+from starlette.requests import Request
+
+# Room for the multipart boundaries and part headers around the files
+MULTIPART_OVERHEAD = 64 * 1024
+
+_UNSAFE_FILENAME = re.compile(r"[^A-Za-z0-9._-]+")
+
+
+def safe_filename(filename: str) -> str:
+    """
+    Filename reduced to characters that are safe on any filesystem
+    """
+    return _UNSAFE_FILENAME.sub("_", filename)[-100:]
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, max_size: int, *args: object) -> None:
+        super().__init__(*args)
+        self.max_size = max_size
+
+
+class DiskMultiPartParser(MultiPartParser):
+    def __init__(
+        self,
+        headers: Headers,
+        stream: AsyncGenerator[bytes, None],
+        max_file_size: int,
+        max_files: int,
+        directory: str | None = None,
+        size_limit: Callable[[str], int] | None = None,
+    ) -> None:
+        super().__init__(headers, stream, max_files=max_files)
+        self.max_file_size = max_file_size
+        self.directory = directory
+        self.size_limit = size_limit
+        self._current_file_size = 0
+        self._current_max_size = max_file_size
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        part = self._current_part
+        if part.file is None:
+            return
+
+        # Swap the in-memory spool for a file on disk. It is deleted when
+        # closed, by the caller or by the parser if the upload fails
+        spooled = part.file.file
+        self._files_to_close_on_error.remove(spooled)  # type: ignore[arg-type]
+        spooled.close()
+
+        suffix = safe_filename(part.file.filename or "")
+        on_disk = tempfile.NamedTemporaryFile(suffix=f"_{suffix}", dir=self.directory)
+        self._files_to_close_on_error.append(on_disk)  # type: ignore[arg-type]
+        part.file = UploadFile(
+            file=on_disk,  # type: ignore[arg-type]
+            size=0,
+            filename=part.file.filename,
+            headers=part.file.headers,
+        )
+        self._current_file_size = 0
+        self._current_max_size = self.max_file_size
+        if self.size_limit is not None:
+            self._current_max_size = min(
+                self.max_file_size, self.size_limit(part.file.filename or "")
+            )
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._current_part.file is not None:
+            self._current_file_size += end - start
+            if self._current_file_size > self._current_max_size:
+                raise UploadTooLarge(self._current_max_size, "File too large")
+        super().on_part_data(data, start, end)
+
+
+async def receive_form(
+    request: Request,
+    max_file_size: int,
+    max_files: int = 1,
+    directory: str | None = None,
+    size_limit: Callable[[str], int] | None = None,
+) -> FormData:
+    """
+    Parse a multipart request, files are written to disk as they arrive
+    (in directory, the system temporary directory by default).
+    Raise UploadTooLarge as soon as a file exceeds max_file_size, or the
+    lower limit size_limit returns for its filename, and starlette's
+    MultiPartException for a malformed body or too many files.
+
+    Files are NamedTemporaryFile objects, their path is upload.file.name.
+    The caller must close the form (await form.close()), which deletes them;
+    a file the caller wants to keep can be moved away (os.replace) before.
+    """
+    content_length = request.headers.get("content-length")
+    if (
+        content_length is not None
+        and content_length.isdigit()
+        and int(content_length) > max_file_size * max_files + MULTIPART_OVERHEAD
+    ):
+        raise UploadTooLarge(max_file_size, "File too large")
+
+    parser = DiskMultiPartParser(
+        request.headers,
+        request.stream(),
+        max_file_size=max_file_size,
+        max_files=max_files,
+        directory=directory,
+        size_limit=size_limit,
+    )
+    form = await parser.parse()
+
+    for _, value in form.multi_items():
+        if isinstance(value, UploadFile):
+            await value.seek(0)  # flushes what is still buffered
+
+    return form
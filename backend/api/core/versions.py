@@ -0,0 +1,91 @@
+"""
+Resource versions for conditional GETs.
+
+Writers bump the version of the resource they changed, in the transaction
+that changes it. List endpoints derive their ETag from that version, so a
+request carrying a matching If-None-Match is answered 304 after a primary
+key lookup, without running the list query or serializing the payload.
+Versions are stored in the database, so every worker process sees the
+bumps of the others.
+"""
+
+import hashlib
+
+from fastapi import Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from api import Base
+from api.core.metrics import metrics
+
+
+class ResourceVersion(Base):
+    __tablename__ = "resource_versions"
+
+    key: Mapped[str] = mapped_column(primary_key=True)
+
+    version: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+def alerts_key(therapist_id: int) -> str:
+    return f"alerts:{therapist_id}"
+
+
+def patients_key(therapist_id: int) -> str:
+    return f"patients:{therapist_id}"
+
+
+def reports_key(therapist_id: int, patient_id: int) -> str:
+    return f"reports:{therapist_id}:{patient_id}"
+
+
+def notes_key(therapist_id: int, patient_id: int) -> str:
+    return f"notes:{therapist_id}:{patient_id}"
+
+
+def messages_key(patient_id: int) -> str:
+    return f"messages:{patient_id}"
+
+
+async def bump_version(session: AsyncSession, key: str) -> None:
+    """
+    Does not commit
+    """
+    stmt = insert(ResourceVersion).values(key=key, version=1)
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ResourceVersion.key],
+            set_={"version": ResourceVersion.version + 1},
+        )
+    )
+
+
+async def get_etag(session: AsyncSession, key: str, variant: str = "") -> str:
+    """
+    ETag of the resource's current version. variant tells apart the
+    representations of the same resource (e.g. query parameters)
+    """
+    stmt = select(ResourceVersion.version).where(ResourceVersion.key == key)
+    version = (await session.execute(stmt)).scalar_one_or_none() or 0
+    digest = hashlib.sha256(f"{key}|{variant}".encode()).hexdigest()[:12]
+    return f'W/"{digest}-{version}"'
+
+
+def not_modified(request: Request, etag: str, name: str) -> Response | None:
+    """
+    Return a 304 response if the request's If-None-Match matches the ETag.
+    Hits and misses are counted as etag.<name>.hit / etag.<name>.miss
+    """
+    header = request.headers.get("if-none-match")
+    if header is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+        if "*" in tags or etag.removeprefix("W/") in tags:
+            metrics.counter(f"etag.{name}.hit").inc()
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+            )
+
+    metrics.counter(f"etag.{name}.miss").inc()
+    return None
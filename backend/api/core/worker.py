@@ -0,0 +1,64 @@
+"""
+Job queue command line (api.core.jobs).
+
+    python -m api.core.worker run [--concurrency N]
+    python -m api.core.worker status
+    python -m api.core.worker retry-dead [--kind KIND]
+
+`run` starts a worker process: set JOBS_RUN_IN_PROCESS=false on the API
+processes to run every job in dedicated workers instead.
+"""
+
+import argparse
+import asyncio
+import json
+import signal
+
+from api.core.db import sessionmanager
+from api.core.jobs import jobs, queue_stats, requeue_dead
+from api.core.migrations import run_migrations
+from api.core.settings import settings
+
+
+async def _run(concurrency: int) -> None:
+    # Registers the job handlers
+    import api.main  # noqa: F401
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await run_migrations(sessionmanager._engine)  # type: ignore
+    jobs.start(concurrency)
+    print(f"worker {jobs.worker_id} running: {', '.join(jobs.kinds)}")
+    await stop.wait()
+    await jobs.stop()
+
+
+async def _main(args: argparse.Namespace) -> None:
+    try:
+        if args.command == "run":
+            await _run(args.concurrency)
+        elif args.command == "status":
+            async with sessionmanager.session() as session:
+                print(json.dumps(await queue_stats(session), indent=2))
+        elif args.command == "retry-dead":
+            async with sessionmanager.session() as session:
+                count = await requeue_dead(session, args.kind)
+                await session.commit()
+            print(f"queued {count} dead jobs")
+    finally:
+        await sessionmanager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["run", "status", "retry-dead"])
+    parser.add_argument("--concurrency", type=int, default=settings.JOBS_CONCURRENCY)
+    parser.add_argument("--kind", help="retry-dead: only jobs of this kind")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
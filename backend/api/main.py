@@ -1,22 +1,41 @@
+import secrets
 from contextlib import asynccontextmanager
+from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from api.chats.routers import router as chat_router
-from api.core.db import sessionmanager
+from api.core.db import SESSION_DEP, sessionmanager
+from api.core.jobs import jobs, queue_stats
+from api.core.metrics import metrics
+from api.core.migrations import run_migrations
+from api.core.settings import settings as core_settings
+from api.security.hashing import hash_pool
 from api.security.routers import router as auth_router
+from api.therapists.outbox import alert_outbox
 from api.therapists.routers import router as therapists_router
+from api.therapists.scheduler import report_scheduler
+from api.therapists.settings import settings as therapists_settings
 from api.users.routers import router as users_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with sessionmanager._engine.begin() as conn:  # type: ignore
-        await sessionmanager.create_all(conn)
+    await run_migrations(sessionmanager._engine)  # type: ignore
+    Path(therapists_settings.NOTE_STORAGE_DIR).mkdir(parents=True, exist_ok=True)
+    alert_outbox.start()
+    if core_settings.JOBS_RUN_IN_PROCESS:
+        jobs.start(core_settings.JOBS_CONCURRENCY)
+    if therapists_settings.REPORT_SCHEDULE_ENABLED:
+        report_scheduler.start()
 
     yield
 
+    await report_scheduler.stop()
+    await jobs.stop()
+    await alert_outbox.stop()
+    hash_pool.shutdown()
     await sessionmanager.close()
 
 
@@ -43,3 +62,24 @@ app.include_router(therapists_router)
 @app.get("/")
 def root():
     return "hello world!"
+
+
+def require_metrics_access(request: Request) -> None:
+    """
+    Internal counters and queue state are not public, see METRICS_TOKEN
+    """
+    token = core_settings.METRICS_TOKEN
+    if token:
+        header = request.headers.get("authorization", "")
+        scheme, _, credentials = header.partition(" ")
+        if scheme.lower() == "bearer" and secrets.compare_digest(credentials, token):
+            return
+    raise HTTPException(status_code=403, detail="Not allowed")
+
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_access)])
+async def get_metrics(session: SESSION_DEP):
+    """
+    In-process counters and timings of this worker, and the job queue
+    """
+    return {**metrics.snapshot(), "jobs": await queue_stats(session)}
@@ -0,0 +1,118 @@
+"""
+Argon2 cost calibration.
+
+Benchmarks Argon2 on this host and picks the highest cost that still
+verifies a password within the target time:
+
+    python -m api.security.calibrate --target-ms 250
+    python -m api.security.calibrate --target-ms 250 --write
+
+Memory cost is kept as high as possible (halved until t=1 fits), then time
+cost is raised while the target holds. With --write the settings are stored
+in the .env file; existing hashes are upgraded on the users' next login.
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from pwdlib.hashers.argon2 import Argon2Hasher
+
+from api.security.settings import settings
+
+MIN_MEMORY_COST = 19 * 1024  # KiB, OWASP minimum for argon2id
+MAX_TIME_COST = 10
+SAMPLE_PASSWORD = "calibration-password"
+
+
+def measure_ms(time_cost: int, memory_cost: int, parallelism: int, rounds: int) -> float:
+    """
+    Median verification time in milliseconds for these parameters
+    """
+    hasher = Argon2Hasher(
+        time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+    )
+    hashed = hasher.hash(SAMPLE_PASSWORD)
+
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hasher.verify(SAMPLE_PASSWORD, hashed)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(samples)
+
+
+def calibrate(
+    target_ms: float, memory_cost: int, parallelism: int, rounds: int
+) -> tuple[int, int, float]:
+    """
+    Return (time_cost, memory_cost, measured_ms)
+    """
+    elapsed = measure_ms(1, memory_cost, parallelism, rounds)
+    while elapsed > target_ms and memory_cost // 2 >= MIN_MEMORY_COST:
+        memory_cost //= 2
+        elapsed = measure_ms(1, memory_cost, parallelism, rounds)
+
+    time_cost = 1
+    while time_cost < MAX_TIME_COST:
+        next_elapsed = measure_ms(time_cost + 1, memory_cost, parallelism, rounds)
+        if next_elapsed > target_ms:
+            break
+        time_cost += 1
+        elapsed = next_elapsed
+
+    return time_cost, memory_cost, elapsed
+
+
+def write_env(env_file: Path, values: dict[str, int]) -> None:
+    """
+    Set the given keys in the env file, keeping every other line
+    """
+    lines = env_file.read_text().splitlines() if env_file.exists() else []
+    remaining = dict(values)
+
+    for i, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if key in remaining:
+            lines[i] = f"{key}={remaining.pop(key)}"
+
+    lines.extend(f"{key}={value}" for key, value in remaining.items())
+    env_file.write_text("\n".join(lines) + "\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument(
+        "--max-memory-kib", type=int, default=settings.ARGON2_MEMORY_COST
+    )
+    parser.add_argument("--parallelism", type=int, default=settings.ARGON2_PARALLELISM)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--env-file", type=Path, default=Path(".env"))
+    parser.add_argument(
+        "--write", action="store_true", help="store the result in the env file"
+    )
+    args = parser.parse_args()
+
+    time_cost, memory_cost, elapsed = calibrate(
+        args.target_ms, args.max_memory_kib, args.parallelism, args.rounds
+    )
+
+    values = {
+        "ARGON2_TIME_COST": time_cost,
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_PARALLELISM": args.parallelism,
+    }
+    for key, value in values.items():
+        print(f"{key}={value}")
+    print(f"# verification takes ~{elapsed:.0f}ms (target {args.target_ms:.0f}ms)")
+
+    if args.write:
+        write_env(args.env_file, values)
+        print(f"# written to {args.env_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Argon2 hashing off the event loop.
+
+Hashing and verification run in a bounded thread or process pool so a burst
+of logins can't stall the SSE streams served by the same worker.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+
+from api.core.metrics import metrics
+from api.security.settings import settings
+
+# hash utility (argon2 hasher), cost calibrated for this host
+password_hash = PasswordHash(
+    (
+        Argon2Hasher(
+            time_cost=settings.ARGON2_TIME_COST,
+            memory_cost=settings.ARGON2_MEMORY_COST,
+            parallelism=settings.ARGON2_PARALLELISM,
+        ),
+    )
+)
+
+
+class HasherBusy(Exception):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+def _timed(fn: Callable[..., Any], *args: Any) -> tuple[Any, float, float]:
+    """
+    Runs inside the pool, returns (result, started_at, finished_at)
+    """
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+
+def _verify(input_pwd: str, hashed_pwd: str) -> tuple[bool, bool]:
+    """
+    Return (password matches, hash uses outdated parameters)
+    """
+    valid = password_hash.verify(input_pwd, hashed_pwd)
+    return valid, valid and password_hash.current_hasher.check_needs_rehash(hashed_pwd)
+
+
+def _hash(input_pwd: str) -> str:
+    return password_hash.hash(input_pwd)
+
+
+class HashPool:
+    """
+    Runs password hashing with at most `workers` hashes in flight and
+    `max_queue` waiting. Anything beyond is rejected with HasherBusy
+    instead of piling up behind the pool.
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._pending = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="argon2"
+                )
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.workers + self.max_queue:
+            metrics.counter("auth.hash.rejected").inc()
+            raise HasherBusy("Too many concurrent authentication requests")
+
+        self._pending += 1
+        submitted = time.monotonic()
+        try:
+            future = self._get_executor().submit(_timed, fn, *args)
+            result, started, finished = await asyncio.wrap_future(future)
+        finally:
+            self._pending -= 1
+
+        metrics.timer("auth.hash.queue_wait").observe(started - submitted)
+        metrics.timer("auth.hash.duration").observe(finished - started)
+        return result
+
+    async def verify(self, input_pwd: str, hashed_pwd: str) -> tuple[bool, bool]:
+        """
+        Return (password matches, hash needs to be recomputed)
+        """
+        return await self._run(_verify, input_pwd, hashed_pwd)
+
+    async def hash(self, input_pwd: str) -> str:
+        return await self._run(_hash, input_pwd)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+hash_pool = HashPool(
+    kind=settings.HASH_POOL_KIND,
+    workers=settings.HASH_POOL_WORKERS,
+    max_queue=settings.HASH_POOL_MAX_QUEUE,
+)
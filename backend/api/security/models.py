@@ -1,7 +1,11 @@
-from typing import Optional
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional
 
 from pydantic import BaseModel
+from sqlalchemy import DateTime, ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
 
+from api import Base
 from api.users.models import Role
 
 
@@ -15,6 +19,7 @@ class Token(BaseModel):
 
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
 
 class TokenData(BaseModel):
@@ -29,3 +34,53 @@ class TokenData(BaseModel):
     user_id: int
     role: Role
     thread_id: Optional[str] = None
+
+
+class UserCredentials(NamedTuple):
+    """
+    Columns needed to log a user in, see security.service.get_user
+    """
+
+    id: int
+    email: str
+    role: Role
+    hashed_pw: str
+    thread_id: Optional[str]
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class RefreshToken(Base):
+    """
+    Opaque, single-use refresh token.
+    Only the SHA-256 of the token is stored; it is rotated on every refresh.
+    """
+
+    __tablename__ = "refresh_tokens"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    token_hash: Mapped[str] = mapped_column(
+        String(64), unique=True, index=True, nullable=False
+    )
+
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+
+    revoked_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+    )
@@ -1,17 +1,26 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
 
 from api.core.db import SESSION_DEP
-from api.security.models import Token
+from api.security.hashing import HasherBusy
+from api.security.models import RefreshRequest, Token
 from api.security.service import (
     USER_INFO_DEP,
     authenticate_user,
     create_access_token,
+    create_refresh_token,
+    refresh_access_token,
+    revoke_refresh_token,
     signup_user,
 )
+from api.security.throttle import (
+    LoginThrottled,
+    check_login_throttle,
+    retry_after_header,
+)
 from api.users.models import User, UserIn, UserOut
 
 router = APIRouter(prefix="/auth", tags=["Authentification"])
@@ -19,15 +28,39 @@ router = APIRouter(prefix="/auth", tags=["Authentification"])
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()], session: SESSION_DEP
+    request: Request,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+    session: SESSION_DEP,
 ):
     """
     Enpoint for authentification
     Checks username (email) and password against the database
 
     Returns JWT token (frontend must store it in the headers)
+    and a refresh token to renew it through /auth/refresh
+
+    Attempts are throttled per email and per IP before any password hashing
     """
-    user = await authenticate_user(session, form_data.username, form_data.password)
+    try:
+        check_login_throttle(
+            form_data.username, request.client.host if request.client else None
+        )
+    except LoginThrottled as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers=retry_after_header(e.retry_after),
+        )
+
+    try:
+        user = await authenticate_user(session, form_data.username, form_data.password)
+    except HasherBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
+
     if not user:
         raise HTTPException(
             status_code=401,
@@ -35,30 +68,53 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    thread_id = None
-    if user.patient:
-        thread_id = user.patient.thread_id
-
     access_token = create_access_token(
         data={
             "email": user.email,
             "user_id": user.id,
             "role": user.role.value,
-            "thread_id": thread_id,
+            "thread_id": user.thread_id,
         }
     )
 
-    response = {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = await create_refresh_token(session, user.id)
+
+    response = {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+    }
 
     return response
 
 
+@router.post("/refresh", response_model=Token)
+async def refresh(session: SESSION_DEP, refresh_data: RefreshRequest):
+    """
+    Exchange a refresh token for a new access token (and a new refresh token,
+    the presented one can't be used again)
+    """
+    return await refresh_access_token(session, refresh_data.refresh_token)
+
+
+@router.post("/revoke", status_code=204)
+async def revoke(session: SESSION_DEP, refresh_data: RefreshRequest):
+    """
+    Revoke a refresh token (logout)
+    """
+    await revoke_refresh_token(session, refresh_data.refresh_token)
+
+
 @router.post("/signup", response_model=Token, status_code=201)
 async def signup(session: SESSION_DEP, signup_data: UserIn):
-    token = await signup_user(session, signup_data)
-    response = {"access_token": token, "token_type": "bearer"}
-
-    return response
+    try:
+        return await signup_user(session, signup_data)
+    except HasherBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
 
 
 @router.get("/me", response_model=UserOut)
@@ -69,9 +125,10 @@ async def get_current_user_info(
     """
     Get the current user's profile information.
     """
-    stmt = select(User).where(User.id == user_info.user_id)
-    result = await session.execute(stmt)
-    user = result.scalars().one_or_none()
+    stmt = select(
+        User.id, User.email, User.role, User.full_name, User.phone_number
+    ).where(User.id == user_info.user_id)
+    user = (await session.execute(stmt)).one_or_none()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
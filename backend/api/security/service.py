@@ -1,3 +1,6 @@
+import asyncio
+import hashlib
+import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
@@ -5,75 +8,123 @@ import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
-from pwdlib import PasswordHash
-from sqlalchemy import select
+from sqlalchemy import delete, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
 from api.chats.service import create_patient
-from api.security.models import TokenData
+from api.core.db import sessionmanager
+from api.core.metrics import metrics
+from api.security.hashing import HasherBusy, hash_pool
+from api.security.models import RefreshToken, Token, TokenData, UserCredentials
 from api.security.settings import settings
-from api.users.models import Role, User, UserIn
+from api.security.token_cache import token_cache
+from api.users.models import Patient, Role, User, UserIn
 
-password_hash = PasswordHash.recommended()  # hash utility (argon2 hasher)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")  # token dependency
 
 
-def verify_password(input_pwd: str, hashed_pwd: str) -> bool:
+# keeps a reference to fire-and-forget tasks until they are done
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def verify_password(input_pwd: str, hashed_pwd: str) -> tuple[bool, bool]:
     """
-    Returns true if input password and hashed password match
+    Returns (input password and hashed password match,
+             hashed password uses outdated Argon2 parameters)
+    Raises HasherBusy if the hashing pool is saturated
     """
-    return password_hash.verify(input_pwd, hashed_pwd)
+    return await hash_pool.verify(input_pwd, hashed_pwd)
 
 
-def get_password_hash(input_pwd: str) -> str:
+async def get_password_hash(input_pwd: str) -> str:
     """
     Hash the input password
+    Raises HasherBusy if the hashing pool is saturated
     """
-    return password_hash.hash(input_pwd)
+    return await hash_pool.hash(input_pwd)
 
 
-async def get_user(session: AsyncSession, email: str) -> User | None:
+async def get_user(session: AsyncSession, email: str) -> UserCredentials | None:
     """
-    Return the user object linked to the email arg if it exist,
+    Return the login columns of the user linked to the email arg if it exist,
     Return None otherwise
     """
     statement = (
-        select(User).where(User.email == email).options(selectinload(User.patient))
+        select(User.id, User.email, User.role, User.hashed_pw, Patient.thread_id)
+        .outerjoin(Patient, Patient.user_id == User.id)
+        .where(User.email == email)
     )
-    result = await session.execute(statement)
-    user = result.scalar_one_or_none()
-    if not user:
+    row = (await session.execute(statement)).first()
+    if not row:
         return None
-    return user
+    return UserCredentials(*row)
+
+
+async def email_exists(session: AsyncSession, email: str) -> bool:
+    """
+    Return True if a user already uses this email
+    """
+    statement = select(User.id).where(User.email == email).limit(1)
+    return (await session.execute(statement)).scalar_one_or_none() is not None
 
 
 async def authenticate_user(
     session: AsyncSession, email: str, password: str
-) -> User | None:
+) -> UserCredentials | None:
     """
     Verify email & password against db
-    Return the user object if successful, None otherwise
+    Return the user's login columns if successful, None otherwise
     """
     user = await get_user(session, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_pw):
+    valid, needs_rehash = await verify_password(password, user.hashed_pw)
+    if not valid:
         return None
+    if needs_rehash:
+        schedule_rehash(user.id, password, user.hashed_pw)
     return user
 
 
-async def signup_user(session: AsyncSession, signup_data: UserIn) -> str:
+def schedule_rehash(user_id: int, password: str, old_hash: str) -> None:
+    """
+    Rehash a password with the current Argon2 parameters after the response,
+    so cost changes apply without forcing password resets
+    """
+    task = asyncio.create_task(_rehash_password(user_id, password, old_hash))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _rehash_password(user_id: int, password: str, old_hash: str) -> None:
+    # Best effort: if the pool is busy the next login will try again
+    try:
+        new_hash = await get_password_hash(password)
+    except HasherBusy:
+        return
+
+    async with sessionmanager.session() as session:
+        await session.execute(
+            update(User)
+            .where(User.id == user_id, User.hashed_pw == old_hash)
+            .values(hashed_pw=new_hash)
+        )
+        await session.commit()
+
+    metrics.counter("auth.hash.rehashed").inc()
+
+
+async def signup_user(session: AsyncSession, signup_data: UserIn) -> Token:
     """
     Signup method.
     Check for email uniqueness
     Create User object
-    Create a jwt token
+    Create a jwt token and a refresh token
 
-    Return JWT token
+    Return the tokens
     """
     # Check if email already used
-    if await get_user(session, signup_data.email):
+    if await email_exists(session, signup_data.email):
         raise HTTPException(status_code=409, detail="Email already registered.")
 
     try:
@@ -81,7 +132,7 @@ async def signup_user(session: AsyncSession, signup_data: UserIn) -> str:
     except ValueError:
         raise HTTPException(400, "Invalid role.")
 
-    hashed_pwd = get_password_hash(signup_data.password)
+    hashed_pwd = await get_password_hash(signup_data.password)
 
     user = User(
         email=signup_data.email,
@@ -110,8 +161,9 @@ async def signup_user(session: AsyncSession, signup_data: UserIn) -> str:
             "thread_id": str(thread_id),
         }
     )
+    refresh_token = await create_refresh_token(session, user.id)
 
-    return token
+    return Token(access_token=token, token_type="bearer", refresh_token=refresh_token)
 
 
 def create_access_token(data: dict, expires_minutes: int | None = None) -> str:
@@ -127,10 +179,13 @@ def create_access_token(data: dict, expires_minutes: int | None = None) -> str:
         }
     """
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(
         minutes=expires_minutes or settings.ACCESS_TOKEN_EXPIRE_MINUTES
     )
-    to_encode.update({"exp": expire})
+    # iat is kept to the microsecond: a token issued right after a
+    # revocation must not be taken for one issued before it
+    to_encode.update({"exp": expire, "iat": now.timestamp()})
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
     )
@@ -138,10 +193,196 @@ def create_access_token(data: dict, expires_minutes: int | None = None) -> str:
     return encoded_jwt
 
 
-def get_token_data(token: Annotated[str, Depends(oauth2_scheme)]) -> TokenData:
+def _hash_refresh_token(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+def _invalid_refresh_token() -> HTTPException:
+    return HTTPException(
+        status_code=401,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def _prune_refresh_tokens(
+    session: AsyncSession, user_id: int, now: datetime
+) -> None:
+    """
+    Delete the user's expired refresh tokens, and the revoked ones past the
+    reuse detection window. Does not commit
+    """
+    retention = timedelta(days=settings.REFRESH_TOKEN_REVOKED_RETENTION_DAYS)
+    await session.execute(
+        delete(RefreshToken).where(
+            RefreshToken.user_id == user_id,
+            or_(
+                RefreshToken.expires_at <= now,
+                RefreshToken.revoked_at <= now - retention,
+            ),
+        )
+    )
+
+
+async def create_refresh_token(session: AsyncSession, user_id: int) -> str:
+    """
+    Create a refresh token for the user, pruning their old ones
+    Only its hash is stored, the raw token is returned to the client
+    """
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.now(timezone.utc)
+
+    session.add(
+        RefreshToken(
+            user_id=user_id,
+            token_hash=_hash_refresh_token(refresh_token),
+            expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+
+    try:
+        await _prune_refresh_tokens(session, user_id, now)
+        await session.commit()
+    except:
+        await session.rollback()
+        raise
+
+    return refresh_token
+
+
+async def refresh_access_token(session: AsyncSession, refresh_token: str) -> Token:
+    """
+    Exchange a refresh token for a new access token.
+    The presented token is revoked and replaced (rotation), no password
+    hashing is involved: one indexed lookup and a signature.
+
+    Presenting an already rotated token revokes every refresh token of its
+    user, since it was most likely leaked.
+    """
+    now = datetime.now(timezone.utc)
+
+    stmt = (
+        select(
+            RefreshToken.id,
+            RefreshToken.user_id,
+            RefreshToken.expires_at,
+            RefreshToken.revoked_at,
+            User.email,
+            User.role,
+            Patient.thread_id,
+        )
+        .join(User, User.id == RefreshToken.user_id)
+        .outerjoin(Patient, Patient.user_id == User.id)
+        .where(RefreshToken.token_hash == _hash_refresh_token(refresh_token))
+    )
+    row = (await session.execute(stmt)).first()
+
+    if row is None:
+        raise _invalid_refresh_token()
+
+    if row.revoked_at is not None:
+        await revoke_user_refresh_tokens(session, row.user_id)
+        raise _invalid_refresh_token()
+
+    expires_at = row.expires_at
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    if expires_at <= now:
+        raise _invalid_refresh_token()
+
+    # Only one of two concurrent refreshes with the same token can win
+    result = await session.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    if result.rowcount == 0:  # type: ignore
+        await session.rollback()
+        raise _invalid_refresh_token()
+
+    new_refresh_token = await create_refresh_token(session, row.user_id)
+
+    access_token = create_access_token(
+        data={
+            "email": row.email,
+            "user_id": row.user_id,
+            "role": row.role.value,
+            "thread_id": row.thread_id,
+        }
+    )
+
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        refresh_token=new_refresh_token,
+    )
+
+
+async def revoke_refresh_token(session: AsyncSession, refresh_token: str) -> None:
+    """
+    Revoke a single refresh token (logout)
+    """
+    await session.execute(
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == _hash_refresh_token(refresh_token),
+            RefreshToken.revoked_at.is_(None),
+        )
+        .values(revoked_at=datetime.now(timezone.utc))
+    )
+    await session.commit()
+
+
+async def revoke_user_refresh_tokens(session: AsyncSession, user_id: int) -> None:
+    """
+    Revoke every active refresh token of a user, and every access token
+    issued to them so far (see get_token_data)
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        await session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=now)
+        )
+        await session.execute(
+            update(User).where(User.id == user_id).values(tokens_valid_after=now)
+        )
+        await session.commit()
+    except:
+        await session.rollback()
+        raise
+    token_cache.invalidate_user(user_id)
+
+
+async def _token_revoked(user_id: int, issued_at: float) -> bool:
+    """
+    True if the user's tokens issued at `issued_at` were revoked
+    """
+    async with sessionmanager.session() as session:
+        valid_after = (
+            await session.execute(
+                select(User.tokens_valid_after).where(User.id == user_id)
+            )
+        ).scalar_one_or_none()
+    if valid_after is None:
+        return False
+    if valid_after.tzinfo is None:
+        valid_after = valid_after.replace(tzinfo=timezone.utc)
+    return issued_at < valid_after.timestamp()
+
+
+async def get_token_data(token: Annotated[str, Depends(oauth2_scheme)]) -> TokenData:
     """
     Dependency to get user object based on JWT token
+    Tokens seen recently are served from the decoded token cache, the
+    others are checked against the user's revocations first
     """
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    epoch = token_cache.epoch
+
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -159,6 +400,14 @@ def get_token_data(token: Annotated[str, Depends(oauth2_scheme)]) -> TokenData:
             thread_id=thread_id,
         )
 
+        # Tokens issued before iat was added count as the oldest ones
+        if await _token_revoked(token_data.user_id, payload.get("iat", 0)):
+            metrics.counter("auth.token.revoked").inc()
+            raise InvalidTokenError("Token revoked")
+
+        if payload.get("exp") is not None:
+            token_cache.put(token, token_data, exp=payload["exp"], epoch=epoch)
+
         return token_data
 
     except InvalidTokenError:
@@ -1,3 +1,6 @@
+from typing import Literal
+
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -5,6 +8,32 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     SECRET_KEY: str = "dev-secret-key"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 14
+    # Revoked refresh tokens are kept this long to detect their reuse, then
+    # deleted with the expired ones
+    REFRESH_TOKEN_REVOKED_RETENTION_DAYS: int = 2
+
+    # Argon2 cost, see `python -m api.security.calibrate`
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536  # KiB
+    ARGON2_PARALLELISM: int = 4
+
+    # Argon2 worker pool
+    HASH_POOL_KIND: Literal["thread", "process"] = "thread"
+    HASH_POOL_WORKERS: int = 2
+    HASH_POOL_MAX_QUEUE: int = 16
+
+    # Login throttling (token buckets). A bucket needs room for one attempt
+    # and a refill rate: there is no "disabled" value
+    LOGIN_EMAIL_BURST: int = Field(default=5, ge=1)
+    LOGIN_EMAIL_PER_MINUTE: float = Field(default=5, gt=0)
+    LOGIN_IP_BURST: int = Field(default=20, ge=1)
+    LOGIN_IP_PER_MINUTE: float = Field(default=30, gt=0)
+    LOGIN_THROTTLE_MAX_BUCKETS: int = 100_000
+
+    # Decoded access token cache
+    TOKEN_CACHE_SIZE: int = 10_000
+    TOKEN_CACHE_TTL_SECONDS: int = 300
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
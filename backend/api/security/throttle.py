@@ -0,0 +1,101 @@
+"""
+Login throttling.
+
+Each email and each client IP gets a token bucket. A login attempt takes a
+token before any password is hashed, so credential stuffing is answered with
+a cheap 429 instead of burning Argon2 CPU.
+"""
+
+import math
+import time
+from collections import OrderedDict
+
+from api.core.metrics import metrics
+from api.security.settings import settings
+
+
+class TokenBucketStore:
+    """
+    In-memory token buckets keyed by an arbitrary string.
+
+    A bucket left alone for capacity / refill_rate seconds is full again, so
+    it is dropped: a new bucket would be identical. Buckets are kept in LRU
+    order, which makes that eviction a scan from the oldest end only.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float, max_buckets: int):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.max_buckets = max_buckets
+        self.idle_seconds = capacity / refill_per_second
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, key: str) -> float:
+        """
+        Take one token from the key's bucket.
+        Return 0 if allowed, otherwise the seconds until a token is available
+        """
+        now = time.monotonic()
+        self._evict(now)
+
+        tokens, updated_at = self._buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            return 0.0
+
+        self._buckets[key] = (tokens, now)
+        return (1 - tokens) / self.refill_per_second
+
+    def _evict(self, now: float) -> None:
+        while self._buckets:
+            key, (_, updated_at) = next(iter(self._buckets.items()))
+            if (
+                len(self._buckets) <= self.max_buckets
+                and now - updated_at < self.idle_seconds
+            ):
+                break
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float, *args: object) -> None:
+        super().__init__(*args)
+        self.retry_after = retry_after
+
+
+email_buckets = TokenBucketStore(
+    capacity=settings.LOGIN_EMAIL_BURST,
+    refill_per_second=settings.LOGIN_EMAIL_PER_MINUTE / 60,
+    max_buckets=settings.LOGIN_THROTTLE_MAX_BUCKETS,
+)
+
+ip_buckets = TokenBucketStore(
+    capacity=settings.LOGIN_IP_BURST,
+    refill_per_second=settings.LOGIN_IP_PER_MINUTE / 60,
+    max_buckets=settings.LOGIN_THROTTLE_MAX_BUCKETS,
+)
+
+
+def check_login_throttle(email: str, client_ip: str | None) -> None:
+    """
+    Raise LoginThrottled if this IP or this email made too many attempts
+    """
+    if client_ip is not None:
+        wait = ip_buckets.take(client_ip)
+        if wait:
+            metrics.counter("auth.throttle.ip").inc()
+            raise LoginThrottled(wait, "Too many login attempts")
+
+    wait = email_buckets.take(email.strip().lower())
+    if wait:
+        metrics.counter("auth.throttle.email").inc()
+        raise LoginThrottled(wait, "Too many login attempts")
+
+
+def retry_after_header(retry_after: float) -> dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(retry_after)))}
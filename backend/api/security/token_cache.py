@@ -0,0 +1,107 @@
+"""
+Cache of decoded access tokens.
+
+The dashboard polls with the same bearer token many times a minute. Caching
+the decoded TokenData skips jwt.decode and model validation for those
+repeats. Entries never outlive the token's own exp claim.
+
+Revoking a user's tokens drops their entries in this process; other worker
+processes keep serving them for at most TOKEN_CACHE_TTL_SECONDS.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+
+from api.core.metrics import metrics
+from api.security.models import TokenData
+from api.security.settings import settings
+
+
+def _key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    Bounded LRU of token hash -> (TokenData, expires_at)
+    """
+
+    def __init__(self, max_size: int, max_ttl: float):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict[str, tuple[TokenData, float]] = OrderedDict()
+        self._by_user: dict[int, set[str]] = {}
+        # Incremented by every invalidation: a token checked before one
+        # happened is not cached, it may have been revoked meanwhile
+        self.epoch = 0
+
+    def get(self, token: str) -> TokenData | None:
+        key = _key(token)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            metrics.counter("auth.token_cache.miss").inc()
+            return None
+
+        token_data, expires_at = entry
+        if expires_at <= time.time():
+            self._remove(key)
+            metrics.counter("auth.token_cache.miss").inc()
+            return None
+
+        self._entries.move_to_end(key)
+        metrics.counter("auth.token_cache.hit").inc()
+        return token_data
+
+    def put(
+        self, token: str, token_data: TokenData, exp: float, epoch: int | None = None
+    ) -> None:
+        """
+        exp is the token's expiry as a unix timestamp, epoch the value of
+        self.epoch when the token was checked
+        """
+        if self.max_size <= 0 or (epoch is not None and epoch != self.epoch):
+            return
+
+        expires_at = min(exp, time.time() + self.max_ttl)
+        key = _key(token)
+
+        self._entries[key] = (token_data, expires_at)
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(token_data.user_id, set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """
+        Drop every cached token of a user, they will be decoded again
+        on their next use
+        """
+        self.epoch += 1
+        for key in self._by_user.pop(user_id, set()):
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        user_id = entry[0].user_id
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+
+token_cache = TokenCache(
+    max_size=settings.TOKEN_CACHE_SIZE,
+    max_ttl=settings.TOKEN_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,126 @@
+"""
+Therapist -> patient access control cache.
+
+Every therapist endpoint checks that the therapist has an accepted link to
+the patient, and several then need the patient's Backboard identifiers.
+Both come from one query, cached here per (therapist, patient).
+
+Only accepted links are cached. accept_friend_request and
+decline_friend_request invalidate the pair through the link change hooks
+of api.users.service; the TTL bounds how long another worker process can
+keep serving a link that was declined elsewhere.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.core.metrics import metrics
+from api.therapists.settings import settings
+from api.users.models import LinkStatus, Patient, PatientLink
+from api.users.service import on_link_change
+
+
+@dataclass(frozen=True)
+class PatientAccess:
+    therapist_id: int
+    patient_id: int
+    # None if the patient has no Backboard resources yet
+    assistant_id: str | None
+    thread_id: str | None
+    report_thread_id: str | None
+
+
+class AccessCache:
+    """
+    Bounded LRU of (therapist_id, patient_id) -> (PatientAccess, expires_at)
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[int, int], tuple[PatientAccess, float]] = (
+            OrderedDict()
+        )
+
+    def get(self, therapist_id: int, patient_id: int) -> PatientAccess | None:
+        key = (therapist_id, patient_id)
+        entry = self._entries.get(key)
+
+        if entry is None or entry[1] <= time.monotonic():
+            self._entries.pop(key, None)
+            metrics.counter("therapists.access_cache.miss").inc()
+            return None
+
+        self._entries.move_to_end(key)
+        metrics.counter("therapists.access_cache.hit").inc()
+        return entry[0]
+
+    def put(self, access: PatientAccess) -> None:
+        if self.max_size <= 0:
+            return
+
+        key = (access.therapist_id, access.patient_id)
+        self._entries[key] = (access, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, therapist_id: int, patient_id: int) -> None:
+        self._entries.pop((therapist_id, patient_id), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+access_cache = AccessCache(
+    max_size=settings.ACCESS_CACHE_SIZE,
+    ttl=settings.ACCESS_CACHE_TTL_SECONDS,
+)
+
+
+@on_link_change
+def _invalidate_link(therapist_id: int, patient_id: int) -> None:
+    access_cache.invalidate(therapist_id, patient_id)
+
+
+async def get_patient_access(
+    session: AsyncSession, therapist_id: int, patient_id: int
+) -> PatientAccess | None:
+    """
+    The therapist's access to the patient, None if they have no accepted link
+    """
+    access = access_cache.get(therapist_id, patient_id)
+    if access is not None:
+        return access
+
+    stmt = (
+        select(Patient.assistant_id, Patient.thread_id, Patient.report_thread_id)
+        .select_from(PatientLink)
+        .outerjoin(Patient, Patient.user_id == PatientLink.patient_id)
+        .where(
+            PatientLink.therapist_id == therapist_id,
+            PatientLink.patient_id == patient_id,
+            PatientLink.link_status == LinkStatus.ACCEPTED,
+        )
+    )
+    row = (await session.execute(stmt)).one_or_none()
+    if row is None:
+        return None
+
+    access = PatientAccess(
+        therapist_id=therapist_id,
+        patient_id=patient_id,
+        assistant_id=row.assistant_id,
+        thread_id=row.thread_id,
+        report_thread_id=row.report_thread_id,
+    )
+    access_cache.put(access)
+    return access
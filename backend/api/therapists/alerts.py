@@ -0,0 +1,194 @@
+"""
+Alert delivery to therapists.
+
+Alerts are pushed to the therapist's open GET /therapists/alerts/stream
+connections as soon as they are committed, so the dashboard doesn't need to
+poll GET /therapists/alerts. Chat streams don't write alerts themselves:
+they append to the alert outbox (api.therapists.outbox), whose drainer
+applies and publishes them.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.chats.crisis import RISK_ORDER
+from api.core.metrics import metrics
+from api.core.pubsub import Hub
+from api.core.versions import alerts_key, bump_version
+from api.therapists.models import Alert, AlertMessage
+from api.therapists.search import alert_title, index_document
+from api.therapists.settings import settings
+from api.therapists.stats import record_alert_stats
+
+# topic: therapist_id
+alert_hub = Hub("alerts.hub", buffer_size=settings.ALERT_STREAM_BUFFER)
+
+
+def publish_alert(alert: AlertMessage) -> None:
+    alert_hub.publish(alert.therapist_id, alert.model_dump(mode="json"))
+
+
+async def apply_alert(
+    session: AsyncSession,
+    therapist_id: int,
+    patient_id: int,
+    risk_level: str,
+    cause: str,
+    provisional: bool = False,
+    now: datetime | None = None,
+) -> Alert:
+    """
+    Apply an alert raised at `now` to the session (patient_stats, the
+    alerts version and the search index included), without committing.
+
+    - A confirmed alert takes over the patient's latest provisional alert
+      (raised by the crisis prefilter) if it is recent enough, at the
+      higher of the two levels. A prefilter hit that was coalesced into an
+      open alert is taken over the same way, so the message is counted once.
+    - Otherwise an alert repeating an open one (same patient and risk level,
+      seen within the coalescing window) only bumps its occurrences and
+      last_seen_at. A higher risk level is a different key, so an
+      escalation always creates a fresh alert.
+    """
+    now = now or datetime.now(timezone.utc)
+    alert = None
+
+    # Level counted by patient_stats for this alert, and level it no longer
+    # counts (when a provisional alert is confirmed at another level)
+    added = removed = None
+
+    if not provisional:
+        alert = await _unconfirmed_alert(session, therapist_id, patient_id, now)
+        if alert is not None:
+            alert.unconfirmed_at = None
+            if not alert.is_provisional and _rank(risk_level) > _rank(alert.risk_level):
+                # The prefilter hit was coalesced into an open alert of a
+                # lower level: it is counted by the escalation instead
+                alert.occurrences -= 1
+                alert = None
+
+        if alert is not None:
+            # Confirmation never lowers the level the prefilter raised; the
+            # crisis language it matched is kept next to the model's cause
+            if _rank(alert.risk_level) > _rank(risk_level):
+                metrics.counter("alerts.reconcile.kept_level").inc()
+                risk_level = alert.risk_level
+                cause = f"{cause}\n{alert.cause}"
+            if alert.is_provisional:
+                added, removed = risk_level, alert.risk_level
+            alert.risk_level = risk_level
+            alert.cause = cause
+            alert.is_provisional = False
+            alert.last_seen_at = now
+            await _index_alert(session, alert)
+
+    if alert is None:
+        alert = await _open_alert(session, therapist_id, patient_id, risk_level, now)
+        if alert is not None:
+            alert.occurrences += 1
+            alert.last_seen_at = now
+            if provisional:
+                # Taken over by the model's alert for the same message
+                alert.unconfirmed_at = now
+            metrics.counter("alerts.coalesced").inc()
+
+    if alert is None:
+        alert = Alert(
+            therapist_id=therapist_id,
+            patient_id=patient_id,
+            risk_level=risk_level,
+            cause=cause,
+            is_provisional=provisional,
+            created_at=now,
+            last_seen_at=now,
+        )
+        session.add(alert)
+        await session.flush()
+        await _index_alert(session, alert)
+        added = risk_level
+
+    await record_alert_stats(
+        session, therapist_id, patient_id, now, added=added, removed=removed
+    )
+    await bump_version(session, alerts_key(therapist_id))
+
+    return alert
+
+
+def _rank(risk_level: str) -> int:
+    return RISK_ORDER.get(risk_level, -1)
+
+
+async def _index_alert(session: AsyncSession, alert: Alert) -> None:
+    await index_document(
+        session,
+        "alert",
+        alert.id,
+        therapist_id=alert.therapist_id,
+        patient_id=alert.patient_id,
+        title=alert_title(alert.risk_level),
+        body=alert.cause,
+        created_at=alert.created_at,
+    )
+
+
+def to_alert_message(alert: Alert) -> AlertMessage:
+    return AlertMessage(
+        id=alert.id,
+        therapist_id=alert.therapist_id,
+        patient_id=alert.patient_id,
+        risk_level=alert.risk_level,
+        cause=alert.cause,
+        is_provisional=alert.is_provisional,
+        occurrences=alert.occurrences,
+        created_at=alert.created_at,
+        last_seen_at=alert.last_seen_at,
+    )
+
+
+async def _unconfirmed_alert(
+    session: AsyncSession, therapist_id: int, patient_id: int, now: datetime
+) -> Alert | None:
+    """
+    The patient's latest alert holding a recent prefilter hit: a provisional
+    alert, or an open alert a provisional one was coalesced into
+    """
+    cutoff = now - timedelta(seconds=settings.ALERT_RECONCILE_SECONDS)
+    stmt = (
+        select(Alert)
+        .where(
+            Alert.therapist_id == therapist_id,
+            Alert.patient_id == patient_id,
+            or_(
+                and_(Alert.is_provisional.is_(True), Alert.created_at >= cutoff),
+                Alert.unconfirmed_at >= cutoff,
+            ),
+        )
+        .order_by(func.coalesce(Alert.unconfirmed_at, Alert.created_at).desc())
+        .limit(1)
+    )
+    return (await session.execute(stmt)).scalar_one_or_none()
+
+
+async def _open_alert(
+    session: AsyncSession,
+    therapist_id: int,
+    patient_id: int,
+    risk_level: str,
+    now: datetime,
+) -> Alert | None:
+    cutoff = now - timedelta(seconds=settings.ALERT_COALESCE_SECONDS)
+    stmt = (
+        select(Alert)
+        .where(
+            Alert.therapist_id == therapist_id,
+            Alert.patient_id == patient_id,
+            Alert.risk_level == risk_level,
+            Alert.last_seen_at >= cutoff,
+        )
+        .order_by(Alert.last_seen_at.desc())
+        .limit(1)
+    )
+    return (await session.execute(stmt)).scalar_one_or_none()
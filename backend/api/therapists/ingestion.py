@@ -0,0 +1,189 @@
+"""
+Background ingestion of patient notes.
+
+Uploading a note no longer keeps the request open while Backboard receives
+and indexes the document: the endpoint stores the file under
+NOTE_STORAGE_DIR, inserts the PatientNote as pending with a notes.ingest
+job (api.core.jobs) and returns. The job pushes the note to the patient's
+assistant, at most NOTE_INGEST_CONCURRENCY at a time per worker process;
+failed uploads are retried by the job queue with exponential backoff, and
+the note is marked failed after the last attempt. Every status change
+bumps the notes list version.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from backboard import BackboardClient
+from backboard.exceptions import BackboardValidationError
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.config import BACKBOARD_API_KEY
+from api.core.db import sessionmanager
+from api.core.jobs import JobContext, jobs
+from api.core.metrics import metrics
+from api.core.versions import bump_version, notes_key
+from api.therapists.access import get_patient_access
+from api.therapists.models import NoteStatus, PatientNote
+from api.therapists.settings import settings
+from api.therapists.search import index_document
+from api.therapists.storage import extract_text, remove_stored_file
+
+NOTE_JOB = "notes.ingest"
+
+# Errors another attempt can't fix: the file is rejected as is (unsupported
+# type, ValueError), is gone, or the therapist lost access to the patient
+PERMANENT_ERRORS = (
+    BackboardValidationError,
+    ValueError,
+    FileNotFoundError,
+    PermissionError,
+)
+
+
+def _note_status(document: Any) -> tuple[NoteStatus, str | None]:
+    """
+    Note status matching the status of a Backboard document
+    """
+    if document.status == "indexed":
+        return NoteStatus.INDEXED, None
+    if document.status in ("error", "failed"):
+        return NoteStatus.FAILED, document.status_message or "Indexing failed"
+    return NoteStatus.PROCESSING, None
+
+
+async def refresh_note_status(session: AsyncSession, note: PatientNote) -> None:
+    """
+    Ask Backboard whether a processing note has been indexed.
+    Commits if the status changed
+    """
+    if note.status != NoteStatus.PROCESSING or note.document_id is None:
+        return
+
+    async with BackboardClient(api_key=BACKBOARD_API_KEY) as client:  # type: ignore
+        document = await client.get_document_status(note.document_id)
+
+    status, error = _note_status(document)
+    if status == note.status:
+        return
+
+    try:
+        note.status = status
+        note.error = error
+        note.updated_at = datetime.now(timezone.utc)
+        await bump_version(session, notes_key(note.therapist_id, note.patient_id))
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    metrics.counter(f"notes.ingest.{status.value}").inc()
+
+
+async def _update(
+    note: PatientNote, search_text: str | None = None, **values: Any
+) -> None:
+    """
+    Update the note, and index search_text as its text if given
+    """
+    async with sessionmanager.session() as session:
+        await session.execute(
+            update(PatientNote)
+            .where(PatientNote.id == note.id)
+            .values(updated_at=datetime.now(timezone.utc), **values)
+        )
+        if search_text is not None:
+            await index_document(
+                session,
+                "note",
+                note.id,
+                therapist_id=note.therapist_id,
+                patient_id=note.patient_id,
+                title=note.file_name,
+                body=search_text,
+                created_at=note.created_at,
+            )
+        await bump_version(session, notes_key(note.therapist_id, note.patient_id))
+        await session.commit()
+
+
+async def _fail(note: PatientNote, error: str) -> None:
+    await _update(note, status=NoteStatus.FAILED, error=error, stored_path=None)
+    remove_stored_file(note.stored_path)
+    metrics.counter("notes.ingest.failed").inc()
+
+
+async def _upload(note: PatientNote) -> Any:
+    async with sessionmanager.session() as session:
+        access = await get_patient_access(session, note.therapist_id, note.patient_id)
+    if access is None or access.assistant_id is None:
+        raise PermissionError("Therapist no longer has access to this patient")
+
+    with metrics.timer("notes.ingest.upload").time():
+        async with BackboardClient(api_key=BACKBOARD_API_KEY) as client:  # type: ignore
+            return await client.upload_document_to_assistant(
+                assistant_id=access.assistant_id,
+                file_path=Path(note.stored_path or ""),
+            )
+
+
+async def enqueue_note(session: AsyncSession, note_id: int) -> None:
+    """
+    Queue the upload of a pending note. Does not commit
+    """
+    await jobs.enqueue(
+        session, NOTE_JOB, {"note_id": note_id}, key=f"{NOTE_JOB}:{note_id}"
+    )
+
+
+@jobs.task(
+    NOTE_JOB,
+    max_attempts=settings.NOTE_INGEST_MAX_ATTEMPTS,
+    retry_seconds=settings.NOTE_INGEST_RETRY_SECONDS,
+    concurrency=settings.NOTE_INGEST_CONCURRENCY,
+)
+async def ingest_note(job: JobContext) -> None:
+    """
+    Upload one note to the patient's assistant
+    """
+    async with sessionmanager.session() as session:
+        note = await session.get(PatientNote, job.payload["note_id"])
+    if note is None or note.status not in (NoteStatus.PENDING, NoteStatus.UPLOADING):
+        return
+
+    await _update(note, status=NoteStatus.UPLOADING, attempts=job.attempt)
+    try:
+        document = await _upload(note)
+    except asyncio.CancelledError:
+        # Shutting down: the job is queued again
+        await _update(note, status=NoteStatus.PENDING)
+        raise
+    except PERMANENT_ERRORS as exc:
+        await _fail(note, str(exc) or type(exc).__name__)
+        return
+    except Exception as exc:
+        error = str(exc) or type(exc).__name__
+        if job.last_attempt:
+            await _fail(note, error)
+        else:
+            await _update(note, status=NoteStatus.PENDING, error=error)
+            metrics.counter("notes.ingest.retried").inc()
+        raise
+
+    # The file is deleted once uploaded, its text is indexed now
+    search_text = await asyncio.to_thread(
+        extract_text, Path(note.stored_path or ""), settings.SEARCH_NOTE_MAX_CHARS
+    )
+    status, error = _note_status(document)
+    await _update(
+        note,
+        search_text=search_text,
+        status=status,
+        error=error,
+        document_id=str(document.document_id),
+        stored_path=None,
+    )
+    remove_stored_file(note.stored_path)
+    metrics.counter(f"notes.ingest.{status.value}").inc()
@@ -1,7 +1,11 @@
-from datetime import datetime, timezone
+import re
+from datetime import date, datetime, timezone
+from enum import Enum
+from typing import Literal
 
 from pydantic import BaseModel
-from sqlalchemy import DateTime, ForeignKey
+from sqlalchemy import Date, DateTime, ForeignKey, Index
+from sqlalchemy import Enum as SAEnum
 from sqlalchemy.orm import Mapped, mapped_column
 
 from api import Base
@@ -16,6 +20,14 @@ class ReportMessage(BaseModel):
 
 class Report(Base):
     __tablename__ = "reports"
+    __table_args__ = (
+        Index(
+            "ix_reports_therapist_patient_created",
+            "therapist_id",
+            "patient_id",
+            "created_at",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -29,7 +41,11 @@ class Report(Base):
         nullable=False,
     )
 
-    content: Mapped[str] = mapped_column(nullable=False)
+    # Reports are kilobytes long: the text is only loaded when asked for
+    # (undefer), listings use the excerpt
+    content: Mapped[str] = mapped_column(nullable=False, deferred=True)
+
+    excerpt: Mapped[str | None] = mapped_column()
 
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
@@ -37,16 +53,62 @@ class Report(Base):
     )
 
 
+EXCERPT_LENGTH = 280
+_WHITESPACE = re.compile(r"\s+")
+
+
+def report_excerpt(content: str, length: int = EXCERPT_LENGTH) -> str:
+    """
+    Start of the report on one line, cut at a word boundary
+    """
+    text = _WHITESPACE.sub(" ", content).strip()
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(" ", 1)[0] or text[:length]
+    return cut + "…"
+
+
+class NoteStatus(str, Enum):
+    PENDING = "pending"  # stored on disk, waiting for its ingestion job
+    UPLOADING = "uploading"
+    PROCESSING = "processing"  # uploaded, Backboard is indexing it
+    INDEXED = "indexed"
+    FAILED = "failed"
+
+
 class PatientNoteMessage(BaseModel):
     id: int
     patient_id: int
     therapist_id: int
     file_name: str
+    status: NoteStatus = NoteStatus.INDEXED
+    error: str | None = None
     created_at: datetime
 
 
+class NoteUploadResult(BaseModel):
+    """
+    Outcome of one file of a bulk upload: accepted (note is the queued
+    note), duplicate (note is the existing one) or rejected (see error)
+    """
+
+    file_name: str
+    result: Literal["accepted", "duplicate", "rejected"]
+    note: PatientNoteMessage | None = None
+    error: str | None = None
+
+
 class PatientNote(Base):
     __tablename__ = "patient_notes"
+    __table_args__ = (
+        Index(
+            "ix_patient_notes_therapist_patient_created",
+            "therapist_id",
+            "patient_id",
+            "created_at",
+        ),
+        Index("ix_patient_notes_patient_hash", "patient_id", "content_hash"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -62,11 +124,34 @@ class PatientNote(Base):
 
     file_name: Mapped[str] = mapped_column(nullable=False)
 
+    # sha256 of the file, to skip notes the patient's assistant already has
+    # (unknown for notes uploaded before it was recorded)
+    content_hash: Mapped[str | None] = mapped_column()
+
+    # Ingestion into the patient's assistant (api.therapists.ingestion)
+    status: Mapped[NoteStatus] = mapped_column(
+        SAEnum(NoteStatus, name="note_status_enum"),
+        default=NoteStatus.PENDING,
+        server_default=NoteStatus.INDEXED.name,
+    )
+
+    # Last ingestion error
+    error: Mapped[str | None] = mapped_column()
+
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    # Local copy of the file until it is uploaded
+    stored_path: Mapped[str | None] = mapped_column()
+
+    document_id: Mapped[str | None] = mapped_column()
+
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
     )
 
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
 
 class Document(Base):
     __tablename__ = "documents"
@@ -98,11 +183,65 @@ class AlertMessage(BaseModel):
     patient_name: str | None = None
     risk_level: str
     cause: str
+    is_provisional: bool = False
+    occurrences: int = 1
+    created_at: datetime
+    last_seen_at: datetime | None = None
+
+
+class ReportSummary(BaseModel):
+    id: int
+    created_at: datetime
+    excerpt: str | None = None
+
+
+SearchKind = Literal["report", "alert", "note"]
+
+
+class SearchHit(BaseModel):
+    kind: SearchKind
+    # Id of the report, alert or note
+    id: int
+    patient_id: int
+    title: str
+    # Matched terms are wrapped in <mark>, the rest is HTML-escaped
+    snippet: str
     created_at: datetime
 
 
+class DashboardPatient(BaseModel):
+    id: int
+    email: str
+    full_name: str
+    phone_number: str
+    # Number of alerts per risk level (low, medium, high)
+    alert_counts: dict[str, int]
+    last_alert_at: datetime | None = None
+    last_report_at: datetime | None = None
+    message_count: int = 0
+    last_message_at: datetime | None = None
+    latest_alert: AlertMessage | None = None
+    latest_report: ReportSummary | None = None
+
+
 class Alert(Base):
     __tablename__ = "alerts"
+    __table_args__ = (
+        Index("ix_alerts_therapist_created", "therapist_id", "created_at"),
+        Index(
+            "ix_alerts_therapist_patient_created",
+            "therapist_id",
+            "patient_id",
+            "created_at",
+        ),
+        Index(
+            "ix_alerts_open",
+            "therapist_id",
+            "patient_id",
+            "risk_level",
+            "last_seen_at",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -120,7 +259,93 @@ class Alert(Base):
 
     cause: Mapped[str] = mapped_column(nullable=False)  # Description of what triggered the alert
 
+    # Raised by the local crisis prefilter, not yet confirmed by the model
+    is_provisional: Mapped[bool] = mapped_column(default=False, server_default="0")
+
+    # Repeats of the same alert within the coalescing window
+    occurrences: Mapped[int] = mapped_column(default=1, server_default="1")
+
+    # Set when a prefilter hit is coalesced into this alert, until the
+    # model's alert for the same message takes it over
+    unconfirmed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=lambda: datetime.now(timezone.utc),
     )
+
+    last_seen_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+    )
+
+
+class AlertOutboxState(Base):
+    """
+    Last outbox entry applied to the alerts table, per outbox file.
+    Updated in the same transaction as the alerts, so a replay after a crash
+    skips entries that were already applied.
+    """
+
+    __tablename__ = "alert_outbox_state"
+
+    outbox_id: Mapped[str] = mapped_column(primary_key=True)
+
+    applied_through: Mapped[int] = mapped_column(nullable=False, default=0)
+
+
+class PatientStats(Base):
+    """
+    Per-patient activity counters, kept up to date by the writers (alerts,
+    reports, chat messages) so the dashboard can sort and filter the caseload
+    without scanning alerts and reports.
+    Rebuilt from the source tables with `python -m api.therapists.stats rebuild`.
+    """
+
+    __tablename__ = "patient_stats"
+
+    therapist_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    patient_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    # Number of alerts per risk level
+    low_alerts: Mapped[int] = mapped_column(default=0, server_default="0")
+    medium_alerts: Mapped[int] = mapped_column(default=0, server_default="0")
+    high_alerts: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    last_alert_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    last_report_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+    # Messages sent by the patient while linked to the therapist
+    message_count: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    last_message_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+
+
+class ScheduledRun(Base):
+    """
+    One run of a scheduled task per day. The worker process that inserts
+    the row runs the task, the others skip that day
+    """
+
+    __tablename__ = "scheduled_runs"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+
+    run_on: Mapped[date] = mapped_column(Date, primary_key=True)
+
+    started_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+    )
+
+    # Reports generated, failed (counted by the jobs)
+    done: Mapped[int] = mapped_column(default=0, server_default="0")
+    failed: Mapped[int] = mapped_column(default=0, server_default="0")
@@ -0,0 +1,329 @@
+"""
+Durable alert outbox.
+
+Alerts raised while a chat response is streaming (crisis prefilter matches
+and guardian_check calls) are not written to the alerts table inline.
+They are appended to a small SQLite file kept next to the database, in WAL
+mode with synchronous=FULL: an append is on disk when it returns, so the
+alert survives a crash of the worker, and it never waits on the main
+database's write lock.
+
+A background drainer applies the entries to the alerts table in batches
+(provisional reconciliation and coalescing included) and publishes them.
+The id of the last applied entry is stored in alert_outbox_state in the same
+transaction as the alerts, and entries are deleted from the outbox only
+after that commit, so every entry is applied exactly once, even when the
+drainer is interrupted halfway.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from api.core.db import sessionmanager
+from api.core.metrics import metrics
+from api.therapists.alerts import apply_alert, publish_alert, to_alert_message
+from api.therapists.models import AlertMessage, AlertOutboxState
+from api.therapists.settings import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS dead_entries (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+MAX_RETRY_SECONDS = 30.0
+
+Row = tuple[int, str]
+
+
+class AlertOutbox:
+    def __init__(
+        self, path: str, batch_size: int, poll_seconds: float, max_attempts: int
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max_attempts
+        # Identifies this outbox file. Entry ids restart if the file is
+        # recreated, so the applied watermark is kept per outbox_id.
+        self.outbox_id = ""
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    # -- outbox file (blocking, runs in a thread) --
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(_SCHEMA)
+            conn.execute(
+                "INSERT OR IGNORE INTO meta (key, value) VALUES ('outbox_id', ?)",
+                (uuid.uuid4().hex,),
+            )
+            self.outbox_id = conn.execute(
+                "SELECT value FROM meta WHERE key = 'outbox_id'"
+            ).fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _append(self, payload: str) -> None:
+        self._connect().execute("INSERT INTO entries (payload) VALUES (?)", (payload,))
+
+    def _read(self, limit: int) -> list[Row]:
+        return self._connect().execute(
+            "SELECT id, payload FROM entries ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+
+    def _delete_through(self, entry_id: int) -> None:
+        self._connect().execute("DELETE FROM entries WHERE id <= ?", (entry_id,))
+
+    def _record_failure(self, entry_id: int, error: str) -> bool:
+        """
+        Count a failed attempt and move the entry to the end of the outbox
+        (under a new id, above the applied watermark), so the entries after
+        it are not held back. Return True if it was moved to dead_entries
+        instead because it reached max_attempts
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "DELETE FROM entries WHERE id = ? RETURNING attempts, payload",
+                (entry_id,),
+            ).fetchone()
+            buried = row is not None and row[0] + 1 >= self.max_attempts
+            if buried:
+                conn.execute(
+                    "INSERT OR REPLACE INTO dead_entries (id, payload, error) "
+                    "VALUES (?, ?, ?)",
+                    (entry_id, row[1], error),
+                )
+            elif row is not None:
+                conn.execute(
+                    "INSERT INTO entries (payload, attempts) VALUES (?, ?)",
+                    (row[1], row[0] + 1),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return buried
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        def locked() -> Any:
+            with self._lock:
+                return fn(*args)
+
+        return await asyncio.to_thread(locked)
+
+    # -- writers --
+
+    async def append(
+        self,
+        therapist_id: int,
+        patient_id: int,
+        risk_level: str,
+        cause: str,
+        provisional: bool = False,
+    ) -> AlertMessage:
+        """
+        Durably queue an alert for the drainer.
+        Return the alert as it will be stored if it doesn't merge into an
+        existing one (it has no id yet)
+        """
+        raised_at = datetime.now(timezone.utc)
+        entry = {
+            "therapist_id": therapist_id,
+            "patient_id": patient_id,
+            "risk_level": risk_level,
+            "cause": cause,
+            "provisional": provisional,
+            "raised_at": raised_at.isoformat(),
+        }
+
+        with metrics.timer("alerts.outbox.append").time():
+            await self._call(self._append, json.dumps(entry))
+        metrics.counter("alerts.outbox.appended").inc()
+        self._wakeup.set()
+
+        return AlertMessage(
+            therapist_id=therapist_id,
+            patient_id=patient_id,
+            risk_level=risk_level,
+            cause=cause,
+            is_provisional=provisional,
+            created_at=raised_at,
+            last_seen_at=raised_at,
+        )
+
+    # -- drainer --
+
+    async def _apply(self, rows: list[Row]) -> None:
+        """
+        Apply the entries in one transaction, then publish and delete them
+        """
+        last_id = rows[-1][0]
+
+        async with sessionmanager.session() as session:
+            state = await session.get(AlertOutboxState, self.outbox_id)
+            if state is None:
+                state = AlertOutboxState(outbox_id=self.outbox_id, applied_through=0)
+                session.add(state)
+
+            # An entry coalescing into one applied earlier in the batch
+            # returns the same Alert, publish it once with its final state
+            alerts = {}
+            for entry_id, payload in rows:
+                if entry_id <= state.applied_through:
+                    continue
+                entry = json.loads(payload)
+                alert = await apply_alert(
+                    session,
+                    therapist_id=entry["therapist_id"],
+                    patient_id=entry["patient_id"],
+                    risk_level=entry["risk_level"],
+                    cause=entry["cause"],
+                    provisional=entry["provisional"],
+                    now=datetime.fromisoformat(entry["raised_at"]),
+                )
+                alerts[id(alert)] = alert
+
+            state.applied_through = max(state.applied_through, last_id)
+            await session.commit()
+            messages = [to_alert_message(alert) for alert in alerts.values()]
+
+        for message in messages:
+            publish_alert(message)
+        metrics.counter("alerts.outbox.applied").inc(len(rows))
+
+        await self._call(self._delete_through, last_id)
+
+    async def drain(self) -> int:
+        """
+        Apply up to batch_size entries, return how many were taken off the
+        outbox.
+
+        If the batch fails, entries are applied one by one. An entry failing
+        on its own is moved behind the others and retried on the following
+        runs, until it is moved to dead_entries after max_attempts: it never
+        holds back the alerts after it. Two entries failing in a row (the
+        database is likely down) or a run ending on a failure raise, so the
+        drainer backs off.
+        """
+        rows = await self._call(self._read, self.batch_size)
+        if not rows:
+            return 0
+
+        try:
+            with metrics.timer("alerts.outbox.batch").time():
+                await self._apply(rows)
+            return len(rows)
+        except Exception:
+            metrics.counter("alerts.outbox.batch_failed").inc()
+
+        error = None
+        for row in rows:
+            try:
+                await self._apply([row])
+            except Exception as exc:
+                if error is not None:
+                    raise
+                error = exc
+                if await self._call(self._record_failure, row[0], repr(exc)):
+                    metrics.counter("alerts.outbox.dead").inc()
+                else:
+                    metrics.counter("alerts.outbox.deferred").inc()
+            else:
+                error = None
+        if error is not None:
+            raise error
+        return len(rows)
+
+    async def _run(self) -> None:
+        retry_seconds = self.poll_seconds
+        while True:
+            try:
+                drained = await self.drain()
+            except Exception:
+                metrics.counter("alerts.outbox.drain_failed").inc()
+                await asyncio.sleep(retry_seconds)
+                retry_seconds = min(retry_seconds * 2, MAX_RETRY_SECONDS)
+                continue
+
+            retry_seconds = self.poll_seconds
+            if drained == self.batch_size:
+                continue
+
+            # Appends wake the drainer up, the timeout picks up entries
+            # appended by other workers sharing the outbox file
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        """
+        Start the drainer; entries left over from a previous run are
+        applied first
+        """
+        self._connect()
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="alert-outbox")
+
+    async def stop(self) -> None:
+        """
+        Stop the drainer and make a last attempt at applying what is left
+        (anything that fails stays in the outbox for the next start)
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            while await self.drain() == self.batch_size:
+                pass
+        except Exception:
+            metrics.counter("alerts.outbox.drain_failed").inc()
+
+        await self._call(self._close)
+
+
+alert_outbox = AlertOutbox(
+    path=settings.ALERT_OUTBOX_PATH,
+    batch_size=settings.ALERT_OUTBOX_BATCH_SIZE,
+    poll_seconds=settings.ALERT_OUTBOX_POLL_SECONDS,
+    max_attempts=settings.ALERT_OUTBOX_MAX_ATTEMPTS,
+)
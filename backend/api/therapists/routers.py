@@ -1,25 +1,49 @@
-import tempfile
+import asyncio
+import json
 from pathlib import Path
+from typing import Annotated, Literal
 
-from backboard.exceptions import BackboardServerError
-from fastapi import APIRouter, File, HTTPException, UploadFile, status
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException
 
 from api.core.db import SESSION_DEP
+from api.core.uploads import UploadTooLarge, receive_form
+from api.core.versions import not_modified
 from api.security.service import USER_INFO_DEP
-from api.therapists.models import AlertMessage, PatientNoteMessage, ReportMessage
+from api.therapists.models import (
+    AlertMessage,
+    DashboardPatient,
+    NoteUploadResult,
+    PatientNoteMessage,
+    ReportMessage,
+    ReportSummary,
+    SearchHit,
+)
 from api.therapists.service import (
+    DashboardSort,
     add_patient_note,
+    add_patient_notes_bulk,
+    export_patient_messages,
     generate_report,
     get_alerts,
+    get_dashboard,
+    get_list_etag,
     get_patient,
     get_patient_alerts,
+    get_patient_note,
     get_patient_report,
     list_patient_notes,
     list_patient_reports,
     list_patients,
+    search_documents,
+    subscribe_to_alerts,
 )
+from api.therapists.settings import settings
+from api.therapists.storage import is_archive
 from api.users.models import UserOut
-from api.users.service import InvalidRequest, PermissionDenied
+from api.users.service import InvalidRequest, NotFound, PermissionDenied
 
 router = APIRouter(prefix="/therapists", tags=["Therapists"])
 
@@ -50,8 +74,74 @@ async def get_patient_route(
         )
 
 
+@router.get("/dashboard", response_model=list[DashboardPatient])
+async def get_dashboard_route(
+    session: SESSION_DEP,
+    user_info: USER_INFO_DEP,
+    sort: DashboardSort = "name",
+    min_risk_level: Literal["low", "medium", "high"] | None = None,
+):
+    """
+    Everything the dashboard shows per patient, in a single request:
+    alert counts by risk level, latest alert, latest report and message
+    activity. Patients can be sorted and filtered on those counters.
+    """
+    try:
+        return await get_dashboard(
+            session=session,
+            user_info=user_info,
+            sort=sort,
+            min_risk_level=min_risk_level,
+        )
+
+    except PermissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e),
+        )
+
+    except InvalidRequest as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+
+@router.get("/search", response_model=list[SearchHit])
+async def search_route(
+    session: SESSION_DEP,
+    user_info: USER_INFO_DEP,
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    patient_id: int | None = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0)] = 0,
+):
+    """
+    Full-text search over the reports, alert causes and notes of the
+    therapist's patients (or of one patient), best match first. Every word
+    of q must match; snippets highlight the matches with <mark>.
+    """
+    try:
+        return await search_documents(
+            session=session,
+            user_info=user_info,
+            query=q,
+            patient_id=patient_id,
+            limit=limit,
+            offset=offset,
+        )
+
+    except PermissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e),
+        )
+
+
 @router.get("/alerts", response_model=list[AlertMessage])
 async def list_alerts_route(
+    request: Request,
+    response: Response,
     session: SESSION_DEP,
     user_info: USER_INFO_DEP,
 ):
@@ -59,6 +149,11 @@ async def list_alerts_route(
     Get all alerts for the authenticated therapist's patients.
     """
     try:
+        etag = await get_list_etag(session, user_info, "alerts")
+        if cached := not_modified(request, etag, "therapists.alerts"):
+            return cached
+        response.headers["ETag"] = etag
+
         return await get_alerts(
             session=session,
             user_info=user_info,
@@ -77,6 +172,50 @@ async def list_alerts_route(
         )
 
 
+@router.get(
+    "/alerts/stream",
+    summary="Stream new alerts",
+    description="Pushes the authenticated therapist's new alerts as Server-Sent Events (SSE)",
+    responses={
+        200: {"content": {"text/event-stream": {}}, "description": "Streaming response"}
+    },
+)
+async def stream_alerts_route(
+    request: Request,
+    user_info: USER_INFO_DEP,
+):
+    """
+    Each event is an AlertMessage. A comment line is sent when idle to keep
+    the connection open.
+    """
+    try:
+        subscription = subscribe_to_alerts(user_info)
+    except PermissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e),
+        )
+
+    async def event_generator():
+        with subscription:
+            while not await request.is_disconnected():
+                try:
+                    alert = await asyncio.wait_for(
+                        subscription.get(),
+                        timeout=settings.ALERT_STREAM_KEEPALIVE_SECONDS,
+                    )
+                except TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield f"data: {json.dumps(alert)}\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+    )
+
+
 @router.get("/patients/{patient_id}/alerts", response_model=list[AlertMessage])
 async def list_patient_alerts_route(
     patient_id: int,
@@ -106,12 +245,60 @@ async def list_patient_alerts_route(
         )
 
 
+@router.get(
+    "/patients/{patient_id}/messages/export",
+    summary="Export a patient's chat history",
+    description="Streams the patient's complete chat history as NDJSON, oldest first",
+    responses={
+        200: {"content": {"application/x-ndjson": {}}, "description": "One message per line"}
+    },
+)
+async def export_patient_messages_route(
+    patient_id: int,
+    session: SESSION_DEP,
+    user_info: USER_INFO_DEP,
+):
+    try:
+        lines = await export_patient_messages(
+            session=session,
+            user_info=user_info,
+            patient_id=patient_id,
+        )
+
+    except PermissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e),
+        )
+
+    except InvalidRequest as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+
+    return StreamingResponse(
+        lines,
+        media_type="application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="chat-history-{patient_id}.ndjson"'
+        },
+    )
+
+
 @router.get("/patients", response_model=list[UserOut])
 async def list_patients_route(
+    request: Request,
+    response: Response,
     session: SESSION_DEP,
     user_info: USER_INFO_DEP,
 ):
     try:
+        etag = await get_list_etag(session, user_info, "patients")
+        if cached := not_modified(request, etag, "therapists.patients"):
+            return cached
+        response.headers["ETag"] = etag
+
         return await list_patients(
             session=session,
             user_info=user_info,
@@ -156,17 +343,39 @@ async def generate_report_route(
         )
 
 
-@router.get("/patients/{patient_id}/reports", response_model=list[ReportMessage])
+@router.get(
+    "/patients/{patient_id}/reports",
+    response_model=list[ReportMessage] | list[ReportSummary],
+)
 async def list_patient_reports_route(
     patient_id: int,
+    request: Request,
+    response: Response,
     session: SESSION_DEP,
     user_info: USER_INFO_DEP,
+    summary: bool = False,
 ):
+    """
+    List the patient's reports. With summary=true, only their id, date and
+    excerpt; the full text is served by GET .../reports/{report_id}
+    """
     try:
+        etag = await get_list_etag(
+            session,
+            user_info,
+            "reports",
+            patient_id,
+            variant="summary" if summary else "",
+        )
+        if cached := not_modified(request, etag, "therapists.reports"):
+            return cached
+        response.headers["ETag"] = etag
+
         return await list_patient_reports(
             session=session,
             user_info=user_info,
             patient_id=patient_id,
+            summary=summary,
         )
 
     except PermissionDenied as e:
@@ -210,45 +419,74 @@ async def get_patient_report_route(
         )
 
 
-@router.post("/patients/{patient_id}/notes", response_model=PatientNoteMessage)
+@router.post(
+    "/patients/{patient_id}/notes",
+    response_model=PatientNoteMessage,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+)
 async def upload_patient_note(
     patient_id: int,
+    request: Request,
     session: SESSION_DEP,
     user_info: USER_INFO_DEP,
-    file: UploadFile = File(...),
 ):
     """
-    Upload a patient note document.
-    The file will be saved and uploaded to the patient's AI assistant.
+    Upload a patient note document (multipart field "file").
+    The file is saved and the note returned as pending; it is uploaded to
+    the patient's AI assistant in the background (poll
+    GET /therapists/patients/{patient_id}/notes/{note_id} for its status).
     Max file size: 5MB
     """
-    # File size limit: 5MB
-    MAX_FILE_SIZE = 5 * 1024 * 1024
-    
+    max_mb = settings.NOTE_MAX_FILE_SIZE / (1024 * 1024)
+
     try:
-        content = await file.read()
-        
-        if len(content) > MAX_FILE_SIZE:
+        # Streamed to a temporary file, aborted as soon as it is too large
+        form = await receive_form(
+            request,
+            max_file_size=settings.NOTE_MAX_FILE_SIZE,
+            directory=settings.NOTE_STORAGE_DIR,
+        )
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size is {max_mb:g}MB",
+        )
+    except MultiPartException as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.message,
+        )
+
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
             raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File too large. Maximum size is 5MB, got {len(content) / (1024 * 1024):.1f}MB",
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail='Missing file field "file"',
             )
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{file.filename}") as tmp:
-            tmp.write(content)
-            tmp_path = Path(tmp.name)
-
-        try:
-            result = await add_patient_note(
-                session=session,
-                user_info=user_info,
-                patient_id=patient_id,
-                file_path=tmp_path,
-                file_name=file.filename or "unknown",
-            )
-            return result
-        finally:
-            tmp_path.unlink(missing_ok=True)
+
+        # The temporary file is moved to the note storage, no copy
+        return await add_patient_note(
+            session=session,
+            user_info=user_info,
+            patient_id=patient_id,
+            file_path=Path(file.file.name),
+            file_name=file.filename or "unknown",
+        )
 
     except PermissionDenied as e:
         raise HTTPException(
@@ -261,17 +499,111 @@ async def upload_patient_note(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e),
         )
-    
-    except BackboardServerError as e:
+
+    finally:
+        await form.close()
+
+
+def _bulk_file_size_limit(file_name: str) -> int:
+    # Notes are held to the single upload limit while they stream in
+    if is_archive(file_name):
+        return settings.NOTE_BULK_MAX_ARCHIVE_SIZE
+    return settings.NOTE_MAX_FILE_SIZE
+
+
+@router.post(
+    "/patients/{patient_id}/notes/bulk",
+    response_model=list[NoteUploadResult],
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {
+                            "files": {
+                                "type": "array",
+                                "items": {"type": "string", "format": "binary"},
+                            }
+                        },
+                        "required": ["files"],
+                    }
+                }
+            },
+        }
+    },
+)
+async def upload_patient_notes_bulk(
+    patient_id: int,
+    request: Request,
+    session: SESSION_DEP,
+    user_info: USER_INFO_DEP,
+):
+    """
+    Upload several patient note documents at once (multipart field "files",
+    repeated). A .zip file is extracted: each file in it is a note.
+    Files already uploaded for the patient (same content) are skipped.
+    Returns one result per file; accepted notes are uploaded to the
+    patient's AI assistant in the background, like single uploads.
+    """
+    try:
+        form = await receive_form(
+            request,
+            max_file_size=settings.NOTE_BULK_MAX_ARCHIVE_SIZE,
+            max_files=settings.NOTE_BULK_MAX_FILES,
+            directory=settings.NOTE_STORAGE_DIR,
+            size_limit=_bulk_file_size_limit,
+        )
+    except UploadTooLarge as e:
+        max_mb = e.max_size / (1024 * 1024)
         raise HTTPException(
-            status_code=status.HTTP_502_BAD_GATEWAY,
-            detail="Failed to upload document to AI assistant. The file may be too large or the service is temporarily unavailable. Please try again with a smaller file.",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size is {max_mb:g}MB",
+        )
+    except MultiPartException as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=e.message,
         )
 
+    try:
+        files = [f for f in form.getlist("files") if isinstance(f, UploadFile)]
+        if not files:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail='Missing file field "files"',
+            )
+
+        return await add_patient_notes_bulk(
+            session=session,
+            user_info=user_info,
+            patient_id=patient_id,
+            files=[(Path(f.file.name), f.filename or "unknown") for f in files],
+        )
+
+    except PermissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e),
+        )
+
+    except InvalidRequest as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e),
+        )
+
+    finally:
+        await form.close()
+
 
 @router.get("/patients/{patient_id}/notes", response_model=list[PatientNoteMessage])
 async def get_patient_notes(
     patient_id: int,
+    request: Request,
+    response: Response,
     session: SESSION_DEP,
     user_info: USER_INFO_DEP,
 ):
@@ -279,6 +611,11 @@ async def get_patient_notes(
     Get all notes for a specific patient.
     """
     try:
+        etag = await get_list_etag(session, user_info, "notes", patient_id)
+        if cached := not_modified(request, etag, "therapists.notes"):
+            return cached
+        response.headers["ETag"] = etag
+
         return await list_patient_notes(
             session=session,
             user_info=user_info,
@@ -296,3 +633,37 @@ async def get_patient_notes(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(e),
         )
+
+
+@router.get(
+    "/patients/{patient_id}/notes/{note_id}", response_model=PatientNoteMessage
+)
+async def get_patient_note_route(
+    patient_id: int,
+    note_id: int,
+    session: SESSION_DEP,
+    user_info: USER_INFO_DEP,
+):
+    """
+    Get a note with its ingestion status: pending, uploading, processing
+    (Backboard is indexing it), indexed or failed (see error).
+    """
+    try:
+        return await get_patient_note(
+            session=session,
+            user_info=user_info,
+            patient_id=patient_id,
+            note_id=note_id,
+        )
+
+    except PermissionDenied as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e),
+        )
+
+    except NotFound as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e),
+        )
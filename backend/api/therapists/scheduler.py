@@ -0,0 +1,236 @@
+"""
+Weekly reports generated ahead of time.
+
+generate_report keeps the therapist waiting on a full LLM generation. The
+scheduler, started from the lifespan, generates the weekly report of every
+accepted link each night in an off-peak window, so the therapist finds a
+stored report and the LLM load moves off peak hours.
+
+Each night's run is claimed in scheduled_runs, in the transaction that
+queues its jobs: only one worker process runs it, and a run that fails
+leaves the night unclaimed for the retry. It queues a low priority
+reports.weekly job (api.core.jobs) for every link whose latest report is
+older than the interval, stalest first, each after a random delay
+(jitter); the workers generate them at most REPORT_SCHEDULE_CONCURRENCY at
+a time, so the generations are spread instead of hitting Backboard at
+once. Jobs still queued when the window
+closes do nothing: their links are due again the next night.
+"""
+
+import asyncio
+import random
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from api.core.db import sessionmanager
+from api.core.jobs import PRIORITY_LOW, JobContext, jobs
+from api.core.metrics import metrics
+from api.therapists.access import get_patient_access
+from api.therapists.models import PatientStats, ScheduledRun
+from api.therapists.service import create_weekly_report
+from api.therapists.settings import settings
+from api.users.models import LinkStatus, PatientLink
+
+RUN_NAME = "weekly_reports"
+REPORT_JOB = "reports.weekly"
+
+# Wait before trying again when a run could not be started, or a report
+# could not be generated
+RETRY_SECONDS = 60.0
+
+
+def report_window(
+    now: datetime, tz: ZoneInfo, start_hour: int, end_hour: int
+) -> tuple[datetime, datetime]:
+    """
+    Start and end of the window now is in, or of the next one
+    """
+    duration = timedelta(hours=(end_hour - start_hour) % 24 or 24)
+    start = now.astimezone(tz).replace(
+        hour=start_hour, minute=0, second=0, microsecond=0
+    )
+    if now < start - timedelta(days=1) + duration:
+        # Still in yesterday's window, which spans midnight
+        start -= timedelta(days=1)
+    elif now >= start + duration:
+        start += timedelta(days=1)
+    return start, start + duration
+
+
+class ReportScheduler:
+    def __init__(
+        self,
+        tz: str,
+        start_hour: int,
+        end_hour: int,
+        interval_days: int,
+        jitter_seconds: float,
+    ):
+        self.tz = ZoneInfo(tz)
+        self.start_hour = start_hour
+        self.end_hour = end_hour
+        self.interval_days = interval_days
+        self.jitter_seconds = jitter_seconds
+        self._task: asyncio.Task | None = None
+
+    async def due_links(self, now: datetime) -> list[tuple[int, int]]:
+        """
+        (therapist_id, patient_id) of the accepted links whose latest report
+        is older than the interval, stalest first
+        """
+        cutoff = now - timedelta(days=self.interval_days)
+        stmt = (
+            select(PatientLink.therapist_id, PatientLink.patient_id)
+            .outerjoin(
+                PatientStats,
+                and_(
+                    PatientStats.therapist_id == PatientLink.therapist_id,
+                    PatientStats.patient_id == PatientLink.patient_id,
+                ),
+            )
+            .where(
+                PatientLink.link_status == LinkStatus.ACCEPTED,
+                or_(
+                    PatientStats.last_report_at.is_(None),
+                    PatientStats.last_report_at < cutoff,
+                ),
+            )
+            .order_by(PatientStats.last_report_at.asc().nulls_first())
+        )
+        async with sessionmanager.session() as session:
+            return [tuple(row) for row in await session.execute(stmt)]  # type: ignore[misc]
+
+    async def run(self, run_on: date, deadline: datetime) -> int | None:
+        """
+        Claim the night and queue the reports of the due links, to generate
+        before the deadline, in one transaction: if anything fails, the night
+        is not claimed and the next attempt runs it.
+        Return the number of reports queued, None if the night was already
+        claimed
+        """
+        links = await self.due_links(datetime.now(timezone.utc))
+        async with sessionmanager.session() as session:
+            try:
+                result = await session.execute(
+                    insert(ScheduledRun)
+                    .values(name=RUN_NAME, run_on=run_on)
+                    .on_conflict_do_nothing()
+                )
+                if result.rowcount != 1:  # type: ignore[attr-defined]
+                    await session.rollback()
+                    return None
+
+                for therapist_id, patient_id in links:
+                    await jobs.enqueue(
+                        session,
+                        REPORT_JOB,
+                        {
+                            "therapist_id": therapist_id,
+                            "patient_id": patient_id,
+                            "run_on": run_on.isoformat(),
+                            "deadline": deadline.isoformat(),
+                        },
+                        priority=PRIORITY_LOW,
+                        delay=random.uniform(0, self.jitter_seconds),
+                        key=f"{REPORT_JOB}:{therapist_id}:{patient_id}:{run_on}",
+                    )
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+        metrics.counter("reports.scheduled.queued").inc(len(links))
+        return len(links)
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.now(timezone.utc)
+            start, end = report_window(now, self.tz, self.start_hour, self.end_hour)
+            # Worker processes started together don't all try at once
+            delay = max((start - now).total_seconds(), 0)
+            await asyncio.sleep(delay + random.uniform(0, self.jitter_seconds))
+
+            run_on = start.date()
+            try:
+                await self.run(run_on, deadline=end)
+            except Exception:
+                metrics.counter("reports.scheduled.run_failed").inc()
+                await asyncio.sleep(RETRY_SECONDS)
+                continue
+
+            # Next night
+            await asyncio.sleep(
+                max((end - datetime.now(timezone.utc)).total_seconds(), 0)
+            )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="report-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def _count(run_on: date, done: int = 0, failed: int = 0) -> None:
+    async with sessionmanager.session() as session:
+        await session.execute(
+            update(ScheduledRun)
+            .where(ScheduledRun.name == RUN_NAME, ScheduledRun.run_on == run_on)
+            .values(
+                done=ScheduledRun.done + done, failed=ScheduledRun.failed + failed
+            )
+        )
+        await session.commit()
+
+
+@jobs.task(
+    REPORT_JOB,
+    max_attempts=3,
+    retry_seconds=RETRY_SECONDS,
+    concurrency=settings.REPORT_SCHEDULE_CONCURRENCY,
+)
+async def generate_scheduled_report(job: JobContext) -> None:
+    """
+    Generate and store one due report, unless the window has closed or the
+    link is gone
+    """
+    run_on = date.fromisoformat(job.payload["run_on"])
+    if datetime.now(timezone.utc) >= datetime.fromisoformat(job.payload["deadline"]):
+        metrics.counter("reports.scheduled.expired").inc()
+        return
+
+    try:
+        async with sessionmanager.session() as session:
+            access = await get_patient_access(
+                session, job.payload["therapist_id"], job.payload["patient_id"]
+            )
+            if access is None:
+                return
+            with metrics.timer("reports.scheduled.generate").time():
+                report = await create_weekly_report(session, access)
+    except Exception:
+        if job.last_attempt:
+            await _count(run_on, failed=1)
+            metrics.counter("reports.scheduled.failed").inc()
+        raise
+
+    if report.id is not None:
+        await _count(run_on, done=1)
+        metrics.counter("reports.scheduled.generated").inc()
+
+
+report_scheduler = ReportScheduler(
+    tz=settings.REPORT_SCHEDULE_TIMEZONE,
+    start_hour=settings.REPORT_SCHEDULE_START_HOUR,
+    end_hour=settings.REPORT_SCHEDULE_END_HOUR,
+    interval_days=settings.REPORT_SCHEDULE_INTERVAL_DAYS,
+    jitter_seconds=settings.REPORT_SCHEDULE_JITTER_SECONDS,
+)
@@ -0,0 +1,257 @@
+"""
+Full-text search over the therapist's reports, alert causes and notes.
+
+search_index is an SQLite FTS5 table holding one row per searchable
+document. Writers index a document in the transaction that creates or
+changes it (index_document), so search never lags behind the data. A
+search is a single FTS5 query ranked with bm25, with snippets highlighted
+by FTS5: no LLM or Backboard round trip.
+
+The text of a note is extracted from its file when it is ingested, and the
+file is gone afterwards: a rebuild re-indexes reports and alerts from their
+tables but keeps the indexed notes as they are.
+
+    python -m api.therapists.search rebuild
+"""
+
+import argparse
+import asyncio
+import html
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import Connection, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.core.metrics import metrics
+from api.therapists.models import SearchHit, SearchKind
+
+TABLE = "search_index"
+
+CREATE_STATEMENT = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+    title,
+    body,
+    kind UNINDEXED,
+    ref_id UNINDEXED,
+    therapist_id UNINDEXED,
+    patient_id UNINDEXED,
+    created_at UNINDEXED,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
+
+# The rowid encodes (kind, id), so a document is replaced through the rowid
+# instead of a scan of the unindexed columns
+KIND_CODES: dict[SearchKind, int] = {"report": 1, "alert": 2, "note": 3}
+_KIND_SLOTS = 4
+
+REPORT_TITLE = "Weekly report"
+
+# Matched terms are marked with control characters, replaced once the
+# snippet is HTML-escaped: snippets are safe to render as HTML
+_OPEN, _CLOSE = "\x02", "\x03"
+SNIPPET_TOKENS = 16
+
+_TERM = re.compile(r"\w+")
+MAX_TERMS = 16
+
+
+def _rowid(kind: SearchKind, ref_id: int) -> int:
+    return ref_id * _KIND_SLOTS + KIND_CODES[kind]
+
+
+def _stored_datetime(value: datetime) -> str:
+    """
+    Naive UTC, like the DateTime columns store it
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.isoformat(sep=" ")
+
+
+def alert_title(risk_level: str) -> str:
+    return f"{risk_level.capitalize()} risk alert"
+
+
+async def index_document(
+    session: AsyncSession,
+    kind: SearchKind,
+    ref_id: int,
+    therapist_id: int,
+    patient_id: int,
+    title: str,
+    body: str,
+    created_at: datetime,
+) -> None:
+    """
+    Add or replace a document in the search index. Does not commit
+    """
+    rowid = _rowid(kind, ref_id)
+    await session.execute(
+        text(f"DELETE FROM {TABLE} WHERE rowid = :rowid"), {"rowid": rowid}
+    )
+    await session.execute(
+        text(
+            f"INSERT INTO {TABLE} (rowid, title, body, kind, ref_id, therapist_id, "
+            "patient_id, created_at) VALUES (:rowid, :title, :body, :kind, :ref_id, "
+            ":therapist_id, :patient_id, :created_at)"
+        ),
+        {
+            "rowid": rowid,
+            "title": title,
+            "body": body,
+            "kind": kind,
+            "ref_id": ref_id,
+            "therapist_id": therapist_id,
+            "patient_id": patient_id,
+            "created_at": _stored_datetime(created_at),
+        },
+    )
+
+
+def match_query(query: str) -> str | None:
+    """
+    FTS5 query matching every word of the user's query, None if it has no
+    words. Words are quoted, so FTS5 operators typed by the user are
+    searched for as plain words
+    """
+    terms = _TERM.findall(query)[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def _highlight(snippet: str) -> str:
+    return (
+        html.escape(snippet)
+        .replace(_OPEN, "<mark>")
+        .replace(_CLOSE, "</mark>")
+    )
+
+
+async def search(
+    session: AsyncSession,
+    therapist_id: int,
+    query: str,
+    patient_id: int | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[SearchHit]:
+    """
+    The therapist's documents matching every word of the query, best match
+    first. Only patients the therapist is currently linked to are searched
+    """
+    match = match_query(query)
+    if match is None:
+        return []
+
+    where = ""
+    params = {
+        "match": match,
+        "therapist_id": therapist_id,
+        "limit": limit,
+        "offset": offset,
+        "open": _OPEN,
+        "close": _CLOSE,
+        "tokens": SNIPPET_TOKENS,
+    }
+    if patient_id is not None:
+        where = "AND patient_id = :patient_id"
+        params["patient_id"] = patient_id
+
+    # Title matches weigh more than body matches
+    stmt = text(
+        f"""
+        SELECT kind, ref_id, patient_id, title, created_at,
+            snippet({TABLE}, -1, :open, :close, '…', :tokens) AS snippet
+        FROM {TABLE}
+        WHERE {TABLE} MATCH :match
+            AND therapist_id = :therapist_id
+            {where}
+            AND patient_id IN (
+                SELECT patient_id FROM patient_links
+                WHERE therapist_id = :therapist_id AND link_status = 'ACCEPTED'
+            )
+        ORDER BY bm25({TABLE}, 4.0, 1.0)
+        LIMIT :limit OFFSET :offset
+        """
+    )
+
+    with metrics.timer("therapists.search").time():
+        rows = (await session.execute(stmt, params)).all()
+
+    return [
+        SearchHit(
+            kind=row.kind,
+            id=row.ref_id,
+            patient_id=row.patient_id,
+            title=row.title,
+            snippet=_highlight(row.snippet),
+            created_at=datetime.fromisoformat(row.created_at),
+        )
+        for row in rows
+    ]
+
+
+REBUILD_STATEMENTS = [
+    f"DELETE FROM {TABLE} WHERE kind IN ('report', 'alert')",
+    f"""
+    INSERT INTO {TABLE} (rowid, title, body, kind, ref_id, therapist_id,
+        patient_id, created_at)
+    SELECT id * {_KIND_SLOTS} + {KIND_CODES["report"]}, '{REPORT_TITLE}', content,
+        'report', id, therapist_id, patient_id, created_at
+    FROM reports
+    """,
+    f"""
+    INSERT INTO {TABLE} (rowid, title, body, kind, ref_id, therapist_id,
+        patient_id, created_at)
+    SELECT id * {_KIND_SLOTS} + {KIND_CODES["alert"]},
+        upper(substr(risk_level, 1, 1)) || substr(risk_level, 2) || ' risk alert',
+        cause, 'alert', id, therapist_id, patient_id, created_at
+    FROM alerts
+    """,
+    # Notes indexed before their text was: file name only
+    f"""
+    INSERT INTO {TABLE} (rowid, title, body, kind, ref_id, therapist_id,
+        patient_id, created_at)
+    SELECT id * {_KIND_SLOTS} + {KIND_CODES["note"]}, file_name, '',
+        'note', id, therapist_id, patient_id, created_at
+    FROM patient_notes
+    WHERE status != 'FAILED'
+        AND id * {_KIND_SLOTS} + {KIND_CODES["note"]} NOT IN (SELECT rowid FROM {TABLE})
+    """,
+]
+
+
+def create_search_index(conn: Connection) -> None:
+    conn.exec_driver_sql(CREATE_STATEMENT)
+
+
+def rebuild_index(conn: Connection) -> None:
+    for statement in REBUILD_STATEMENTS:
+        conn.exec_driver_sql(statement)
+
+
+async def _main() -> None:
+    from api.core.db import sessionmanager
+
+    try:
+        async with sessionmanager.session() as session:
+            connection = await session.connection()
+            await connection.run_sync(rebuild_index)
+            await session.commit()
+            print("search index rebuilt")
+    finally:
+        await sessionmanager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
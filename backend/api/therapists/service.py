@@ -1,104 +1,158 @@
+import asyncio
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import AsyncIterator, Literal
 
-from backboard import BackboardClient
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-
-from api.chats.service import generate_weekly_report
-from api.config import BACKBOARD_API_KEY
+from sqlalchemy.orm import undefer
+
+from api.chats.service import export_thread_messages, generate_weekly_report
+from api.core.metrics import metrics
+from api.core.pubsub import Subscription
+from api.core.versions import (
+    alerts_key,
+    bump_version,
+    get_etag,
+    notes_key,
+    patients_key,
+    reports_key,
+)
 from api.security.models import TokenData
-from api.therapists.models import Alert, AlertMessage, PatientNote, PatientNoteMessage, Report, ReportMessage
+from api.therapists.access import PatientAccess, get_patient_access
+from api.therapists.alerts import alert_hub
+from api.therapists.ingestion import enqueue_note, refresh_note_status
+from api.therapists.models import (
+    Alert,
+    AlertMessage,
+    DashboardPatient,
+    NoteStatus,
+    NoteUploadResult,
+    PatientNote,
+    PatientNoteMessage,
+    PatientStats,
+    Report,
+    ReportMessage,
+    ReportSummary,
+    SearchHit,
+    report_excerpt,
+)
+from api.therapists.search import REPORT_TITLE, index_document, search
+from api.therapists.settings import settings
+from api.therapists.stats import ALERT_COLUMNS, record_report_stats
+from api.therapists.storage import (
+    StoredNote,
+    extract_archive,
+    is_archive,
+    remove_stored_file,
+    store_note_file,
+)
 from api.users.models import LinkStatus, PatientLink, Role, User, UserOut
-from api.users.service import InvalidRequest, PermissionDenied
+from api.users.service import InvalidRequest, NotFound, PermissionDenied
 
 
 async def assert_therapist_can_access_patient(
     session: AsyncSession,
     therapist_id: int,
     patient_id: int,
-):
-    stmt = select(PatientLink).where(
-        PatientLink.therapist_id == therapist_id,
-        PatientLink.patient_id == patient_id,
-        PatientLink.link_status == LinkStatus.ACCEPTED,
-    )
-    link = (await session.execute(stmt)).scalar_one_or_none()
-    if not link:
+) -> PatientAccess:
+    """
+    Return the patient's Backboard ids if the therapist has an accepted link
+    to them (cached, see api.therapists.access)
+    """
+    access = await get_patient_access(session, therapist_id, patient_id)
+    if access is None:
         raise PermissionDenied("Therapist has no access to this patient")
+    return access
 
 
-async def get_patient(
-    session: AsyncSession, user_info: TokenData, patient_id: int
-) -> UserOut:
+ETAG_KEYS = {
+    "alerts": alerts_key,
+    "patients": patients_key,
+    "reports": reports_key,
+    "notes": notes_key,
+}
+
+
+async def get_list_etag(
+    session: AsyncSession,
+    user_info: TokenData,
+    resource: str,
+    patient_id: int | None = None,
+    variant: str = "",
+) -> str:
     """
-    Get a therapist's specific patient identified by id
+    ETag of one of the therapist's lists (alerts, patients, or a patient's
+    reports or notes). Checks access like the list itself would.
     """
     if user_info.role != Role.THERAPIST:
         raise PermissionDenied("Only therapists can access patient information")
 
-    await assert_therapist_can_access_patient(session, user_info.user_id, patient_id)
+    if patient_id is None:
+        key = ETAG_KEYS[resource](user_info.user_id)
+    else:
+        await assert_therapist_can_access_patient(
+            session, user_info.user_id, patient_id
+        )
+        key = ETAG_KEYS[resource](user_info.user_id, patient_id)
 
-    stmt = (
-        select(User)
-        .where(User.id == user_info.user_id)
-        .options(selectinload(User.patient_links))
-    )
-    therapist_obj = (await session.execute(stmt)).scalar_one_or_none()
+    return await get_etag(session, key, variant)
 
-    if not therapist_obj:
-        raise InvalidRequest("Therapist not found")
 
-    stmt = select(User).where(User.id == patient_id)
-    patient = (await session.execute(stmt)).scalar_one_or_none()
+def _linked_patients(therapist_id: int):
+    """
+    UserOut columns of the therapist's accepted patients
+    """
+    return (
+        select(User.id, User.email, User.role, User.full_name, User.phone_number)
+        .join(PatientLink, PatientLink.patient_id == User.id)
+        .where(
+            PatientLink.therapist_id == therapist_id,
+            PatientLink.link_status == LinkStatus.ACCEPTED,
+        )
+    )
 
-    if not patient:
-        raise InvalidRequest("Patient not found")
 
+def _user_out(row) -> UserOut:
     return UserOut(
-        id=patient.id,
-        email=patient.email,
-        role=patient.role.value,
-        full_name=patient.full_name,
-        phone_number=patient.phone_number,
+        id=row.id,
+        email=row.email,
+        role=row.role.value,
+        full_name=row.full_name,
+        phone_number=row.phone_number,
     )
 
 
-async def list_patients(session: AsyncSession, user_info: TokenData) -> list[UserOut]:
+async def get_patient(
+    session: AsyncSession, user_info: TokenData, patient_id: int
+) -> UserOut:
     """
-    List a therapist's patients
+    Get a therapist's specific patient identified by id
     """
     if user_info.role != Role.THERAPIST:
         raise PermissionDenied("Only therapists can access patient information")
 
-    stmt = (
-        select(User)
-        .where(User.id == user_info.user_id)
-        .options(selectinload(User.patient_links))
-    )
-    therapist_obj = (await session.execute(stmt)).scalar_one_or_none()
-    if not therapist_obj:
-        raise InvalidRequest("Therapist not found")
+    # The accepted link is part of the join, no separate access check
+    stmt = _linked_patients(user_info.user_id).where(User.id == patient_id)
+    patient = (await session.execute(stmt)).one_or_none()
 
-    patient_ids = [p.patient_id for p in therapist_obj.patient_links]
+    if not patient:
+        raise PermissionDenied("Therapist has no access to this patient")
 
-    stmt = select(User).where(User.id.in_(patient_ids))
-    patients = (await session.execute(stmt)).scalars().all()
+    return _user_out(patient)
 
-    patients_output = []
 
-    for p in patients:
-        patients_output.append(
-            UserOut(
-                id=p.id,
-                email=p.email,
-                role=p.role.value,
-                full_name=p.full_name,
-                phone_number=p.phone_number,
-            )
-        )
+async def list_patients(session: AsyncSession, user_info: TokenData) -> list[UserOut]:
+    """
+    List a therapist's patients (accepted links only)
+    """
+    if user_info.role != Role.THERAPIST:
+        raise PermissionDenied("Only therapists can access patient information")
+
+    stmt = _linked_patients(user_info.user_id).order_by(User.id)
+    patients = (await session.execute(stmt)).all()
 
-    return patients_output
+    return [_user_out(p) for p in patients]
 
 
 async def generate_report(
@@ -112,51 +166,97 @@ async def generate_report(
     if user_info.role != Role.THERAPIST:
         raise PermissionDenied("Only therapists can generate reports")
 
-    await assert_therapist_can_access_patient(session, user_info.user_id, patient_id)
+    access = await assert_therapist_can_access_patient(
+        session, user_info.user_id, patient_id
+    )
+    return await create_weekly_report(session, access)
 
-    stmt = select(User).where(User.id == patient_id).options(selectinload(User.patient))
-    patient_obj = (await session.execute(stmt)).scalar_one_or_none()
-    if not patient_obj:
+
+async def create_weekly_report(
+    session: AsyncSession, access: PatientAccess
+) -> ReportMessage:
+    """
+    Generate the patient's weekly report for the therapist of the link and
+    store it, unless there was no activity. Access is not checked here.
+
+    Return the report (its id is None if it was not stored)
+    """
+    if access.thread_id is None or access.report_thread_id is None:
         raise InvalidRequest("Patient not found")
 
-    thread_id = patient_obj.patient.thread_id
-    report_thread_id = patient_obj.patient.report_thread_id
+    therapist_id, patient_id = access.therapist_id, access.patient_id
 
-    report = await generate_weekly_report(thread_id, report_thread_id, patient_id)
+    report = await generate_weekly_report(
+        access.thread_id, access.report_thread_id, patient_id
+    )
 
     if report.content == "No patient activity in the last 7 days.":
         return report
 
     report_obj = Report(
-        therapist_id=user_info.user_id,
+        therapist_id=therapist_id,
         patient_id=patient_id,
         content=report.content,
+        excerpt=report_excerpt(report.content),
+        created_at=datetime.now(timezone.utc),
     )
 
     try:
         session.add(report_obj)
+        await session.flush()
+        await index_document(
+            session,
+            "report",
+            report_obj.id,
+            therapist_id=therapist_id,
+            patient_id=patient_id,
+            title=REPORT_TITLE,
+            body=report.content,
+            created_at=report_obj.created_at,
+        )
+        await record_report_stats(
+            session, therapist_id, patient_id, report_obj.created_at
+        )
+        await bump_version(session, reports_key(therapist_id, patient_id))
         await session.commit()
         await session.refresh(report_obj)
     except:
         await session.rollback()
         raise
 
+    report.id = report_obj.id
     return report
 
 
 async def list_patient_reports(
-    session: AsyncSession, user_info: TokenData, patient_id: int
-) -> list[ReportMessage]:
+    session: AsyncSession, user_info: TokenData, patient_id: int, summary: bool = False
+) -> list[ReportMessage] | list[ReportSummary]:
+    """
+    The patient's reports, newest first. With summary, only their id, date
+    and excerpt: the report text is not even read from the database.
+    """
     if user_info.role != Role.THERAPIST:
         raise PermissionDenied("Only therapists can generate reports")
 
     await assert_therapist_can_access_patient(session, user_info.user_id, patient_id)
 
+    where = (Report.therapist_id == user_info.user_id, Report.patient_id == patient_id)
+
+    if summary:
+        stmt = (
+            select(Report.id, Report.created_at, Report.excerpt)
+            .where(*where)
+            .order_by(Report.created_at.desc())
+        )
+        return [
+            ReportSummary(id=r.id, created_at=r.created_at, excerpt=r.excerpt)
+            for r in await session.execute(stmt)
+        ]
+
     stmt = (
         select(Report)
-        .where(
-            Report.therapist_id == user_info.user_id, Report.patient_id == patient_id
-        )
+        .where(*where)
+        .options(undefer(Report.content))
         .order_by(Report.created_at.desc())
     )
 
@@ -181,10 +281,14 @@ async def get_patient_report(
 
     await assert_therapist_can_access_patient(session, user_info.user_id, patient_id)
 
-    stmt = select(Report).where(
-        Report.therapist_id == user_info.user_id,
-        Report.patient_id == patient_id,
-        Report.id == report_id,
+    stmt = (
+        select(Report)
+        .where(
+            Report.therapist_id == user_info.user_id,
+            Report.patient_id == patient_id,
+            Report.id == report_id,
+        )
+        .options(undefer(Report.content))
     )
 
     report = (await session.execute(stmt)).scalar_one_or_none()
@@ -207,59 +311,181 @@ async def add_patient_note(
     file_name: str,
 ) -> PatientNoteMessage:
     """
-    Add a patient note document to the database and upload it to the patient's assistant.
-    
+    Store a patient note document and queue it for upload to the patient's
+    assistant (see api.therapists.ingestion). The file at file_path is moved
+    to NOTE_STORAGE_DIR.
+
     Args:
         session: Database session
         user_info: Current user's token data
         patient_id: The patient's user ID
-        file_path: Path to the file to upload
+        file_path: Path to the uploaded file
         file_name: Original file name
-    
+
     Returns:
-        The created PatientNoteMessage
+        The created PatientNoteMessage, pending
     """
     if user_info.role != Role.THERAPIST:
         raise PermissionDenied("Only therapists can add patient notes")
 
-    await assert_therapist_can_access_patient(session, user_info.user_id, patient_id)
-
-    # Get the patient's assistant_id
-    stmt = select(User).where(User.id == patient_id).options(selectinload(User.patient))
-    patient_obj = (await session.execute(stmt)).scalar_one_or_none()
-    
-    if not patient_obj or not patient_obj.patient:
+    access = await assert_therapist_can_access_patient(
+        session, user_info.user_id, patient_id
+    )
+    if access.assistant_id is None:
         raise InvalidRequest("Patient not found")
 
-    assistant_id = patient_obj.patient.assistant_id
+    stored = await asyncio.to_thread(store_note_file, file_path, file_name)
 
-    # Upload document to the patient's assistant
-    async with BackboardClient(api_key=BACKBOARD_API_KEY) as client:  # type: ignore
-        await client.upload_document_to_assistant(
-            assistant_id=assistant_id,
-            file_path=file_path,
-        )
-
-    # Save the note record to the database
     note = PatientNote(
         therapist_id=user_info.user_id,
         patient_id=patient_id,
         file_name=file_name,
+        content_hash=stored.content_hash,
+        status=NoteStatus.PENDING,
+        stored_path=stored.stored_path,
     )
 
     try:
         session.add(note)
+        await session.flush()
+        await enqueue_note(session, note.id)
+        await bump_version(session, notes_key(user_info.user_id, patient_id))
         await session.commit()
         await session.refresh(note)
     except Exception:
         await session.rollback()
+        remove_stored_file(stored.stored_path)
         raise
 
+    return _note_out(note)
+
+
+async def add_patient_notes_bulk(
+    session: AsyncSession,
+    user_info: TokenData,
+    patient_id: int,
+    files: list[tuple[Path, str]],
+) -> list[NoteUploadResult]:
+    """
+    Store several note files at once and queue them for upload to the
+    patient's assistant. Zip archives are extracted, every file of the
+    archive is a note.
+
+    Files whose content the patient's assistant already has (same sha256
+    as a note that didn't fail), or that appear twice in the upload, are
+    not uploaded again.
+
+    Args:
+        files: (path, original file name) of the uploaded files, which are
+            moved to NOTE_STORAGE_DIR
+
+    Returns:
+        One result per note file, in upload order
+    """
+    if user_info.role != Role.THERAPIST:
+        raise PermissionDenied("Only therapists can add patient notes")
+
+    access = await assert_therapist_can_access_patient(
+        session, user_info.user_id, patient_id
+    )
+    if access.assistant_id is None:
+        raise InvalidRequest("Patient not found")
+
+    max_size = settings.NOTE_MAX_FILE_SIZE
+    stored: list[StoredNote] = []
+    for file_path, file_name in files:
+        remaining = settings.NOTE_BULK_MAX_FILES - len(stored)
+        if is_archive(file_name):
+            stored += await asyncio.to_thread(
+                extract_archive, file_path, file_name, max_size, remaining
+            )
+        elif remaining <= 0:
+            stored.append(StoredNote(file_name=file_name, error="Too many files"))
+        elif file_path.stat().st_size > max_size:
+            stored.append(StoredNote(file_name=file_name, error="File too large"))
+        else:
+            stored.append(await asyncio.to_thread(store_note_file, file_path, file_name))
+
+    hashes = {n.content_hash for n in stored if n.content_hash}
+    existing: dict[str, PatientNote] = {}
+    if hashes:
+        rows = await session.execute(
+            select(PatientNote)
+            .where(
+                PatientNote.patient_id == patient_id,
+                PatientNote.content_hash.in_(hashes),
+                PatientNote.status != NoteStatus.FAILED,
+            )
+            .order_by(PatientNote.id.desc())
+        )
+        existing = {n.content_hash: n for n in rows.scalars()}  # type: ignore[misc]
+
+    outcomes: list[tuple[StoredNote, PatientNote | None, bool]] = []
+    new_notes: list[PatientNote] = []
+    for item in stored:
+        if item.content_hash is None:
+            outcomes.append((item, None, False))
+        elif item.content_hash in existing:
+            outcomes.append((item, existing[item.content_hash], False))
+        else:
+            note = PatientNote(
+                therapist_id=user_info.user_id,
+                patient_id=patient_id,
+                file_name=item.file_name,
+                content_hash=item.content_hash,
+                status=NoteStatus.PENDING,
+                stored_path=item.stored_path,
+            )
+            existing[item.content_hash] = note
+            new_notes.append(note)
+            outcomes.append((item, note, True))
+
+    # Duplicates are not kept
+    for item, _, accepted in outcomes:
+        if not accepted:
+            remove_stored_file(item.stored_path)
+
+    if new_notes:
+        try:
+            session.add_all(new_notes)
+            await session.flush()
+            for note in new_notes:
+                await enqueue_note(session, note.id)
+            await bump_version(session, notes_key(user_info.user_id, patient_id))
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            for note in new_notes:
+                remove_stored_file(note.stored_path)
+            raise
+
+    results = []
+    for item, note, accepted in outcomes:
+        if note is None:
+            result = NoteUploadResult(
+                file_name=item.file_name, result="rejected", error=item.error
+            )
+        else:
+            # Another therapist's note is not shown
+            own = note.therapist_id == user_info.user_id
+            result = NoteUploadResult(
+                file_name=item.file_name,
+                result="accepted" if accepted else "duplicate",
+                note=_note_out(note) if own else None,
+            )
+        results.append(result)
+    metrics.counter("therapists.notes.bulk.accepted").inc(len(new_notes))
+    return results
+
+
+def _note_out(note: PatientNote) -> PatientNoteMessage:
     return PatientNoteMessage(
         id=note.id,
         patient_id=note.patient_id,
         therapist_id=note.therapist_id,
         file_name=note.file_name,
+        status=note.status,
+        error=note.error,
         created_at=note.created_at,
     )
 
@@ -288,16 +514,66 @@ async def list_patient_notes(
 
     notes = (await session.execute(stmt)).scalars().all()
 
-    return [
-        PatientNoteMessage(
-            id=n.id,
-            patient_id=n.patient_id,
-            therapist_id=n.therapist_id,
-            file_name=n.file_name,
-            created_at=n.created_at,
+    return [_note_out(n) for n in notes]
+
+
+async def get_patient_note(
+    session: AsyncSession,
+    user_info: TokenData,
+    patient_id: int,
+    note_id: int,
+) -> PatientNoteMessage:
+    """
+    Get a note with its ingestion status. A note Backboard is still
+    indexing is checked with Backboard first.
+    """
+    if user_info.role != Role.THERAPIST:
+        raise PermissionDenied("Only therapists can view patient notes")
+
+    await assert_therapist_can_access_patient(session, user_info.user_id, patient_id)
+
+    note = (
+        await session.execute(
+            select(PatientNote).where(
+                PatientNote.id == note_id,
+                PatientNote.therapist_id == user_info.user_id,
+                PatientNote.patient_id == patient_id,
+            )
         )
-        for n in notes
-    ]
+    ).scalar_one_or_none()
+    if note is None:
+        raise NotFound("Note not found")
+
+    await refresh_note_status(session, note)
+    return _note_out(note)
+
+
+async def search_documents(
+    session: AsyncSession,
+    user_info: TokenData,
+    query: str,
+    patient_id: int | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[SearchHit]:
+    """
+    Search the therapist's reports, alert causes and notes, optionally of a
+    single patient (see api.therapists.search)
+    """
+    if user_info.role != Role.THERAPIST:
+        raise PermissionDenied("Only therapists can search patient information")
+
+    if patient_id is not None:
+        await assert_therapist_can_access_patient(session, user_info.user_id, patient_id)
+
+    return await search(
+        session,
+        user_info.user_id,
+        query,
+        patient_id=patient_id,
+        limit=limit,
+        offset=offset,
+    )
 
 
 async def get_alerts(
@@ -327,7 +603,10 @@ async def get_alerts(
             patient_name=patient.full_name,
             risk_level=alert.risk_level,
             cause=alert.cause,
+            is_provisional=alert.is_provisional,
+            occurrences=alert.occurrences,
             created_at=alert.created_at,
+            last_seen_at=alert.last_seen_at,
         )
         for alert, patient in results
     ]
@@ -366,7 +645,210 @@ async def get_patient_alerts(
             patient_name=patient.full_name,
             risk_level=alert.risk_level,
             cause=alert.cause,
+            is_provisional=alert.is_provisional,
+            occurrences=alert.occurrences,
             created_at=alert.created_at,
+            last_seen_at=alert.last_seen_at,
         )
         for alert, patient in results
     ]
+
+
+DashboardSort = Literal["name", "risk", "last_alert", "last_report", "last_message"]
+
+
+async def get_dashboard(
+    session: AsyncSession,
+    user_info: TokenData,
+    sort: DashboardSort = "name",
+    min_risk_level: str | None = None,
+) -> list[DashboardPatient]:
+    """
+    Every accepted patient of the therapist with their activity counters,
+    latest alert and latest report.
+
+    Counters come from patient_stats, so sorting and filtering only touch
+    one row per patient. Three queries whatever the number of patients: the
+    patients with their counters, then the latest alert and report of each
+    patient (ROW_NUMBER over a per-patient window).
+    """
+    if user_info.role != Role.THERAPIST:
+        raise PermissionDenied("Only therapists can access patient information")
+    if min_risk_level is not None and min_risk_level not in ALERT_COLUMNS:
+        raise InvalidRequest(f"Unknown risk level: {min_risk_level}")
+
+    therapist_id = user_info.user_id
+
+    low = func.coalesce(PatientStats.low_alerts, 0)
+    medium = func.coalesce(PatientStats.medium_alerts, 0)
+    high = func.coalesce(PatientStats.high_alerts, 0)
+
+    patients_stmt = (
+        select(
+            User.id,
+            User.email,
+            User.full_name,
+            User.phone_number,
+            low,
+            medium,
+            high,
+            PatientStats.last_alert_at,
+            PatientStats.last_report_at,
+            func.coalesce(PatientStats.message_count, 0),
+            PatientStats.last_message_at,
+        )
+        .join(PatientLink, PatientLink.patient_id == User.id)
+        .outerjoin(
+            PatientStats,
+            (PatientStats.therapist_id == PatientLink.therapist_id)
+            & (PatientStats.patient_id == PatientLink.patient_id),
+        )
+        .where(
+            PatientLink.therapist_id == therapist_id,
+            PatientLink.link_status == LinkStatus.ACCEPTED,
+        )
+    )
+
+    if min_risk_level == "high":
+        patients_stmt = patients_stmt.where(high > 0)
+    elif min_risk_level == "medium":
+        patients_stmt = patients_stmt.where(medium + high > 0)
+    elif min_risk_level == "low":
+        patients_stmt = patients_stmt.where(low + medium + high > 0)
+
+    order_by = {
+        "name": [User.full_name],
+        "risk": [high.desc(), medium.desc(), low.desc()],
+        "last_alert": [PatientStats.last_alert_at.desc().nulls_last()],
+        "last_report": [PatientStats.last_report_at.desc().nulls_last()],
+        "last_message": [PatientStats.last_message_at.desc().nulls_last()],
+    }[sort]
+    patients_stmt = patients_stmt.order_by(*order_by, User.id)
+
+    patients = (await session.execute(patients_stmt)).all()
+    if not patients:
+        return []
+
+    alert_rank = (
+        func.row_number()
+        .over(partition_by=Alert.patient_id, order_by=Alert.last_seen_at.desc())
+        .label("rank")
+    )
+    ranked_alerts = (
+        select(Alert.id, alert_rank).where(Alert.therapist_id == therapist_id)
+    ).subquery()
+    latest_alerts_stmt = select(Alert).join(
+        ranked_alerts,
+        (ranked_alerts.c.id == Alert.id) & (ranked_alerts.c.rank == 1),
+    )
+    latest_alerts = {
+        alert.patient_id: alert
+        for alert in (await session.execute(latest_alerts_stmt)).scalars()
+    }
+
+    report_rank = (
+        func.row_number()
+        .over(partition_by=Report.patient_id, order_by=Report.created_at.desc())
+        .label("rank")
+    )
+    ranked_reports = (
+        select(
+            Report.id,
+            Report.patient_id,
+            Report.created_at,
+            Report.excerpt,
+            report_rank,
+        ).where(Report.therapist_id == therapist_id)
+    ).subquery()
+    latest_reports_stmt = select(
+        ranked_reports.c.patient_id,
+        ranked_reports.c.id,
+        ranked_reports.c.created_at,
+        ranked_reports.c.excerpt,
+    ).where(ranked_reports.c.rank == 1)
+    latest_reports = {
+        patient_id: ReportSummary(id=report_id, created_at=created_at, excerpt=excerpt)
+        for patient_id, report_id, created_at, excerpt in await session.execute(
+            latest_reports_stmt
+        )
+    }
+
+    dashboard = []
+    for (
+        patient_id,
+        email,
+        full_name,
+        phone_number,
+        low_alerts,
+        medium_alerts,
+        high_alerts,
+        last_alert_at,
+        last_report_at,
+        message_count,
+        last_message_at,
+    ) in patients:
+        alert = latest_alerts.get(patient_id)
+        dashboard.append(
+            DashboardPatient(
+                id=patient_id,
+                email=email,
+                full_name=full_name,
+                phone_number=phone_number,
+                alert_counts={
+                    "low": low_alerts,
+                    "medium": medium_alerts,
+                    "high": high_alerts,
+                },
+                last_alert_at=last_alert_at,
+                last_report_at=last_report_at,
+                message_count=message_count,
+                last_message_at=last_message_at,
+                latest_alert=AlertMessage(
+                    id=alert.id,
+                    therapist_id=alert.therapist_id,
+                    patient_id=alert.patient_id,
+                    patient_name=full_name,
+                    risk_level=alert.risk_level,
+                    cause=alert.cause,
+                    is_provisional=alert.is_provisional,
+                    occurrences=alert.occurrences,
+                    created_at=alert.created_at,
+                    last_seen_at=alert.last_seen_at,
+                )
+                if alert
+                else None,
+                latest_report=latest_reports.get(patient_id),
+            )
+        )
+
+    return dashboard
+
+
+async def export_patient_messages(
+    session: AsyncSession, user_info: TokenData, patient_id: int
+) -> AsyncIterator[bytes]:
+    """
+    The patient's complete chat history as NDJSON chunks, see
+    api.chats.service.export_thread_messages
+    """
+    if user_info.role != Role.THERAPIST:
+        raise PermissionDenied("Only therapists can access patient information")
+
+    access = await assert_therapist_can_access_patient(
+        session, user_info.user_id, patient_id
+    )
+    if access.thread_id is None:
+        raise InvalidRequest("Patient not found")
+
+    return await export_thread_messages(access.thread_id)
+
+
+def subscribe_to_alerts(user_info: TokenData) -> Subscription:
+    """
+    Subscribe to the therapist's new alerts, as they are created.
+    The caller must close the subscription.
+    """
+    if user_info.role != Role.THERAPIST:
+        raise PermissionDenied("Only therapists can access alerts")
+
+    return alert_hub.subscribe(user_info.user_id)
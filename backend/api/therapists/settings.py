@@ -0,0 +1,67 @@
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    # Alert push (GET /therapists/alerts/stream)
+    ALERT_STREAM_BUFFER: int = 100
+    ALERT_STREAM_KEEPALIVE_SECONDS: float = 15
+
+    # A guardian_check alert confirms the patient's provisional alert
+    # (raised by the crisis prefilter) if it is at most this old
+    ALERT_RECONCILE_SECONDS: int = 600
+
+    # Repeats of an alert (same patient and risk level) within this window
+    # update the open alert instead of inserting a new one
+    ALERT_COALESCE_SECONDS: int = 1800
+
+    # Durable outbox the chat streams append alerts to (api.therapists.outbox)
+    ALERT_OUTBOX_PATH: str = "alert_outbox.db"
+    ALERT_OUTBOX_BATCH_SIZE: int = 100
+    ALERT_OUTBOX_POLL_SECONDS: float = 1.0
+    # An entry failing this many times on its own is moved to dead_entries
+    ALERT_OUTBOX_MAX_ATTEMPTS: int = 5
+
+    # Accepted therapist -> patient links with the patient's Backboard ids
+    # (api.therapists.access). The TTL bounds how long a link declined
+    # through another worker process keeps being served
+    ACCESS_CACHE_SIZE: int = 10_000
+    ACCESS_CACHE_TTL_SECONDS: float = 60
+
+    # Patient note uploads (POST /therapists/patients/{id}/notes)
+    NOTE_MAX_FILE_SIZE: int = 5 * 1024 * 1024
+    # Uploaded notes are kept here until their ingestion job has pushed
+    # them to the patient's assistant (api.therapists.ingestion)
+    NOTE_STORAGE_DIR: str = "note_uploads"
+    # Uploads at once per worker process
+    NOTE_INGEST_CONCURRENCY: int = 4
+    # A note failing this many uploads is marked failed
+    NOTE_INGEST_MAX_ATTEMPTS: int = 5
+    NOTE_INGEST_RETRY_SECONDS: float = 5.0
+
+    # Bulk note uploads (POST /therapists/patients/{id}/notes/bulk): files
+    # and zip archives, at most NOTE_BULK_MAX_FILES notes per request, each
+    # at most NOTE_MAX_FILE_SIZE
+    NOTE_BULK_MAX_FILES: int = 100
+    NOTE_BULK_MAX_ARCHIVE_SIZE: int = 100 * 1024 * 1024
+
+    # Weekly reports generated ahead of time (api.therapists.scheduler):
+    # every night between the start and end hours (local to the timezone,
+    # the window may span midnight), for each linked patient whose latest
+    # report is older than REPORT_SCHEDULE_INTERVAL_DAYS
+    REPORT_SCHEDULE_ENABLED: bool = True
+    REPORT_SCHEDULE_TIMEZONE: str = "UTC"
+    REPORT_SCHEDULE_START_HOUR: int = 2
+    REPORT_SCHEDULE_END_HOUR: int = 5
+    REPORT_SCHEDULE_INTERVAL_DAYS: int = 7
+    # Reports generated at once per worker process
+    REPORT_SCHEDULE_CONCURRENCY: int = 2
+    # Random delay before each report, so LLM calls are spread over the window
+    REPORT_SCHEDULE_JITTER_SECONDS: float = 30
+
+    # Full-text search (GET /therapists/search): text indexed per note
+    SEARCH_NOTE_MAX_CHARS: int = 200_000
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+
+settings = Settings()
@@ -0,0 +1,237 @@
+"""
+Per-patient activity counters (patient_stats).
+
+Alert and report counters are bumped in the same transaction as the alert
+or report they count, so they can't drift from the source tables; they can
+still be recomputed from them at any time. Message counters come from the
+chat threads, which live in Backboard: they are only recomputed with
+--messages (one get_thread call per patient).
+
+    python -m api.therapists.stats rebuild
+    python -m api.therapists.stats rebuild --messages
+"""
+
+import argparse
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import Connection, func, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.core.metrics import metrics
+from api.therapists.models import PatientStats
+
+ALERT_COLUMNS = {
+    "low": PatientStats.low_alerts,
+    "medium": PatientStats.medium_alerts,
+    "high": PatientStats.high_alerts,
+}
+
+
+def _latest(column, excluded):
+    """
+    Keep the most recent of the stored and the new timestamp
+    (max() of SQLite returns NULL if any argument is NULL)
+    """
+    return func.max(func.coalesce(column, excluded), excluded)
+
+
+async def record_alert_stats(
+    session: AsyncSession,
+    therapist_id: int,
+    patient_id: int,
+    seen_at: datetime,
+    added: str | None = None,
+    removed: str | None = None,
+) -> None:
+    """
+    Count an alert of risk level `added` (None if an existing alert was only
+    seen again) and uncount one of level `removed` (a provisional alert
+    confirmed at another level). Levels without a counter are not counted.
+    Does not commit.
+    """
+    if added is not None and added not in ALERT_COLUMNS:
+        metrics.counter("stats.alerts.unknown_level").inc()
+        added = None
+    if removed not in ALERT_COLUMNS:
+        removed = None
+    if added == removed:
+        added = removed = None
+
+    values: dict = {"therapist_id": therapist_id, "patient_id": patient_id}
+    if added is not None:
+        values[ALERT_COLUMNS[added].key] = 1
+    values["last_alert_at"] = seen_at
+
+    stmt = insert(PatientStats).values(**values)
+    updates = {
+        "last_alert_at": _latest(PatientStats.last_alert_at, stmt.excluded.last_alert_at)
+    }
+    if added is not None:
+        column = ALERT_COLUMNS[added]
+        updates[column.key] = column + 1
+    if removed is not None:
+        column = ALERT_COLUMNS[removed]
+        updates[column.key] = func.max(column - 1, 0)
+
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PatientStats.therapist_id, PatientStats.patient_id],
+            set_=updates,
+        )
+    )
+
+
+async def record_report_stats(
+    session: AsyncSession, therapist_id: int, patient_id: int, created_at: datetime
+) -> None:
+    """
+    Does not commit
+    """
+    stmt = insert(PatientStats).values(
+        therapist_id=therapist_id, patient_id=patient_id, last_report_at=created_at
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PatientStats.therapist_id, PatientStats.patient_id],
+            set_={
+                "last_report_at": _latest(
+                    PatientStats.last_report_at, stmt.excluded.last_report_at
+                )
+            },
+        )
+    )
+
+
+async def record_message_stats(
+    session: AsyncSession, therapist_id: int, patient_id: int, sent_at: datetime
+) -> None:
+    """
+    Does not commit
+    """
+    stmt = insert(PatientStats).values(
+        therapist_id=therapist_id,
+        patient_id=patient_id,
+        message_count=1,
+        last_message_at=sent_at,
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[PatientStats.therapist_id, PatientStats.patient_id],
+            set_={
+                "message_count": PatientStats.message_count + 1,
+                "last_message_at": _latest(
+                    PatientStats.last_message_at, stmt.excluded.last_message_at
+                ),
+            },
+        )
+    )
+
+
+# Recompute the alert and report counters from the source tables.
+# Message counters are left as they are.
+REBUILD_STATEMENTS = [
+    """
+    UPDATE patient_stats
+    SET low_alerts = 0, medium_alerts = 0, high_alerts = 0,
+        last_alert_at = NULL, last_report_at = NULL
+    """,
+    """
+    INSERT INTO patient_stats
+        (therapist_id, patient_id, low_alerts, medium_alerts, high_alerts, last_alert_at)
+    SELECT therapist_id, patient_id,
+        SUM(risk_level = 'low'), SUM(risk_level = 'medium'), SUM(risk_level = 'high'),
+        MAX(COALESCE(last_seen_at, created_at))
+    FROM alerts WHERE true
+    GROUP BY therapist_id, patient_id
+    ON CONFLICT (therapist_id, patient_id) DO UPDATE SET
+        low_alerts = excluded.low_alerts,
+        medium_alerts = excluded.medium_alerts,
+        high_alerts = excluded.high_alerts,
+        last_alert_at = excluded.last_alert_at
+    """,
+    """
+    INSERT INTO patient_stats (therapist_id, patient_id, last_report_at)
+    SELECT therapist_id, patient_id, MAX(created_at)
+    FROM reports WHERE true
+    GROUP BY therapist_id, patient_id
+    ON CONFLICT (therapist_id, patient_id) DO UPDATE SET
+        last_report_at = excluded.last_report_at
+    """,
+]
+
+
+def rebuild_stats(conn: Connection) -> None:
+    for statement in REBUILD_STATEMENTS:
+        conn.exec_driver_sql(statement)
+
+
+async def rebuild_message_stats(session: AsyncSession) -> int:
+    """
+    Recount every linked patient's messages from their Backboard thread.
+    Return the number of patients updated. Does not commit.
+    """
+    from api.chats.service import get_thread_messages
+    from api.users.models import LinkStatus, Patient, PatientLink
+
+    stmt = (
+        select(PatientLink.therapist_id, PatientLink.patient_id, Patient.thread_id)
+        .join(Patient, Patient.user_id == PatientLink.patient_id)
+        .where(PatientLink.link_status == LinkStatus.ACCEPTED)
+    )
+    links = (await session.execute(stmt)).all()
+
+    for therapist_id, patient_id, thread_id in links:
+        messages = [
+            m for m in await get_thread_messages(thread_id) if m.role == "user"
+        ]
+        values = {
+            "message_count": len(messages),
+            "last_message_at": max((m.timestamp for m in messages), default=None),
+        }
+        stmt = insert(PatientStats).values(
+            therapist_id=therapist_id, patient_id=patient_id, **values
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[PatientStats.therapist_id, PatientStats.patient_id],
+                set_=values,
+            )
+        )
+
+    return len(links)
+
+
+async def _main(messages: bool) -> None:
+    from api.core.db import sessionmanager
+
+    try:
+        async with sessionmanager.session() as session:
+            connection = await session.connection()
+            await connection.run_sync(rebuild_stats)
+            print("alert and report counters rebuilt")
+
+            if messages:
+                count = await rebuild_message_stats(session)
+                print(f"message counters rebuilt for {count} patients")
+
+            await session.commit()
+    finally:
+        await sessionmanager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument(
+        "--messages",
+        action="store_true",
+        help="also recount messages from the Backboard threads",
+    )
+    args = parser.parse_args()
+    asyncio.run(_main(args.messages))
+
+
+if __name__ == "__main__":
+    main()
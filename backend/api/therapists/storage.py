@@ -0,0 +1,185 @@
+"""
+Local storage of uploaded note files.
+
+Notes are kept under NOTE_STORAGE_DIR, one directory per note so the
+document keeps its name in Backboard, until their ingestion job has
+uploaded them (api.therapists.ingestion). Files are hashed (sha256) as they
+are stored, so a bulk upload can skip notes the patient's assistant already
+has.
+
+Everything here is blocking file IO: call it through asyncio.to_thread.
+"""
+
+import hashlib
+import html
+import re
+import shutil
+import uuid
+import zipfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO
+
+from api.core.uploads import safe_filename
+from api.therapists.settings import settings
+
+CHUNK_SIZE = 64 * 1024
+
+ARCHIVE_SUFFIXES = (".zip",)
+
+# Notes whose text can be read without a document parser (others are only
+# searchable by file name)
+TEXT_SUFFIXES = (".txt", ".md", ".markdown", ".csv", ".json", ".jsonl")
+MARKUP_SUFFIXES = (".html", ".xml")
+DOCX_SUFFIX = ".docx"
+
+_TAG = re.compile(r"<[^>]+>")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class StoredNote:
+    """
+    A note file of an upload: stored on disk, or rejected with an error
+    """
+
+    file_name: str
+    stored_path: str | None = None
+    content_hash: str | None = None
+    error: str | None = None
+
+
+def _note_path(file_name: str) -> Path:
+    path = Path(settings.NOTE_STORAGE_DIR) / uuid.uuid4().hex / safe_filename(file_name)
+    path.parent.mkdir(parents=True)
+    return path
+
+
+def remove_stored_file(stored_path: str | None) -> None:
+    """
+    Delete a note's local copy with its directory
+    """
+    if stored_path:
+        shutil.rmtree(Path(stored_path).parent, ignore_errors=True)
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_note_file(path: Path, file_name: str) -> StoredNote:
+    """
+    Move an uploaded file into the note storage
+    """
+    content_hash = file_hash(path)
+    stored_path = _note_path(file_name)
+    shutil.move(path, stored_path)
+    return StoredNote(
+        file_name=file_name, stored_path=str(stored_path), content_hash=content_hash
+    )
+
+
+def _copy_limited(source: BinaryIO, file_name: str, max_size: int) -> StoredNote:
+    """
+    Copy an archive member into the note storage, hashing it on the way.
+    Stops as soon as it is larger than max_size (member sizes in the archive
+    directory can't be trusted)
+    """
+    stored_path = _note_path(file_name)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(stored_path, "wb") as target:
+            while chunk := source.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    break
+                digest.update(chunk)
+                target.write(chunk)
+    except BaseException:
+        remove_stored_file(str(stored_path))
+        raise
+
+    if size > max_size:
+        remove_stored_file(str(stored_path))
+        return StoredNote(file_name=file_name, error="File too large")
+    return StoredNote(
+        file_name=file_name, stored_path=str(stored_path), content_hash=digest.hexdigest()
+    )
+
+
+def is_archive(file_name: str) -> bool:
+    return file_name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def extract_archive(
+    path: Path, archive_name: str, max_file_size: int, max_files: int
+) -> list[StoredNote]:
+    """
+    Store the files of a zip archive as notes, one member at a time: the
+    archive is never loaded in memory. Directories, hidden files and
+    macOS resource forks are skipped, members past max_files are rejected
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        return [StoredNote(file_name=archive_name, error="Not a valid zip archive")]
+
+    notes: list[StoredNote] = []
+    with archive:
+        for info in archive.infolist():
+            member = PurePosixPath(info.filename)
+            if info.is_dir() or any(
+                part.startswith(".") or part == "__MACOSX" for part in member.parts
+            ):
+                continue
+
+            file_name = member.name
+            if len(notes) >= max_files:
+                notes.append(StoredNote(file_name=file_name, error="Too many files"))
+            elif info.file_size > max_file_size:
+                notes.append(StoredNote(file_name=file_name, error="File too large"))
+            else:
+                try:
+                    with archive.open(info) as source:
+                        notes.append(_copy_limited(source, file_name, max_file_size))
+                except (
+                    RuntimeError,
+                    NotImplementedError,
+                    zipfile.BadZipFile,
+                    zlib.error,
+                ) as e:
+                    # Encrypted, unsupported compression or corrupted member
+                    notes.append(StoredNote(file_name=file_name, error=str(e)))
+
+    return notes
+
+
+def _strip_markup(markup: str) -> str:
+    return _WHITESPACE.sub(" ", html.unescape(_TAG.sub(" ", markup))).strip()
+
+
+def extract_text(path: Path, max_chars: int) -> str:
+    """
+    Text of a note file for the search index, at most max_chars.
+    Empty for formats it can't read (PDFs, images...)
+    """
+    suffix = path.suffix.lower()
+    try:
+        if suffix in TEXT_SUFFIXES or suffix in MARKUP_SUFFIXES:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                content = f.read(max_chars)
+            return _strip_markup(content) if suffix in MARKUP_SUFFIXES else content
+
+        if suffix == DOCX_SUFFIX:
+            with zipfile.ZipFile(path) as docx, docx.open("word/document.xml") as f:
+                xml = f.read(max_chars * 10).decode("utf-8", errors="replace")
+            return _strip_markup(xml)[:max_chars]
+    except (OSError, KeyError, zipfile.BadZipFile, zlib.error):
+        pass
+    return ""
@@ -2,7 +2,7 @@ from datetime import datetime, timezone
 from enum import Enum
 
 from pydantic import BaseModel, EmailStr
-from sqlalchemy import DateTime, ForeignKey, String, UniqueConstraint
+from sqlalchemy import DateTime, ForeignKey, Index, String, UniqueConstraint
 from sqlalchemy import Enum as SAEnum
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -42,23 +42,33 @@ class User(Base):
         default=lambda: datetime.now(timezone.utc),
     )
 
+    # Access tokens issued before this are rejected (set when the user's
+    # refresh tokens are revoked)
+    tokens_valid_after: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True)
+    )
+
+    # Relationships are only loaded when asked for (selectinload), never
+    # implicitly with every user row
     therapist_links: Mapped[list["PatientLink"]] = relationship(
         foreign_keys="PatientLink.patient_id",
         back_populates="therapist",
+        lazy="raise",
     )
 
     patient_links: Mapped[list["PatientLink"]] = relationship(
         foreign_keys="PatientLink.therapist_id",
         back_populates="patient",
+        lazy="raise",
     )
 
     patient: Mapped["Patient"] = relationship(
         foreign_keys="Patient.user_id",
-        lazy="selectin",
+        lazy="raise",
     )
-    reports: Mapped["Report"] = relationship(
+    reports: Mapped[list["Report"]] = relationship(
         foreign_keys="Report.therapist_id",
-        lazy="selectin",
+        lazy="raise",
     )
 
 
@@ -86,6 +96,7 @@ class Patient(Base):
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"),
         nullable=False,
+        index=True,
     )
 
     assistant_id: Mapped[str] = mapped_column(nullable=False)
@@ -103,6 +114,7 @@ class PatientLink(Base):
     __tablename__ = "patient_links"
     __table_args__ = (
         UniqueConstraint("patient_id", "therapist_id", name="uq_patient_therapist"),
+        Index("ix_patient_links_therapist_status", "therapist_id", "link_status"),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -126,7 +138,7 @@ class PatientLink(Base):
         "User",
         foreign_keys=[patient_id],
         back_populates="patient_links",
-        lazy="selectin",
+        lazy="raise",
         overlaps="therapist_links",
     )
 
@@ -134,7 +146,7 @@ class PatientLink(Base):
         "User",
         foreign_keys=[therapist_id],
         back_populates="therapist_links",
-        lazy="selectin",
+        lazy="raise",
         overlaps="patient_links",
     )
 
@@ -1,6 +1,10 @@
+from typing import Callable
+
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
+from api.core.versions import bump_version, patients_key
 from api.security.models import TokenData
 from api.users.models import (
     FriendRequest,
@@ -26,6 +30,22 @@ class InvalidRequest(Exception):
         super().__init__(*args)
 
 
+# Called with (therapist_id, patient_id) after a link's status changed, so
+# caches of accepted links can drop the pair
+LinkChangeHook = Callable[[int, int], None]
+_link_change_hooks: list[LinkChangeHook] = []
+
+
+def on_link_change(hook: LinkChangeHook) -> LinkChangeHook:
+    _link_change_hooks.append(hook)
+    return hook
+
+
+def _link_changed(therapist_id: int, patient_id: int) -> None:
+    for hook in _link_change_hooks:
+        hook(therapist_id, patient_id)
+
+
 async def send_friend_request(
     session: AsyncSession,
     user_info: TokenData,
@@ -78,7 +98,9 @@ async def accept_friend_request(
         raise InvalidRequest("Invalid friend request")
 
     link.link_status = LinkStatus.ACCEPTED
+    await bump_version(session, patients_key(therapist_id))
     await session.commit()
+    _link_changed(therapist_id, user_info.user_id)
 
 
 async def decline_friend_request(
@@ -100,7 +122,9 @@ async def decline_friend_request(
         raise InvalidRequest("Invalid friend request")
 
     link.link_status = LinkStatus.DENIED
+    await bump_version(session, patients_key(therapist_id))
     await session.commit()
+    _link_changed(therapist_id, user_info.user_id)
 
 
 async def get_all_friend_requests(
@@ -111,12 +135,18 @@ async def get_all_friend_requests(
     match user_info.role:
         case Role.PATIENT:
             field = "patient_id"
+            friend = PatientLink.therapist
         case Role.THERAPIST:
             field = "therapist_id"
+            friend = PatientLink.patient
         case _:
             raise PermissionDenied("Invalid role")
 
-    stmt = select(PatientLink).where(getattr(PatientLink, field) == user_info.user_id)
+    stmt = (
+        select(PatientLink)
+        .where(getattr(PatientLink, field) == user_info.user_id)
+        .options(selectinload(friend))
+    )
 
     if status is not None:
         try:
@@ -0,0 +1,160 @@
+"""
+Benchmark of the therapist patient listing endpoints' service functions.
+
+Seeds a throwaway SQLite database with one therapist linked to --links
+accepted patients (plus pending and denied links), then times
+list_patients and get_patient and counts their SQL statements:
+
+    python -m benchmarks.therapist_patients --links 5000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+# Importing the services reads the Backboard key, no request is sent here
+os.environ.setdefault("BACKBOARD_API_KEY", "benchmark")
+
+from sqlalchemy import event, insert  # noqa: E402
+
+from api.core import db  # noqa: E402
+from api.core.migrations import run_migrations  # noqa: E402
+from api.security.models import TokenData  # noqa: E402
+from api.therapists.access import access_cache  # noqa: E402
+from api.therapists.service import get_patient, list_patients  # noqa: E402
+from api.users.models import LinkStatus, Patient, PatientLink, Role, User  # noqa: E402
+
+THERAPIST_ID = 1
+
+
+async def seed(manager: db.DatabaseSessionManager, links: int, others: int) -> None:
+    patients = links + 2 * others
+    async with manager.session() as session:
+        await session.execute(
+            insert(User),
+            [
+                {
+                    "id": THERAPIST_ID,
+                    "email": "therapist@example.com",
+                    "role": Role.THERAPIST,
+                    "full_name": "Therapist",
+                    "phone_number": "0",
+                    "hashed_pw": "x",
+                }
+            ]
+            + [
+                {
+                    "id": i,
+                    "email": f"patient{i}@example.com",
+                    "role": Role.PATIENT,
+                    "full_name": f"Patient {i}",
+                    "phone_number": str(i),
+                    "hashed_pw": "x",
+                }
+                for i in range(2, patients + 2)
+            ],
+        )
+        await session.execute(
+            insert(Patient),
+            [
+                {
+                    "user_id": i,
+                    "assistant_id": f"a{i}",
+                    "thread_id": f"t{i}",
+                    "report_thread_id": f"r{i}",
+                }
+                for i in range(2, patients + 2)
+            ],
+        )
+
+        def status(i: int) -> LinkStatus:
+            if i < links + 2:
+                return LinkStatus.ACCEPTED
+            if i < links + others + 2:
+                return LinkStatus.PENDING
+            return LinkStatus.DENIED
+
+        await session.execute(
+            insert(PatientLink),
+            [
+                {"patient_id": i, "therapist_id": THERAPIST_ID, "link_status": status(i)}
+                for i in range(2, patients + 2)
+            ],
+        )
+        await session.commit()
+
+
+async def measure(manager, rounds: int, call) -> tuple[float, float, int, int]:
+    """
+    Return (median ms, max ms, statements per call, result size)
+    """
+    statements = []
+
+    def count(*args) -> None:
+        statements.append(args[2])
+
+    event.listen(manager._engine.sync_engine, "before_cursor_execute", count)
+    samples = []
+    size = 0
+    try:
+        for i in range(rounds):
+            access_cache.clear()
+            statements.clear()
+            async with manager.session() as session:
+                start = time.perf_counter()
+                result = await call(session, i)
+                samples.append((time.perf_counter() - start) * 1000)
+            size = len(result) if isinstance(result, list) else 1
+    finally:
+        event.remove(manager._engine.sync_engine, "before_cursor_execute", count)
+
+    return statistics.median(samples), max(samples), len(statements), size
+
+
+async def run(links: int, others: int, rounds: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = db.DatabaseSessionManager()
+        manager.init(f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}")
+        await run_migrations(manager._engine)  # type: ignore
+        await seed(manager, links, others)
+
+        therapist = TokenData(
+            user_id=THERAPIST_ID, email="therapist@example.com", role=Role.THERAPIST
+        )
+
+        results = {
+            "list_patients": await measure(
+                manager, rounds, lambda s, i: list_patients(s, therapist)
+            ),
+            "get_patient": await measure(
+                manager,
+                rounds,
+                lambda s, i: get_patient(s, therapist, 2 + (i * 7919) % links),
+            ),
+        }
+
+        print(f"{links} accepted links, {others} pending, {others} denied")
+        for name, (median_ms, max_ms, statements, size) in results.items():
+            print(
+                f"{name:<14} median {median_ms:8.2f}ms  max {max_ms:8.2f}ms  "
+                f"{statements} statements  {size} rows"
+            )
+
+        await manager.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--links", type=int, default=5000)
+    parser.add_argument("--others", type=int, default=500, help="pending and denied links each")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.links, args.others, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+from pathlib import Path
+
+# The app reads prompts/ and knowledge_docs/ relative to the backend directory
+os.chdir(Path(__file__).resolve().parents[1])
+os.environ.setdefault("BACKBOARD_API_KEY", "test")
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from api.core.db import sessionmanager  # noqa: E402
+from api.core.migrations import run_migrations  # noqa: E402
+from api.security.hashing import password_hash  # noqa: E402
+from api.therapists.outbox import alert_outbox  # noqa: E402
+from api.users.models import LinkStatus, Patient, PatientLink, Role, User  # noqa: E402
+
+PASSWORD = "pw"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(tmp_path):
+    """
+    A migrated database of its own for the test
+    """
+    sessionmanager.init(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    await run_migrations(sessionmanager._engine)  # type: ignore
+    yield sessionmanager
+    await sessionmanager.close()
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    alert_outbox.path = str(tmp_path / "alert_outbox.db")
+    yield alert_outbox
+    alert_outbox._close()
+
+
+@pytest.fixture
+async def users(db):
+    """
+    A patient (id 1) linked to a therapist (id 2)
+    """
+    hashed_pw = password_hash.hash(PASSWORD)
+    async with db.session() as session:
+        session.add_all(
+            [
+                User(
+                    email="p@example.com",
+                    role=Role.PATIENT,
+                    full_name="P",
+                    phone_number="1",
+                    hashed_pw=hashed_pw,
+                ),
+                User(
+                    email="t@example.com",
+                    role=Role.THERAPIST,
+                    full_name="T",
+                    phone_number="2",
+                    hashed_pw=hashed_pw,
+                ),
+            ]
+        )
+        await session.flush()
+        session.add_all(
+            [
+                Patient(
+                    user_id=1,
+                    assistant_id="asst",
+                    thread_id="thread",
+                    report_thread_id="report-thread",
+                ),
+                PatientLink(
+                    patient_id=1, therapist_id=2, link_status=LinkStatus.ACCEPTED
+                ),
+            ]
+        )
+        await session.commit()
+    return {"patient_id": 1, "therapist_id": 2}
+
+
+class QueryCounter:
+    """
+    Counts the statements sent to the database
+    """
+
+    def __init__(self, engine):
+        self.engine = engine.sync_engine
+        self.statements: list[str] = []
+
+    def _before(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._before)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@pytest.fixture
+def queries(db):
+    return lambda: QueryCounter(db._engine)
@@ -0,0 +1,130 @@
+import pytest
+from sqlalchemy import select
+
+from api.chats.tools import ToolContext, _guardian_check_handler
+from api.therapists.alerts import apply_alert
+from api.therapists.models import Alert, PatientStats
+
+pytestmark = pytest.mark.anyio
+
+
+async def _alerts(db) -> list[Alert]:
+    async with db.session() as session:
+        return list((await session.execute(select(Alert))).scalars())
+
+
+async def _stats(db) -> PatientStats:
+    async with db.session() as session:
+        return (await session.execute(select(PatientStats))).scalar_one()
+
+
+async def test_guardian_check_maps_unknown_level_to_high(db, outbox, users):
+    context = ToolContext(
+        therapist_id=users["therapist_id"], patient_id=users["patient_id"]
+    )
+    result = await _guardian_check_handler(
+        context, {"risk_level": "critical", "cause": "Patient wants to end it"}
+    )
+    assert result["alert"]["risk_level"] == "high"
+
+    assert await outbox.drain() == 1
+    [alert] = await _alerts(db)
+    assert alert.risk_level == "high"
+    assert (await _stats(db)).high_alerts == 1
+
+
+async def test_drain_applies_alert_with_unknown_level(db, outbox, users):
+    await outbox.append(
+        therapist_id=users["therapist_id"],
+        patient_id=users["patient_id"],
+        risk_level="critical",
+        cause="Out of enum",
+    )
+
+    assert await outbox.drain() == 1
+    assert outbox._read(10) == []
+    dead = outbox._connect().execute("SELECT COUNT(*) FROM dead_entries").fetchone()
+    assert dead == (0,)
+
+    [alert] = await _alerts(db)
+    assert alert.risk_level == "critical"
+    stats = await _stats(db)
+    assert (stats.low_alerts, stats.medium_alerts, stats.high_alerts) == (0, 0, 0)
+    assert stats.last_alert_at is not None
+
+
+async def test_confirmation_does_not_lower_provisional_level(db, users):
+    async with db.session() as session:
+        await apply_alert(
+            session,
+            therapist_id=users["therapist_id"],
+            patient_id=users["patient_id"],
+            risk_level="high",
+            cause='Crisis language detected (pending model review): "end it all"',
+            provisional=True,
+        )
+        await apply_alert(
+            session,
+            therapist_id=users["therapist_id"],
+            patient_id=users["patient_id"],
+            risk_level="medium",
+            cause="Patient feels overwhelmed",
+        )
+        await session.commit()
+
+    [alert] = await _alerts(db)
+    assert alert.risk_level == "high"
+    assert not alert.is_provisional
+    assert "Patient feels overwhelmed" in alert.cause
+    assert "end it all" in alert.cause
+    stats = await _stats(db)
+    assert (stats.medium_alerts, stats.high_alerts) == (0, 1)
+
+
+async def _message(session, users, levels: tuple[str, str], model_cause: str) -> None:
+    # A message tripping the crisis prefilter, then the model's guardian_check
+    prefilter_level, model_level = levels
+    await apply_alert(
+        session,
+        therapist_id=users["therapist_id"],
+        patient_id=users["patient_id"],
+        risk_level=prefilter_level,
+        cause='Crisis language detected (pending model review): "end it all"',
+        provisional=True,
+    )
+    await apply_alert(
+        session,
+        therapist_id=users["therapist_id"],
+        patient_id=users["patient_id"],
+        risk_level=model_level,
+        cause=model_cause,
+    )
+
+
+async def test_confirmation_takes_over_hit_coalesced_into_open_alert(db, users):
+    async with db.session() as session:
+        await _message(session, users, ("high", "high"), "First message")
+        await _message(session, users, ("high", "high"), "Second message")
+        await session.commit()
+
+    [alert] = await _alerts(db)
+    assert alert.risk_level == "high"
+    assert alert.occurrences == 2
+    assert alert.cause == "Second message"
+    assert not alert.is_provisional
+    assert alert.unconfirmed_at is None
+    assert (await _stats(db)).high_alerts == 1
+
+
+async def test_escalation_moves_coalesced_hit_to_new_alert(db, users):
+    async with db.session() as session:
+        await _message(session, users, ("medium", "medium"), "First message")
+        await _message(session, users, ("medium", "high"), "Escalated")
+        await session.commit()
+
+    medium, high = sorted(await _alerts(db), key=lambda alert: alert.id)
+    assert (medium.risk_level, medium.occurrences) == ("medium", 1)
+    assert medium.unconfirmed_at is None
+    assert (high.risk_level, high.occurrences, high.cause) == ("high", 1, "Escalated")
+    stats = await _stats(db)
+    assert (stats.medium_alerts, stats.high_alerts) == (1, 1)
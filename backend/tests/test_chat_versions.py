@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from api.chats import service
+from api.core.versions import ResourceVersion, messages_key
+from api.therapists.models import PatientStats
+from api.security.models import TokenData
+from api.users.models import Role
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeClient:
+    def __init__(self, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def add_message(self, **kwargs):
+        async def stream():
+            yield {"type": "content_streaming", "content": "Hello"}
+            yield {"type": "content_streaming", "content": " there"}
+            yield {"type": "message_complete"}
+
+        return stream()
+
+
+async def _version(db, key: str) -> int:
+    async with db.session() as session:
+        row = await session.get(ResourceVersion, key)
+        return row.version if row else 0
+
+
+async def _background_writes() -> None:
+    await asyncio.gather(*service._background_tasks)
+
+
+async def test_history_version_bumped_when_stream_starts(db, users, monkeypatch):
+    monkeypatch.setattr(service, "BackboardClient", FakeClient)
+    patient_id = users["patient_id"]
+    user_info = TokenData(
+        email="p@example.com", user_id=patient_id, role=Role.PATIENT, thread_id="thread"
+    )
+    key = messages_key(patient_id)
+
+    async def commit():
+        raise AssertionError("the stream must not commit")
+
+    async with db.session() as session:
+        monkeypatch.setattr(session, "commit", commit)
+        chunks = service.stream_message(session, user_info, "hi")
+        assert await anext(chunks) == {"type": "content", "content": "Hello"}
+        # Mid-stream, the stored user message already changed the history
+        await _background_writes()
+        assert await _version(db, key) == 1
+
+        assert [chunk async for chunk in chunks] == [
+            {"type": "content", "content": " there"}
+        ]
+    await _background_writes()
+    assert await _version(db, key) == 2
+
+
+class FailingClient(FakeClient):
+    async def add_message(self, **kwargs):
+        async def stream():
+            yield {"type": "content_streaming", "content": "Hello"}
+            raise RuntimeError("connection reset")
+
+        return stream()
+
+
+async def test_message_counted_when_stream_fails(db, users, monkeypatch):
+    monkeypatch.setattr(service, "BackboardClient", FailingClient)
+    user_info = TokenData(
+        email="p@example.com",
+        user_id=users["patient_id"],
+        role=Role.PATIENT,
+        thread_id="thread",
+    )
+
+    async with db.session() as session:
+        with pytest.raises(RuntimeError):
+            async for _ in service.stream_message(session, user_info, "hi"):
+                pass
+    await _background_writes()
+
+    async with db.session() as session:
+        stats = await session.get(
+            PatientStats, (users["therapist_id"], users["patient_id"])
+        )
+    assert stats.message_count == 1
+    assert stats.last_message_at is not None
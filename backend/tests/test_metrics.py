@@ -0,0 +1,30 @@
+import httpx
+import pytest
+
+from api.core.settings import settings
+from api.main import app
+
+pytestmark = pytest.mark.anyio
+
+
+async def _get_metrics(host: str, headers: dict | None = None) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app, client=(host, 1234))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/metrics", headers=headers)
+
+
+async def test_metrics_denied_without_token(db, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+    assert (await _get_metrics("203.0.113.7")).status_code == 403
+    assert (await _get_metrics("127.0.0.1")).status_code == 403
+
+
+async def test_metrics_token(db, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "s3cret")
+    assert (await _get_metrics("127.0.0.1")).status_code == 403
+    wrong = {"Authorization": "Bearer nope"}
+    assert (await _get_metrics("203.0.113.7", wrong)).status_code == 403
+    right = {"Authorization": "Bearer s3cret"}
+    response = await _get_metrics("203.0.113.7", right)
+    assert response.status_code == 200
+    assert "jobs" in response.json()
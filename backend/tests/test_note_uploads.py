@@ -0,0 +1,54 @@
+import httpx
+import pytest
+
+from api.main import app
+from api.security.service import create_access_token
+from api.therapists.settings import settings
+
+pytestmark = pytest.mark.anyio
+
+
+async def _upload_bulk(users, files: list[tuple[str, bytes]]) -> httpx.Response:
+    token = create_access_token(
+        {
+            "email": "t@example.com",
+            "user_id": users["therapist_id"],
+            "role": "therapist",
+            "thread_id": None,
+        }
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(
+            f"/therapists/patients/{users['patient_id']}/notes/bulk",
+            files=[("files", file) for file in files],
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+
+@pytest.fixture
+def note_storage(tmp_path, monkeypatch):
+    storage = tmp_path / "notes"
+    storage.mkdir()
+    monkeypatch.setattr(settings, "NOTE_STORAGE_DIR", str(storage))
+    monkeypatch.setattr(settings, "NOTE_MAX_FILE_SIZE", 1024)
+    monkeypatch.setattr(settings, "NOTE_BULK_MAX_ARCHIVE_SIZE", 1024 * 1024)
+    return storage
+
+
+async def test_bulk_note_over_file_limit_rejected_while_streaming(
+    db, users, note_storage
+):
+    response = await _upload_bulk(
+        users, [("small.txt", b"ok"), ("big.txt", b"x" * 4096)]
+    )
+    assert response.status_code == 413
+    assert response.json()["detail"].startswith("File too large")
+    assert list(note_storage.iterdir()) == []
+
+
+async def test_bulk_archive_held_to_archive_limit(db, users, note_storage):
+    response = await _upload_bulk(users, [("notes.zip", b"x" * 4096)])
+    assert response.status_code == 202
+    [result] = response.json()
+    assert result["error"] == "Not a valid zip archive"
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from api.therapists.models import Alert
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_bad_entry_does_not_hold_back_later_ones(db, outbox, users):
+    # Missing its cause: applying it fails every time
+    bad = {"therapist_id": users["therapist_id"], "patient_id": users["patient_id"]}
+    await outbox._call(outbox._append, json.dumps(bad))
+    await outbox.append(
+        therapist_id=users["therapist_id"],
+        patient_id=users["patient_id"],
+        risk_level="high",
+        cause="Patient wants to end it",
+    )
+
+    assert await outbox.drain() == 2
+
+    async with db.session() as session:
+        [alert] = (await session.execute(select(Alert))).scalars()
+    assert alert.cause == "Patient wants to end it"
+
+    # The bad entry waits behind, with its failed attempt counted
+    [(entry_id, payload)] = outbox._read(10)
+    assert entry_id > 2 and json.loads(payload) == bad
+    conn = outbox._connect()
+    assert conn.execute("SELECT attempts FROM entries").fetchone() == (1,)
+
+    for _ in range(outbox.max_attempts - 1):
+        with pytest.raises(KeyError):
+            await outbox.drain()
+    assert outbox._read(10) == []
+    assert conn.execute("SELECT COUNT(*) FROM dead_entries").fetchone() == (1,)
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from api.security.models import RefreshToken
+from api.security.service import (
+    create_access_token,
+    create_refresh_token,
+    get_token_data,
+    refresh_access_token,
+)
+from api.security.token_cache import token_cache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_reused_refresh_token_revokes_access_tokens(db, users):
+    therapist_id = users["therapist_id"]
+    claims = {
+        "email": "t@example.com",
+        "user_id": therapist_id,
+        "role": "therapist",
+        "thread_id": None,
+    }
+    access_token = create_access_token(claims)
+    assert (await get_token_data(access_token)).user_id == therapist_id
+    assert token_cache.get(access_token) is not None
+
+    async with db.session() as session:
+        refresh_token = await create_refresh_token(session, therapist_id)
+        await refresh_access_token(session, refresh_token)
+
+        # The rotated token is presented again
+        with pytest.raises(HTTPException):
+            await refresh_access_token(session, refresh_token)
+
+    assert token_cache.get(access_token) is None
+    with pytest.raises(HTTPException) as exc:
+        await get_token_data(access_token)
+    assert exc.value.status_code == 401
+
+    # Logging in again issues tokens that are accepted
+    assert (await get_token_data(create_access_token(claims))).user_id == therapist_id
+
+
+async def test_expired_and_old_revoked_tokens_are_pruned(db, users):
+    therapist_id = users["therapist_id"]
+    now = datetime.now(timezone.utc)
+    async with db.session() as session:
+        session.add_all(
+            [
+                RefreshToken(
+                    user_id=therapist_id,
+                    token_hash="expired",
+                    expires_at=now - timedelta(days=1),
+                ),
+                RefreshToken(
+                    user_id=therapist_id,
+                    token_hash="revoked-long-ago",
+                    expires_at=now + timedelta(days=1),
+                    revoked_at=now - timedelta(days=30),
+                ),
+                RefreshToken(
+                    user_id=therapist_id,
+                    token_hash="just-rotated",
+                    expires_at=now + timedelta(days=1),
+                    revoked_at=now,
+                ),
+            ]
+        )
+        await session.commit()
+
+        await create_refresh_token(session, therapist_id)
+
+        hashes = set(
+            (await session.execute(select(RefreshToken.token_hash))).scalars()
+        )
+    # The recently revoked token is kept for reuse detection
+    assert "just-rotated" in hashes
+    assert not hashes & {"expired", "revoked-long-ago"}
+    assert len(hashes) == 2
@@ -0,0 +1,46 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from api.core.jobs import Job, jobs
+from api.therapists.models import ScheduledRun
+from api.therapists.scheduler import REPORT_JOB, ReportScheduler
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_failed_run_leaves_the_night_unclaimed(db, users, monkeypatch):
+    scheduler = ReportScheduler(
+        tz="UTC", start_hour=2, end_hour=5, interval_days=7, jitter_seconds=0
+    )
+    run_on = date(2026, 10, 19)
+    deadline = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    enqueue = jobs.enqueue
+    calls = 0
+
+    async def enqueue_failing_once(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("database is locked")
+        await enqueue(*args, **kwargs)
+
+    monkeypatch.setattr(jobs, "enqueue", enqueue_failing_once)
+
+    with pytest.raises(RuntimeError):
+        await scheduler.run(run_on, deadline)
+    async with db.session() as session:
+        assert (await session.execute(select(ScheduledRun))).first() is None
+
+    assert await scheduler.run(run_on, deadline) == 1
+    assert await scheduler.run(run_on, deadline) is None
+
+    async with db.session() as session:
+        queued = (await session.execute(select(Job))).scalars().all()
+        runs = (await session.execute(select(ScheduledRun))).scalars().all()
+    assert [(job.kind, job.payload["patient_id"]) for job in queued] == [
+        (REPORT_JOB, users["patient_id"])
+    ]
+    assert [run.run_on for run in runs] == [run_on]
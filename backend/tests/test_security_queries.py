@@ -0,0 +1,74 @@
+"""
+Statements sent to the database on the auth path
+"""
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from api.main import app
+from api.security.service import (
+    authenticate_user,
+    create_access_token,
+    get_user,
+    signup_user,
+)
+from api.users.models import UserIn
+from tests.conftest import PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_get_user(db, users, queries):
+    async with db.session() as session:
+        with queries() as counter:
+            user = await get_user(session, "p@example.com")
+    assert user is not None and user.thread_id == "thread"
+    assert counter.count == 1
+
+
+async def test_authenticate_user(db, users, queries):
+    async with db.session() as session:
+        with queries() as counter:
+            user = await authenticate_user(session, "t@example.com", PASSWORD)
+    assert user is not None and user.thread_id is None
+    assert counter.count == 1
+
+    async with db.session() as session:
+        with queries() as counter:
+            user = await authenticate_user(session, "t@example.com", "wrong")
+    assert user is None
+    assert counter.count == 1
+
+
+async def test_signup_duplicate_check(db, users, queries):
+    signup = UserIn(
+        email="p@example.com",
+        password=PASSWORD,
+        role="patient",
+        full_name="P",
+        phone_number="1",
+    )
+    async with db.session() as session:
+        with queries() as counter, pytest.raises(HTTPException) as exc:
+            await signup_user(session, signup)
+    assert exc.value.status_code == 409
+    assert counter.count == 1
+
+
+async def test_me(db, users, queries):
+    token = create_access_token(
+        {"email": "t@example.com", "user_id": 2, "role": "therapist", "thread_id": None}
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # The first use of a token checks it against the user's revocations,
+        # the following ones are served from the token cache
+        for expected in (2, 1):
+            with queries() as counter:
+                response = await client.get(
+                    "/auth/me", headers={"Authorization": f"Bearer {token}"}
+                )
+            assert response.status_code == 200
+            assert response.json()["email"] == "t@example.com"
+            assert counter.count == expected
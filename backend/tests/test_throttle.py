@@ -0,0 +1,12 @@
+import pytest
+from pydantic import ValidationError
+
+from api.security.settings import Settings
+
+
+@pytest.mark.parametrize(
+    "name", ["LOGIN_EMAIL_PER_MINUTE", "LOGIN_IP_PER_MINUTE", "LOGIN_EMAIL_BURST"]
+)
+def test_throttle_settings_reject_zero(name):
+    with pytest.raises(ValidationError):
+        Settings(**{name: 0})